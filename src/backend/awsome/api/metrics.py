@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from awsome.utils.metrics_util import metrics
+
+router = APIRouter(tags=["监控指标"])
+
+
+@router.get("/metrics", summary="Prometheus 格式监控指标", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,9 +1,11 @@
 from fastapi import APIRouter
 from awsome.api.health import router as health_router
+from awsome.api.metrics import router as metrics_router
 from awsome.api.v1.chat import router as chat_router
 from awsome.api.v1.knowledge import router as knowledge_router
 from awsome.api.v1.knowledge_file import router as knowledge_file_router
 from awsome.api.v1.model_cfg import router as model_cfg_router
+from awsome.api.v1.usage import router as usage_router
 from awsome.api.v1.voice import router as voice_router
 
 
@@ -13,11 +15,13 @@ v1_router.include_router(chat_router)
 v1_router.include_router(knowledge_router)
 v1_router.include_router(knowledge_file_router)
 v1_router.include_router(voice_router)
+v1_router.include_router(usage_router)
 
 # sys 路由
 sys_router = APIRouter(prefix='/sys')
 sys_router.include_router(model_cfg_router)
 sys_router.include_router(health_router)
+sys_router.include_router(metrics_router)
 
 # 根路由
 root_router = APIRouter(prefix='')
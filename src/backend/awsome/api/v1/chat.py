@@ -1,12 +1,15 @@
 import json
-from fastapi.responses import StreamingResponse
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import APIRouter, HTTPException, Request, Header
 from awsome.models.schemas.response import resp_200, resp_500
 from awsome.models.v1.chat import ChatRequest
 from awsome.utils.logger_util import logger_util
 from awsome.utils.model_factory import ModelFactory
 from awsome.models.v1.chat import ChatCreate, ChatUpdate, ChatMessageSend
+from awsome.services.admission import AdmissionRejected
 from awsome.services.chat import ChatService
+from awsome.services.chat_stream import ChatStreamService
 
 router = APIRouter(tags=["模型会话"])
 
@@ -39,20 +42,38 @@ async def update_conversation(update_data: ChatUpdate):
 
 
 @router.get("/conversations/list")
-async def list_conversations(page: int = 1, size: int = 10):
+async def list_conversations(page: int = 1, size: int = 10, cursor: Optional[str] = None,
+                             with_total: Optional[bool] = None):
     try:
-        return resp_200(await ChatService.list_conversations(page, size))
+        return resp_200(await ChatService.list_conversations(page, size, cursor, with_total))
     except Exception as e:
         logger_util.error(f"list_conversations error: {e}")
         return resp_500(message=str(e))
 
 
 @router.post("/conversations/messages/send", response_class=StreamingResponse)
-async def send_message(message_data: ChatMessageSend):
+async def send_message(message_data: ChatMessageSend, request: Request, last_event_id: Optional[str] = Header(None)):
     try:
-        # 返回StreamingResponse包装的生成器
+        if last_event_id is None and await ChatService.is_model_busy(message_data.conv_id):
+            # 模型繁忙 在开始流式响应前直接返回 429
+            return JSONResponse(status_code=429, content=resp_500(code=429, message="模型繁忙，请稍后重试").dict(),
+                                headers={"Retry-After": "1"})
+        if ChatStreamService.is_enabled():
+            # 可续传对话流 携带 Last-Event-ID 重连时续传原有生成 否则开始新的生成
+            resume = ChatStreamService.parse_last_event_id(last_event_id)
+            if resume is not None:
+                stream_id, last_seq = resume
+                logger_util.debug(f"续传对话流 {stream_id}, 已接收序号: {last_seq}")
+            else:
+                stream_id, last_seq = await ChatStreamService.start(message_data), 0
+            return StreamingResponse(
+                ChatStreamService.follow(stream_id, message_data.conv_id, last_seq),
+                media_type="text/event-stream",
+                headers={"X-Stream-Id": stream_id}
+            )
+        # 返回StreamingResponse包装的生成器 客户端断开时终止模型生成
         return StreamingResponse(
-            ChatService.stream_chat_response(message_data),
+            ChatService.stream_chat_response(message_data, is_disconnected=request.is_disconnected),
             media_type="text/event-stream"  # 设置正确的媒体类型
         )
     except Exception as e:
@@ -99,14 +120,21 @@ async def chat(chat_request: ChatRequest):
         }
 
         if chat_request.stream:
-            # 流式输出
+            # 流式输出 在开始响应前发起请求 未获准入时可直接返回 429
+            response = await client.generate_text(**generate_params)
+
             async def generate():
-                response = await client.generate_text(**generate_params)
-                for chunk in response:
-                    # 直接访问 ChoiceDelta 对象的 content 属性
-                    content = chunk.choices[0].delta.content or ""
-                    if content:
-                        yield json.dumps({"content": content}, ensure_ascii=False) + "\n"
+                try:
+                    async for chunk in response:
+                        if not chunk.choices:
+                            continue
+                        # 直接访问 ChoiceDelta 对象的 content 属性
+                        content = chunk.choices[0].delta.content or ""
+                        if content:
+                            yield json.dumps({"content": content}, ensure_ascii=False) + "\n"
+                finally:
+                    # 客户端断开时关闭上游流(共享流时退订)
+                    await response.close()
 
             return StreamingResponse(generate(), media_type="text/event-stream")
         else:
@@ -115,6 +143,9 @@ async def chat(chat_request: ChatRequest):
             content = response.choices[0].message.content
             return {"content": content}
 
+    except AdmissionRejected as e:
+        return JSONResponse(status_code=429, content=resp_500(code=429, message=str(e)).dict(),
+                            headers={"Retry-After": str(round(e.retry_after))})
     except Exception as e:
         logger_util.warning(f"模型直接对话异常: An error occurred: {str(e)}")
         return HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Query
+
+from awsome.models.schemas.response import resp_200, resp_500
+from awsome.services.usage import UsageService
+from awsome.utils.logger_util import logger_util
+
+router = APIRouter(tags=["用量统计"])
+
+
+@router.get("/usage/top", summary="用量最高的会话或模型")
+async def top_consumers(group_by: str = Query("conversation", description="统计维度 conversation/model"),
+                        days: int = Query(7, description="统计最近天数(含当天)"),
+                        limit: int = Query(10, description="返回数量")):
+    try:
+        return resp_200(await UsageService.top_consumers(group_by, days, limit))
+    except Exception as e:
+        logger_util.error(f"top_consumers error: {e}")
+        return resp_500(message=str(e))
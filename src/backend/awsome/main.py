@@ -12,9 +12,23 @@ from middleware import log_access
 async def _LIFESPAN(app: FastAPI):
     # 初始化数据库
     init_database()
+    # 启动消息延迟写入及用量记录任务
+    from awsome.services.message_writer import message_writer
+    from awsome.services.usage import usage_recorder
+    if message_writer.enabled:
+        message_writer.start()
+    if usage_recorder.enabled:
+        usage_recorder.start()
 
     yield  # yield 前为程序启动前 后为程序关闭后
 
+    # 写入队列中剩余的消息及用量
+    await message_writer.stop()
+    await usage_recorder.stop()
+    # 关闭检索线程池
+    from awsome.services.retriever import RetrieverService
+    RetrieverService.shutdown()
+
 
 
 _EXCEPTION_HANDLERS = {
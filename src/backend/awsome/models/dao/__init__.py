@@ -3,4 +3,5 @@ from .conversation_knowledge_link import ConversationKnowledgeLink  # 先导入
 from .knowledge import Knowledge
 from .conversations import Conversation
 from .messages import Message
+from .usage import TokenUsage, TokenUsageDaily
 
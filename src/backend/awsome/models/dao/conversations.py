@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, Optional, TYPE_CHECKING
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 if TYPE_CHECKING:
     from .messages import Message
     from .conversation_knowledge_link import ConversationKnowledgeLink, ConversationKnowledgeLinkDao
@@ -9,11 +9,13 @@ import uuid
 from sqlalchemy.orm import Mapped, relationship, selectinload
 from sqlmodel import Field, Relationship
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, text, select, func
+from sqlalchemy import Column, String, Text, DateTime, Index, text, select, func, update, and_, or_
 
 from awsome.core.context import async_session_getter
 from awsome.models.dao.base import AwsomeDBModel
 from awsome.models.dao.knowledge import Knowledge
+from awsome.models.schemas.conversation import ConversationConfig, KnowledgeBaseConfig
+from awsome.utils.conversation_cache_util import conversation_cache
 from awsome.utils.logger_util import logger_util
 
 from .conversation_knowledge_link import ConversationKnowledgeLink, ConversationKnowledgeLinkDao
@@ -29,6 +31,9 @@ class ConversationBase(AwsomeDBModel):
     temperature: float = Field(default=0.7, ge=0, le=2, description="生成温度")
     delete: int = Field(default=0, index=True, description="删除标志")
     use_memory: int = Field(default=0, index=True, description="删除标志")
+    summary: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True), description="历史对话滚动摘要")
+    summary_until: Optional[str] = Field(default=None, sa_column=Column(String(36), nullable=True),
+                                         description="滚动摘要覆盖到的最后一条消息ID")
     created_at: datetime = Field(
         sa_column=Column(
             DateTime,
@@ -49,13 +54,18 @@ class ConversationBase(AwsomeDBModel):
 
 
 class Conversation(ConversationBase, table=True):
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # 会话列表按 updated_at/id 倒序分页(游标分页)
+        Index("ix_conversations_delete_updated_at_id", "delete", "updated_at", "id"),
+        {"extend_existing": True}
+    )
     messages: Mapped[List["Message"]] = Relationship(
         back_populates="conversation",
         sa_relationship=relationship(  # 显式使用SQLAlchemy的relationship
             "Message",  # 使用字符串形式指定目标模型
             back_populates="conversation",
-            lazy="selectin",
+            # 长会话消息量大 不随会话加载 需要时通过 selectinload(Conversation.messages) 显式加载
+            lazy="raise",
             cascade="all, delete-orphan"
         )
     )
@@ -91,41 +101,157 @@ class ConversationDao:
             return new_conv
 
     @staticmethod
-    async def get(conv_id: str):
+    async def get(conv_id: str, with_messages: bool = False):
         async with async_session_getter() as session:
             stmt = select(Conversation).where(
                 Conversation.id == conv_id,
                 Conversation.delete == 0
             )
+            if with_messages:
+                stmt = stmt.options(selectinload(Conversation.messages))
             result = await session.execute(stmt)
             return result.scalar_one_or_none()
 
     @staticmethod
-    async def list_with_kb(page: int = 1, page_size: int = 20):
+    async def get_config(conv_id: str) -> Optional[ConversationConfig]:
+        """
+        获取对话轮次所需的会话配置(读穿缓存)，命中时不访问数据库。
+
+        :param conv_id: 会话ID。
+        :return: ConversationConfig，会话不存在返回 None。
+        """
+        cached = await conversation_cache.get(conv_id)
+        if cached is not None:
+            return ConversationConfig(**cached)
+
+        generation = await conversation_cache.get_generation(conv_id)
+        conv = await ConversationDao.one_with_kb(conv_id)
+        if conv is None:
+            return None
+        config = ConversationConfig(
+            id=conv.id,
+            model=conv.model,
+            system_prompt=conv.system_prompt,
+            temperature=conv.temperature,
+            use_memory=conv.use_memory,
+            summary=conv.summary,
+            summary_until=conv.summary_until,
+            knowledge_bases=[
+                KnowledgeBaseConfig(id=kb.id, name=kb.name, collection_name=kb.collection_name,
+                                    index_name=kb.index_name)
+                for kb in conv.knowledge_bases
+            ]
+        )
+        await conversation_cache.set(conv_id, config.dict(), generation)
+        return config
+
+    @staticmethod
+    async def invalidate_config_by_knowledge(kb_id: str):
+        """知识库变更(删除/更新)时清除绑定该知识库的会话配置缓存"""
         async with async_session_getter() as session:
-            offset = (page - 1) * page_size
-            stmt = (
-                select(Conversation)
-                .where(Conversation.delete == 0)
-                .options(
-                    selectinload(Conversation.knowledge_links).selectinload(ConversationKnowledgeLink.knowledge)
-                )
-                .order_by(Conversation.updated_at.desc())
-                .offset(offset)
-                .limit(page_size)
+            stmt = select(ConversationKnowledgeLink.conversation_id).where(
+                ConversationKnowledgeLink.knowledge_base_id == kb_id
             )
             result = await session.execute(stmt)
-            return result.scalars().all()
+            conv_ids = result.scalars().all()
+        await conversation_cache.invalidate(*conv_ids)
 
     @staticmethod
-    async def list(page: int = 1, page_size: int = 20):
+    async def list_summaries(page: int = 1, page_size: int = 20, after: Optional[Tuple[datetime, str]] = None,
+                             with_total: bool = False) -> Tuple[List[Dict], Optional[int], bool]:
+        """
+        分页查询会话列表(投影查询，仅读取列表所需字段)，按 updated_at、id 倒序。
+
+        :param page: 页码，指定 after 时忽略。
+        :param page_size: 每页数量。
+        :param after: 游标分页，上一页最后一条会话的 (updated_at, id)，由索引 (delete, updated_at, id) 定位，不扫描前序页。
+        :param with_total: 是否返回会话总数(作为标量子查询在同一语句中计算)。
+        :return: ([{"id", "title", "model", "updated_at", "knowledge_bases"}], 总数或 None, 是否存在下一页)
+        """
+        columns = [Conversation.id, Conversation.title, Conversation.model, Conversation.updated_at]
+        if with_total:
+            total_query = select(func.count()).select_from(Conversation).where(Conversation.delete == 0)
+            columns.append(total_query.scalar_subquery().label("total"))
+        stmt = (
+            select(*columns)
+            .where(Conversation.delete == 0)
+            .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+            # 多查询一条用于判断是否存在下一页
+            .limit(page_size + 1)
+        )
+        if after is not None:
+            updated_at, conv_id = after
+            stmt = stmt.where(or_(
+                Conversation.updated_at < updated_at,
+                and_(Conversation.updated_at == updated_at, Conversation.id < conv_id)
+            ))
+        else:
+            stmt = stmt.offset((page - 1) * page_size)
         async with async_session_getter() as session:
-            offset = (page - 1) * page_size
-            stmt = select(Conversation).where(
+            result = await session.execute(stmt)
+            conversations = [dict(row) for row in result.mappings().all()]
+            has_more = len(conversations) > page_size
+            conversations = conversations[:page_size]
+            total = None
+            if with_total:
+                total = conversations[0]["total"] if conversations else None
+                for conv in conversations:
+                    conv.pop("total")
+                if total is None:
+                    # 当前页为空时无法从结果行取得总数
+                    total = (await session.execute(total_query)).scalar()
+            kb_map = await ConversationDao._knowledge_bases_of(session, [conv["id"] for conv in conversations])
+        for conv in conversations:
+            conv["knowledge_bases"] = kb_map.get(conv["id"], [])
+        return conversations, total, has_more
+
+    @staticmethod
+    async def get_detail(conv_id: str) -> Optional[Dict]:
+        """
+        查询会话详情(投影查询，不加载消息)。
+
+        :param conv_id: 会话ID。
+        :return: 会话字段及 knowledge_bases，会话不存在返回 None。
+        """
+        async with async_session_getter() as session:
+            stmt = select(
+                Conversation.id, Conversation.title, Conversation.model, Conversation.system_prompt,
+                Conversation.temperature, Conversation.use_memory, Conversation.created_at, Conversation.updated_at
+            ).where(
+                Conversation.id == conv_id,
                 Conversation.delete == 0
-            ).order_by(Conversation.updated_at.desc()).offset(offset).limit(page_size)
+            )
             result = await session.execute(stmt)
-            return result.scalars().all()
+            row = result.mappings().one_or_none()
+            if row is None:
+                return None
+            conversation = dict(row)
+            kb_map = await ConversationDao._knowledge_bases_of(session, [conv_id])
+        conversation["knowledge_bases"] = kb_map.get(conv_id, [])
+        return conversation
+
+    @staticmethod
+    async def _knowledge_bases_of(session, conv_ids: List[str]) -> Dict[str, List[Dict]]:
+        """批量查询会话绑定的未删除知识库，返回 会话ID -> 知识库字段列表"""
+        if not conv_ids:
+            return {}
+        stmt = (
+            select(
+                ConversationKnowledgeLink.conversation_id, Knowledge.id, Knowledge.name, Knowledge.desc,
+                Knowledge.model, Knowledge.collection_name, Knowledge.index_name
+            )
+            .join(Knowledge, Knowledge.id == ConversationKnowledgeLink.knowledge_base_id)
+            .where(
+                ConversationKnowledgeLink.conversation_id.in_(conv_ids),
+                Knowledge.delete == 0
+            )
+        )
+        result = await session.execute(stmt)
+        kb_map: Dict[str, List[Dict]] = {}
+        for row in result.mappings().all():
+            kb = dict(row)
+            kb_map.setdefault(kb.pop("conversation_id"), []).append(kb)
+        return kb_map
 
     @staticmethod
     async def soft_delete(conv_id: str):
@@ -139,6 +265,7 @@ class ConversationDao:
             if conv:
                 conv.delete = 1
                 await session.commit()
+                await conversation_cache.invalidate(conv_id)
                 logger_util.info(f"Soft deleted conversation: {conv_id}")
                 return True
             return False
@@ -178,10 +305,27 @@ class ConversationDao:
                 for kb_id in knowledge_base_ids:
                     await ConversationKnowledgeLinkDao.create(conv_id, kb_id)
 
+            await conversation_cache.invalidate(conv_id)
             logger_util.info(f"Updated conversation: {conv_id}")
 
             return None
 
+    @staticmethod
+    async def update_summary(conv_id: str, summary: Optional[str], summary_until: Optional[str]):
+        """更新滚动摘要，不改变会话的更新时间"""
+        async with async_session_getter() as session:
+            stmt = update(Conversation).where(
+                Conversation.id == conv_id
+            ).values(
+                summary=summary,
+                summary_until=summary_until,
+                updated_at=Conversation.updated_at
+            )
+            await session.execute(stmt)
+            await session.commit()
+        await conversation_cache.invalidate(conv_id)
+        logger_util.info(f"Updated conversation summary: {conv_id}")
+
     @classmethod
     async def one_with_kb(cls, conv_id: str):
         async with async_session_getter() as session:
@@ -198,16 +342,3 @@ class ConversationDao:
             )
             result = await session.execute(stmt)
             return result.scalar_one_or_none()
-
-    @classmethod
-    async def cnt_conversation_total(cls):
-        async with async_session_getter() as session:
-            # 构造查询语句，统计满足条件的记录总数
-            stmt = select(func.count()).select_from(Conversation).where(Conversation.delete == 0)
-
-            # 执行查询并获取结果
-            result = await session.execute(stmt)
-            total_count = result.scalar()  # 获取总数
-
-            logger_util.info(f"Total count of Concersation entries: {total_count}")
-            return total_count
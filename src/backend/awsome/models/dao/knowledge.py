@@ -112,6 +112,27 @@ class KnowledgeDao:
             else:
                 raise HTTPException(status_code=404, detail="Knowledge not found")
 
+    @classmethod
+    async def update_collection_name(cls, kb_id, collection_name):
+        async with async_session_getter() as session:
+            query_stmt = select(Knowledge).where(Knowledge.id == kb_id)
+            update_knowledge = await session.execute(query_stmt)
+            update_knowledge = update_knowledge.scalar_one_or_none()
+            if update_knowledge:
+                update_knowledge.collection_name = collection_name
+                await session.commit()
+                logger_util.info(f"Updated Knowledge {kb_id} collection_name: {collection_name}")
+                return update_knowledge
+            else:
+                raise HTTPException(status_code=404, detail="Knowledge not found")
+
+    @staticmethod
+    def select_collection_name(kb_id: str) -> Optional[str]:
+        """同步查询知识库当前使用的集合名称(供 Celery 任务使用)"""
+        with session_getter() as session:
+            knowledge = session.query(Knowledge).where(Knowledge.id == kb_id, Knowledge.delete == 0).first()
+            return knowledge.collection_name if knowledge else None
+
     @classmethod
     async def select(cls, kb_id=None, page=None, page_size=None):
         async with (async_session_getter() as session):
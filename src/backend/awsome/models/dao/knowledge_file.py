@@ -1,7 +1,7 @@
 import uuid
 from typing import Optional, List
 from awsome.models.dao.base import AwsomeDBModel
-from sqlalchemy import Column, String, INT, select, bindparam, Integer
+from sqlalchemy import Column, String, INT, select, bindparam, Integer, func
 from sqlmodel import Field, DateTime, text
 from awsome.core.context import session_getter, async_session_getter
 from datetime import datetime
@@ -72,6 +72,14 @@ class KnowledgeFileDao:
                 all_knowledge_files = query.all()
             return all_knowledge_files
 
+    @staticmethod
+    async def cnt_pending_by_kb_id(kb_id: str) -> int:
+        """统计知识库中未完成向量化(status=0)的文件数"""
+        async with async_session_getter() as session:
+            stmt = select(func.count()).select_from(KnowledgeFile).where(
+                KnowledgeFile.kb_id == kb_id, KnowledgeFile.status == 0, KnowledgeFile.delete == 0)
+            return (await session.execute(stmt)).scalar()
+
     @staticmethod
     async def delete_by_kb_id(kb_id: str):
         async with async_session_getter() as session:
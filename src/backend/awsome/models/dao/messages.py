@@ -1,19 +1,42 @@
 from __future__ import annotations
+import secrets
+import time
 import uuid
+from typing import List, Dict
 from sqlalchemy.orm import Mapped, relationship
 from sqlmodel import Field, Relationship
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, text, select, update
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, text, select, update, insert
 
 from awsome.core.context import async_session_getter
 from awsome.models.dao.base import AwsomeDBModel
+from awsome.utils.history_cache_util import history_cache
 from awsome.utils.logger_util import logger_util
 
+# 本进程最近分配的消息ID (毫秒时间戳, 毫秒内序号)
+_last_id = (0, 0)
+
+
+def new_message_id() -> str:
+    """
+    生成按创建顺序递增的消息ID(UUIDv7 格式：48位毫秒时间戳 + 12位序号 + 随机数，字符串顺序即创建顺序)。
+    消息时间由数据库生成且精度为秒，同一秒(如同一批次)写入的消息以ID作为排序依据。
+    """
+    global _last_id
+    millis, seq = time.time_ns() // 1_000_000, 0
+    if millis <= _last_id[0]:
+        millis, seq = _last_id[0], _last_id[1] + 1
+        if seq > 0xFFF:
+            millis, seq = millis + 1, 0
+    _last_id = (millis, seq)
+    value = (millis << 80) | (0x7 << 76) | (seq << 64) | (0b10 << 62) | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
 
 class MessageBase(AwsomeDBModel):
     __tablename__ = "messages"
 
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()),
+    id: str = Field(default_factory=new_message_id,
                     primary_key=True,
                     description="消息ID")
     conv_id: str = Field(
@@ -48,6 +71,12 @@ class MessageBase(AwsomeDBModel):
         default=0,
         description="删除标志"
     )
+    truncated: int = Field(
+        default=0,
+        # 服务端默认值 已有表启动时按该默认值补建字段(见 DatabaseClient.create_db_and_tables)
+        sa_column_kwargs={"server_default": text("0")},
+        description="截断标志（客户端断开导致回复未完整生成）"
+    )
 
 
 class Message(MessageBase, table=True):
@@ -63,26 +92,55 @@ class Message(MessageBase, table=True):
 
 class MessageDao:
     @staticmethod
-    async def create_message(conv_id: str, role: str, content: str, source: str):
+    async def create_message(conv_id: str, role: str, content: str, source: str, truncated: int = 0):
         async with async_session_getter() as session:
-            new_msg = Message(conv_id=conv_id, role=role, content=content, source=source)
+            new_msg = Message(conv_id=conv_id, role=role, content=content, source=source, truncated=truncated)
             session.add(new_msg)
             await session.commit()
             await session.refresh(new_msg)
             logger_util.info(f"Created message in conversation: {conv_id}")
-            return new_msg
+        # 同步追加到历史消息缓存
+        await history_cache.append(conv_id, {"id": new_msg.id, "role": role, "content": content})
+        return new_msg
 
 
+    @staticmethod
+    async def create_messages(rows: List[Dict]):
+        """
+        批量写入消息(单个事务，多行 INSERT)，按顺序追加到历史消息缓存。
+
+        :param rows: [{"id", "conv_id", "role", "content", "source", "truncated"}]，id 由调用方生成(见 new_message_id)
+        """
+        if not rows:
+            return
+        async with async_session_getter() as session:
+            await session.execute(insert(Message), rows)
+            await session.commit()
+            logger_util.info(f"Created {len(rows)} messages in batch")
+        conv_rows: Dict[str, List[Dict]] = {}
+        for row in rows:
+            conv_rows.setdefault(row["conv_id"], []).append(
+                {"id": row["id"], "role": row["role"], "content": row["content"]}
+            )
+        for conv_id, cached_rows in conv_rows.items():
+            await history_cache.append_many(conv_id, cached_rows)
+
     @staticmethod
     async def delete_message(message_id: str):
         """根据消息ID软删除单条消息"""
         async with async_session_getter() as session:
+            conv_id = (await session.execute(
+                select(Message.conv_id).where(Message.id == message_id)
+            )).scalar_one_or_none()
             stmt = update(Message).where(
                 Message.id == message_id
             ).values(delete=1)
             await session.execute(stmt)
             await session.commit()
             logger_util.info(f"Soft deleted message: {message_id}")
+        # 删除单条消息较少发生 直接清除历史消息缓存
+        if conv_id is not None:
+            await history_cache.invalidate(conv_id)
 
     @staticmethod
     async def get_conversation_messages(conv_id: str, limit: int = 100):
@@ -90,10 +148,36 @@ class MessageDao:
             stmt = select(Message).where(
                 Message.conv_id == conv_id,
                 Message.delete == 0
-            ).order_by(Message.timestamp.asc()).limit(limit)
+            ).order_by(Message.timestamp.asc(), Message.id.asc()).limit(limit)
             result = await session.execute(stmt)
             return result.scalars().all()
 
+    @staticmethod
+    async def get_recent_messages(conv_id: str, limit: int = 100):
+        """获取会话最近的 limit 条消息，按时间正序返回"""
+        async with async_session_getter() as session:
+            stmt = select(Message).where(
+                Message.conv_id == conv_id,
+                Message.delete == 0
+            ).order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit)
+            result = await session.execute(stmt)
+            return list(reversed(result.scalars().all()))
+
+    @staticmethod
+    async def get_recent_history(conv_id: str, limit: int = 100) -> List[Dict]:
+        """
+        获取会话最近的 limit 条消息(优先读取历史消息缓存，未命中时回源数据库并回填)。
+        :return: 按时间正序的消息列表 [{"id", "role", "content"}]
+        """
+        rows = await history_cache.get(conv_id, limit)
+        if rows is not None:
+            return rows
+        generation = await history_cache.get_generation(conv_id)
+        messages = await MessageDao.get_recent_messages(conv_id, limit)
+        rows = [{"id": msg.id, "role": msg.role, "content": msg.content} for msg in messages]
+        await history_cache.fill(conv_id, rows, generation)
+        return rows
+
     @staticmethod
     async def delete_conversation_messages(conv_id: str):
         async with async_session_getter() as session:
@@ -102,4 +186,5 @@ class MessageDao:
             ).values(delete=1)
             await session.execute(stmt)
             await session.commit()
-            logger_util.info(f"Soft deleted all messages in conversation: {conv_id}")
\ No newline at end of file
+            logger_util.info(f"Soft deleted all messages in conversation: {conv_id}")
+        await history_cache.invalidate(conv_id)
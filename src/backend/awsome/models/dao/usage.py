@@ -0,0 +1,132 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, String, DateTime, Date, Text, select, func, insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlmodel import Field
+
+from awsome.core.context import async_session_getter
+from awsome.models.dao.base import AwsomeDBModel
+from awsome.models.dao.conversations import Conversation
+from awsome.utils.logger_util import logger_util
+
+
+class TokenUsageBase(AwsomeDBModel):
+    __tablename__ = "token_usage"
+
+    id: Optional[int] = Field(default=None, primary_key=True, description="唯一标识符")
+    conv_id: str = Field(sa_column=Column(String(36), index=True, nullable=False), description="会话ID")
+    message_id: Optional[str] = Field(default=None, sa_column=Column(String(36), nullable=True),
+                                      description="助手消息ID")
+    model: str = Field(sa_column=Column(String(50), index=True, nullable=False), description="模型名称")
+    knowledge_ids: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True),
+                                         description="对话绑定的知识库ID(逗号分隔)")
+    prompt_tokens: int = Field(default=0, description="输入 token 数")
+    cached_tokens: Optional[int] = Field(default=None, description="命中供应商前缀缓存的输入 token 数(供应商未返回时为空)")
+    completion_tokens: int = Field(default=0, description="输出 token 数")
+    total_tokens: int = Field(default=0, description="总 token 数")
+    estimated: int = Field(default=0, description="估算标志（供应商未返回用量时按本地分词估算）")
+    truncated: int = Field(default=0, description="截断标志（客户端断开导致回复未完整生成）")
+    create_time: datetime = Field(sa_column=Column(DateTime, index=True, nullable=False), description="创建时间")
+
+
+class TokenUsage(TokenUsageBase, table=True):
+    __table_args__ = {"extend_existing": True}
+
+
+class TokenUsageDailyBase(AwsomeDBModel):
+    __tablename__ = "token_usage_daily"
+
+    day: date = Field(sa_column=Column(Date, primary_key=True), description="日期")
+    conv_id: str = Field(sa_column=Column(String(36), primary_key=True), description="会话ID")
+    model: str = Field(sa_column=Column(String(50), primary_key=True), description="模型名称")
+    prompt_tokens: int = Field(default=0, description="输入 token 数")
+    completion_tokens: int = Field(default=0, description="输出 token 数")
+    total_tokens: int = Field(default=0, description="总 token 数")
+    requests: int = Field(default=0, description="请求次数")
+
+
+class TokenUsageDaily(TokenUsageDailyBase, table=True):
+    __table_args__ = {"extend_existing": True}
+
+
+class UsageDao:
+    @staticmethod
+    async def create_usages(rows: List[Dict]):
+        """
+        批量写入用量明细，并在同一事务中累加到按 日期/会话/模型 汇总的日用量。
+
+        :param rows: [{"conv_id", "message_id", "model", "knowledge_ids", "prompt_tokens", "cached_tokens",
+                       "completion_tokens", "total_tokens", "estimated", "truncated", "create_time"}]
+        """
+        if not rows:
+            return
+        rollups: Dict[tuple, Dict] = defaultdict(lambda: {
+            "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "requests": 0
+        })
+        for row in rows:
+            rollup = rollups[(row["create_time"].date(), row["conv_id"], row["model"])]
+            rollup["prompt_tokens"] += row["prompt_tokens"]
+            rollup["completion_tokens"] += row["completion_tokens"]
+            rollup["total_tokens"] += row["total_tokens"]
+            rollup["requests"] += 1
+        daily_rows = [
+            {"day": day, "conv_id": conv_id, "model": model, **values}
+            for (day, conv_id, model), values in rollups.items()
+        ]
+        upsert = mysql_insert(TokenUsageDaily).values(daily_rows)
+        upsert = upsert.on_duplicate_key_update(
+            prompt_tokens=TokenUsageDaily.prompt_tokens + upsert.inserted.prompt_tokens,
+            completion_tokens=TokenUsageDaily.completion_tokens + upsert.inserted.completion_tokens,
+            total_tokens=TokenUsageDaily.total_tokens + upsert.inserted.total_tokens,
+            requests=TokenUsageDaily.requests + upsert.inserted.requests,
+        )
+        async with async_session_getter() as session:
+            await session.execute(insert(TokenUsage), rows)
+            await session.execute(upsert)
+            await session.commit()
+            logger_util.debug(f"Created {len(rows)} token usage records")
+
+    @staticmethod
+    async def top(group_by: str = "conversation", days: int = 7, limit: int = 10) -> List[Dict]:
+        """
+        查询最近若干天用量最高的会话或模型。
+
+        :param group_by: conversation: 按会话 model: 按模型
+        :param days: 统计天数(含当天)。
+        :param limit: 返回数量。
+        :return: [{"key", "name", "prompt_tokens", "completion_tokens", "total_tokens", "requests"}]
+        """
+        totals = [
+            func.sum(TokenUsageDaily.prompt_tokens).label("prompt_tokens"),
+            func.sum(TokenUsageDaily.completion_tokens).label("completion_tokens"),
+            func.sum(TokenUsageDaily.total_tokens).label("total_tokens"),
+            func.sum(TokenUsageDaily.requests).label("requests"),
+        ]
+        if group_by == "conversation":
+            stmt = (
+                select(TokenUsageDaily.conv_id.label("key"), Conversation.title.label("name"), *totals)
+                .outerjoin(Conversation, Conversation.id == TokenUsageDaily.conv_id)
+                .group_by(TokenUsageDaily.conv_id, Conversation.title)
+            )
+        elif group_by == "model":
+            stmt = (
+                select(TokenUsageDaily.model.label("key"), TokenUsageDaily.model.label("name"), *totals)
+                .group_by(TokenUsageDaily.model)
+            )
+        else:
+            raise ValueError(f"不支持的统计维度: {group_by}")
+        stmt = (
+            stmt.where(TokenUsageDaily.day >= date.today() - timedelta(days=days - 1))
+            .order_by(func.sum(TokenUsageDaily.total_tokens).desc())
+            .limit(limit)
+        )
+        async with async_session_getter() as session:
+            result = await session.execute(stmt)
+            rows = [dict(row) for row in result.mappings().all()]
+        # MySQL SUM 返回 Decimal
+        for row in rows:
+            for field in ("prompt_tokens", "completion_tokens", "total_tokens", "requests"):
+                row[field] = int(row[field] or 0)
+        return rows
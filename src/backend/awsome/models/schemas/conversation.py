@@ -0,0 +1,22 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class KnowledgeBaseConfig(BaseModel):
+    id: str = Field(..., description="知识库ID")
+    name: Optional[str] = Field(None, description="知识库名称")
+    collection_name: Optional[str] = Field(None, description="Collection 名称")
+    index_name: Optional[str] = Field(None, description="Index 名称")
+
+
+class ConversationConfig(BaseModel):
+    """对话轮次所需的会话配置，用于缓存，不包含消息列表"""
+    id: str = Field(..., description="会话ID")
+    model: str = Field(..., description="使用模型")
+    system_prompt: Optional[str] = Field(None, description="系统提示词")
+    temperature: float = Field(0.7, description="生成温度")
+    use_memory: int = Field(0, description="是否使用记忆")
+    summary: Optional[str] = Field(None, description="历史对话滚动摘要")
+    summary_until: Optional[str] = Field(None, description="滚动摘要覆盖到的最后一条消息ID")
+    knowledge_bases: List[KnowledgeBaseConfig] = Field(default_factory=list, description="绑定的知识库(未删除)")
@@ -17,6 +17,14 @@ class PageModel(BaseModel, Generic[T]):
     data: List[T]
 
 
+class CursorPageModel(BaseModel, Generic[T]):
+    """游标分页返回模型，next_cursor 用于请求下一页"""
+    total: Optional[int] = None
+    data: List[T]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+
 def resp_200(data: Union[list, dict, str, Any] = None) -> ResponseModel:
     """返回成功响应"""
     return ResponseModel(status_code=200, status_message='SUCCESS', data=data)
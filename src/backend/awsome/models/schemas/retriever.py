@@ -1,5 +1,6 @@
 class RetrieverResult:
-    def __init__(self, source, name, id, score, metadata, text, vector=None):
+    def __init__(self, source, name, id, score, metadata, text, vector=None, ranks=None, fused_score=None,
+                 rerank_score=None):
         """
         用于表示召回结果的通用类。
         :param source: 来源（"es" 或 "milvus"）
@@ -9,6 +10,9 @@ class RetrieverResult:
         :param metadata: 元数据（字典形式）
         :param text: 文本内容
         :param vector: 向量（仅 Milvus 有，可选）
+        :param ranks: 融合排序后各检索引擎内的排名（从 1 开始，未召回的引擎不出现）
+        :param fused_score: 融合分数（仅融合排序后有）
+        :param rerank_score: 重排序分数（仅重排序后有）
         """
         self.source = source  # 数据来源（"es" 或 "milvus"）
         self.name = name  # 集合名称或索引名称
@@ -17,6 +21,9 @@ class RetrieverResult:
         self.metadata = metadata  # 元数据
         self.text = text  # 文本内容
         self.vector = vector  # 向量（仅 Milvus 有）
+        self.ranks = ranks  # 各检索引擎内的排名
+        self.fused_score = fused_score  # 融合分数
+        self.rerank_score = rerank_score  # 重排序分数
 
     def to_dict(self):
         """
@@ -32,4 +39,9 @@ class RetrieverResult:
         }
         if self.vector is not None:
             result_dict["vector"] = self.vector
+        if self.ranks is not None:
+            result_dict["ranks"] = self.ranks
+            result_dict["fused_score"] = self.fused_score
+        if self.rerank_score is not None:
+            result_dict["rerank_score"] = self.rerank_score
         return result_dict
@@ -1,14 +1,16 @@
 class SourceMsg:
-    def __init__(self, source, title, url):
+    def __init__(self, source, title, url, object_name=None):
         """
         用于表示召回结果的通用类。
         :param source: 来源（"es" 或 "milvus"）
         :param title: 标题
         :param url: 来源url
+        :param object_name: 知识库来源的 MinIO Object Name，用于重新生成预签名链接（可选）
         """
         self.source = source  # 数据来源（"kb" 或 "web"）
         self.title = title  # 标题
         self.url = url  # 来源url
+        self.object_name = object_name  # MinIO Object Name（仅知识库来源有）
 
     def __eq__(self, other):
         if isinstance(other, SourceMsg):
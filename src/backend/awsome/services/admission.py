@@ -0,0 +1,342 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from awsome.services.constant import default_admission_max_wait_ms, default_admission_max_queue_size, \
+    default_admission_completion_tokens
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
+from awsome.utils.token_util import TokenUtil
+
+admission_queue_gauge = metrics.gauge(
+    "awsome_admission_queue_depth",
+    "等待准入的模型请求数",
+    labelnames=("limiter",)
+)
+admission_in_flight_gauge = metrics.gauge(
+    "awsome_admission_in_flight",
+    "已准入且未结束的模型请求数",
+    labelnames=("limiter",)
+)
+admission_wait_histogram = metrics.histogram(
+    "awsome_admission_wait_seconds",
+    "模型请求等待准入的耗时(秒)",
+    labelnames=("limiter",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+)
+admission_decisions_counter = metrics.counter(
+    "awsome_admission_decisions_total",
+    "准入结果 result: admitted/queue_full/deadline/timeout",
+    labelnames=("limiter", "result")
+)
+
+# 令牌窗口时长(秒)
+_TPM_WINDOW = 60
+# 平均占用时长的平滑系数
+_HOLD_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, limiter: str, reason: str, retry_after: float):
+        """
+        模型请求未获准入。
+        :param limiter: 限流维度(模型或供应商)
+        :param reason: queue_full: 等待队列已满 deadline: 预计等待超过时限 timeout: 等待超时
+        :param retry_after: 建议重试间隔(秒)
+        """
+        super().__init__(f"模型 {limiter} 繁忙({reason})，请稍后重试")
+        self.limiter = limiter
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Limiter:
+    """单个模型/供应商的并发及每分钟 token 限制，等待者按先到先得准入"""
+
+    def __init__(self, name: str, max_concurrency: int, tokens_per_minute: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        # 令牌窗口 [准入时间, token 数]
+        self.token_window: Deque[List[float]] = deque()
+        self.waiters: Deque[asyncio.Future] = deque()
+        # 单个请求平均占用时长(秒) 用于估算排队等待时间
+        self.avg_hold = 0.0
+
+    def _window_tokens(self, now: float) -> float:
+        while self.token_window and self.token_window[0][0] <= now - _TPM_WINDOW:
+            self.token_window.popleft()
+        return sum(tokens for _, tokens in self.token_window)
+
+    def token_wait(self, tokens: int, now: float) -> float:
+        """令牌窗口可容纳 tokens 所需等待的时间(秒)"""
+        if self.tokens_per_minute <= 0:
+            return 0.0
+        # 超过单分钟上限的请求仅在窗口为空时准入 避免永远无法执行
+        excess = self._window_tokens(now) + min(tokens, self.tokens_per_minute) - self.tokens_per_minute
+        if excess <= 0:
+            return 0.0
+        for admitted_at, window_tokens in self.token_window:
+            excess -= window_tokens
+            if excess <= 0:
+                return admitted_at + _TPM_WINDOW - now
+        return _TPM_WINDOW
+
+    def estimated_wait(self, tokens: int, now: float) -> float:
+        """按排队人数及平均占用时长粗略估算新请求的等待时间"""
+        concurrency_wait = 0.0
+        if self.max_concurrency > 0:
+            ahead = len(self.waiters) + self.in_flight - self.max_concurrency + 1
+            concurrency_wait = max(ahead, 0) / self.max_concurrency * self.avg_hold
+        return max(concurrency_wait, self.token_wait(tokens, now))
+
+    def can_admit(self, tokens: int, now: float) -> bool:
+        if self.max_concurrency > 0 and self.in_flight >= self.max_concurrency:
+            return False
+        return self.token_wait(tokens, now) <= 0
+
+    def admit(self, tokens: int, now: float) -> List[float]:
+        self.in_flight += 1
+        entry = [now, float(tokens)]
+        self.token_window.append(entry)
+        admission_in_flight_gauge.set(self.in_flight, limiter=self.name)
+        return entry
+
+    def release(self, hold: float):
+        self.in_flight -= 1
+        self.avg_hold = hold if self.avg_hold == 0 else \
+            (1 - _HOLD_EWMA_ALPHA) * self.avg_hold + _HOLD_EWMA_ALPHA * hold
+        admission_in_flight_gauge.set(self.in_flight, limiter=self.name)
+        self.wake()
+
+    def wake(self):
+        """唤醒队首等待者 由其自行判断能否准入"""
+        if self.waiters and not self.waiters[0].done():
+            self.waiters[0].set_result(None)
+
+
+class AdmissionTicket:
+    """准入凭证，模型请求结束时释放"""
+
+    def __init__(self, limiter: _Limiter, entry: List[float]):
+        self.limiter = limiter
+        self.entry = entry
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+    def release(self, completion_tokens: Optional[int] = None, prompt_tokens: Optional[int] = None):
+        """
+        释放并发名额。
+        :param completion_tokens: 实际生成 token 数，与 prompt_tokens 同时提供时以实际用量修正令牌窗口
+        :param prompt_tokens: 实际输入 token 数
+        """
+        if self.released:
+            return
+        self.released = True
+        if completion_tokens is not None and prompt_tokens is not None:
+            self.entry[1] = float(prompt_tokens + completion_tokens)
+        self.limiter.release(time.monotonic() - self.admitted_at)
+
+
+class AdmittedStream:
+    """
+    持有准入凭证的流式响应，迭代结束、失败或关闭时释放，接口与 AsyncStream 一致。
+    可分多次迭代(如路由读取首 token 后由调用方继续读取)，中途停止迭代不会释放。
+    """
+
+    def __init__(self, stream, ticket: AdmissionTicket, prompt_tokens: int, model: str = None):
+        self.stream = stream
+        self.ticket = ticket
+        self.prompt_tokens = prompt_tokens
+        self.model = model
+        self.completion_text: List[str] = []
+        self.usage = None
+        self._iterator = stream.__aiter__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._iterator.__anext__()
+        except BaseException:
+            self._release()
+            raise
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            self.completion_text.append(chunk.choices[0].delta.content)
+        return chunk
+
+    def _release(self):
+        if self.usage is not None:
+            # 以供应商返回的用量修正令牌窗口
+            self.ticket.release(self.usage.completion_tokens, self.usage.prompt_tokens)
+            return
+        self.ticket.release(TokenUtil.count_tokens("".join(self.completion_text), self.model), self.prompt_tokens)
+
+    async def close(self):
+        try:
+            await self.stream.close()
+        finally:
+            self._release()
+
+
+class AdmissionController:
+    """
+    模型请求准入控制，由模型客户端在每次上游文本生成调用前执行(见 ModelFactory)。
+    按模型(chat.admission.models)或实际调用的供应商(chat.admission.providers)限制并发数及每分钟 token 数，
+    超出限制的请求进入有界等待队列；队列已满或预计等待超过时限的请求立即拒绝，返回明确的繁忙响应而不是等待上游 429。
+    仅限制当前进程，多实例部署时按实例数拆分配额。
+    """
+    _limiters: Dict[str, _Limiter] = {}
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return bool(get_config("chat.admission.enabled", False))
+
+    @classmethod
+    def _get_limiter(cls, llm_name: str, provider: Optional[str] = None) -> _Limiter:
+        limits = (get_config("chat.admission.models") or {}).get(llm_name)
+        name = llm_name
+        if limits is None and provider is not None:
+            limits = (get_config("chat.admission.providers") or {}).get(provider)
+            name = f"provider:{provider}"
+        if limits is None:
+            limits = get_config("chat.admission.default") or {}
+            name = llm_name
+        if name not in cls._limiters:
+            cls._limiters[name] = _Limiter(
+                name=name,
+                max_concurrency=int(limits.get("max_concurrency", 0)),
+                tokens_per_minute=int(limits.get("tokens_per_minute", 0))
+            )
+        return cls._limiters[name]
+
+    @classmethod
+    def estimate_tokens(cls, messages: List[Dict], max_tokens: Optional[int], model: str = None):
+        """估算请求占用的 token 数，返回 (输入 token 数, 输入及预计输出 token 数)"""
+        prompt_tokens = TokenUtil.count_messages_tokens(messages, model)
+        completion_tokens = max_tokens or int(
+            get_config("chat.admission.completion_tokens", default_admission_completion_tokens))
+        return prompt_tokens, prompt_tokens + completion_tokens
+
+    @classmethod
+    def is_saturated(cls, llm_name: str, provider: Optional[str] = None) -> bool:
+        """等待队列已满，新请求必然被拒绝，可在开始流式响应前直接返回 429"""
+        if not cls.is_enabled():
+            return False
+        limiter = cls._get_limiter(llm_name, provider)
+        return len(limiter.waiters) >= int(get_config("chat.admission.max_queue_size", default_admission_max_queue_size))
+
+    @classmethod
+    async def acquire(cls, llm_name: str, tokens: int, provider: Optional[str] = None) -> AdmissionTicket:
+        """
+        等待准入。
+
+        :param llm_name: 模型名称。
+        :param tokens: 请求预计占用的 token 数。
+        :param provider: 实际调用的供应商标识(模型配置 mark)。
+        :return: 准入凭证，请求结束时调用 release。
+        :raise AdmissionRejected: 队列已满、预计等待或实际等待超过时限。
+        """
+        limiter = cls._get_limiter(llm_name, provider)
+        max_wait = int(get_config("chat.admission.max_wait_ms", default_admission_max_wait_ms)) / 1000
+        max_queue_size = int(get_config("chat.admission.max_queue_size", default_admission_max_queue_size))
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        now = time.monotonic()
+
+        if not limiter.waiters and limiter.can_admit(tokens, now):
+            admission_decisions_counter.inc(limiter=limiter.name, result="admitted")
+            admission_wait_histogram.observe(0, limiter=limiter.name)
+            return AdmissionTicket(limiter, limiter.admit(tokens, now))
+
+        if len(limiter.waiters) >= max_queue_size:
+            cls._reject(limiter, "queue_full", limiter.estimated_wait(tokens, now))
+        estimated_wait = limiter.estimated_wait(tokens, now)
+        if estimated_wait > max_wait:
+            cls._reject(limiter, "deadline", estimated_wait)
+
+        waiter = loop.create_future()
+        limiter.waiters.append(waiter)
+        admission_queue_gauge.set(len(limiter.waiters), limiter=limiter.name)
+        try:
+            while True:
+                remaining = start + max_wait - loop.time()
+                if remaining <= 0:
+                    cls._reject(limiter, "timeout", limiter.estimated_wait(tokens, time.monotonic()))
+                # 队首等待者等待释放事件 令牌窗口受限时到期后重试
+                timeout = remaining
+                if limiter.waiters[0] is waiter:
+                    token_wait = limiter.token_wait(tokens, time.monotonic())
+                    if token_wait > 0:
+                        timeout = min(timeout, token_wait)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                now = time.monotonic()
+                if limiter.waiters[0] is waiter and limiter.can_admit(tokens, now):
+                    entry = limiter.admit(tokens, now)
+                    break
+                if waiter.done():
+                    waiter = cls._renew_waiter(limiter, waiter)
+        finally:
+            limiter.waiters.remove(waiter)
+            admission_queue_gauge.set(len(limiter.waiters), limiter=limiter.name)
+            # 轮到下一个等待者
+            limiter.wake()
+        admission_decisions_counter.inc(limiter=limiter.name, result="admitted")
+        admission_wait_histogram.observe(loop.time() - start, limiter=limiter.name)
+        return AdmissionTicket(limiter, entry)
+
+    @classmethod
+    async def run(cls, llm_name: str, provider: Optional[str], messages: List[Dict], max_tokens: Optional[int],
+                  stream: bool, create: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        经准入控制执行一次上游文本生成调用。
+
+        :param llm_name: 模型名称。
+        :param provider: 供应商标识(模型配置 mark)。
+        :param messages: OpenAI 格式消息，用于估算 token 数。
+        :param max_tokens: 最大生成 token 数。
+        :param stream: 是否流式，流式响应包装为 AdmittedStream，读取结束或关闭时释放。
+        :param create: 发起上游调用。
+        :return: 上游响应
+        :raise AdmissionRejected: 模型繁忙，未获准入
+        """
+        if not cls.is_enabled():
+            return await create()
+        prompt_tokens, tokens = cls.estimate_tokens(messages, max_tokens, llm_name)
+        ticket = await cls.acquire(llm_name, tokens, provider)
+        try:
+            response = await create()
+        except BaseException:
+            ticket.release()
+            raise
+        if stream:
+            return AdmittedStream(response, ticket, prompt_tokens, llm_name)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            ticket.release(usage.completion_tokens, usage.prompt_tokens)
+        else:
+            ticket.release()
+        return response
+
+    @staticmethod
+    def _renew_waiter(limiter: _Limiter, waiter: asyncio.Future) -> asyncio.Future:
+        """已被唤醒但仍无法准入时替换为新的等待 Future，保持队列位置不变"""
+        renewed = asyncio.get_running_loop().create_future()
+        limiter.waiters[limiter.waiters.index(waiter)] = renewed
+        return renewed
+
+    @staticmethod
+    def _reject(limiter: _Limiter, reason: str, retry_after: float):
+        admission_decisions_counter.inc(limiter=limiter.name, result=reason)
+        logger_util.warning(f"模型 {limiter.name} 请求未获准入: {reason}, 排队 {len(limiter.waiters)}, "
+                            f"并发 {limiter.in_flight}")
+        raise AdmissionRejected(limiter.name, reason, max(retry_after, 1.0))
@@ -1,25 +1,78 @@
+import asyncio
+import base64
 import json
+import time
+from datetime import datetime
 
 from awsome.models.schemas.source import SourceMsg
 from awsome.models.dao.conversation_knowledge_link import ConversationKnowledgeLinkDao
 from awsome.models.dao.conversations import ConversationDao, Conversation
 from awsome.models.dao.knowledge import KnowledgeDao, Knowledge
 from awsome.models.dao.messages import MessageDao
-from awsome.models.schemas.response import PageModel
+from awsome.models.schemas.conversation import ConversationConfig
+from awsome.models.schemas.response import CursorPageModel
 from awsome.models.v1.chat import ChatCreate, ChatUpdate, ChatMessageSend
 from fastapi import HTTPException
-from typing import Generator, List
+from typing import Any, Awaitable, Callable, Dict, Generator, List, Optional
+from awsome.services.history import HistoryService
+from awsome.services.admission import AdmissionController, AdmissionRejected
+from awsome.services.message_writer import message_writer
+from awsome.services.usage import usage_recorder
+from awsome.services.context_packer import ContextPacker
+from awsome.services.model_router import ModelRouter
+from awsome.services.prompt_builder import PromptBuilder
+from awsome.services.retrieval_gate import RetrievalGateService
 from awsome.services.retriever import RetrieverService
+from awsome.services.semantic_cache import SemanticCacheService, SemanticCacheLookup
+from awsome.services.constant import default_stage_timeout, semantic_cache_replay_chunk_size, \
+    default_sse_flush_interval_ms, default_sse_flush_bytes, default_kb_context_token_budget, \
+    default_fusion_method, default_fusion_candidate_top_k, default_fusion_top_k, default_rerank_candidate_top_k
+from awsome.settings import get_config
 from awsome.services.tasks import celery_add_memory
 from awsome.utils.logger_util import logger_util
 from awsome.utils.memory_util import MemoryUtil
+from awsome.utils.metrics_util import metrics
 from awsome.utils.minio_util import MinioUtil
 from awsome.utils.model_factory import ModelFactory
+from awsome.utils.sse_util import SSEUtil
+from awsome.utils.token_util import TokenUtil
 from awsome.utils.tools import WebSearchTool
 
 minio_client = MinioUtil()
 
+chat_disconnect_counter = metrics.counter(
+    "awsome_chat_client_disconnects_total",
+    "客户端在流式响应过程中断开的次数",
+    labelnames=("model",)
+)
+# 对话指标公共标签 模型及是否启用知识库/网络检索/记忆
+CHAT_METRIC_LABELS = ("model", "kb", "web", "memory")
+chat_stage_histogram = metrics.histogram(
+    "awsome_chat_stage_seconds",
+    "对话各阶段耗时(秒) stage: history_load/kb_recall/web_search/memory_recall/db_write",
+    labelnames=("stage", *CHAT_METRIC_LABELS)
+)
+chat_ttft_histogram = metrics.histogram(
+    "awsome_chat_ttft_seconds",
+    "发起模型请求至收到首个token的耗时(秒)",
+    labelnames=CHAT_METRIC_LABELS
+)
+chat_tokens_per_second_histogram = metrics.histogram(
+    "awsome_chat_tokens_per_second",
+    "首个token之后的生成速度(token/秒)",
+    labelnames=CHAT_METRIC_LABELS,
+    buckets=(5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+)
+chat_request_histogram = metrics.histogram(
+    "awsome_chat_request_seconds",
+    "流式对话总耗时(秒)",
+    labelnames=CHAT_METRIC_LABELS
+)
+
+
 class ChatService:
+    # 持有后台任务引用 防止任务被回收
+    _background_tasks = set()
 
     @classmethod
     async def create_conversation(cls, create_data: ChatCreate):
@@ -46,8 +99,8 @@ class ChatService:
                 logger_util.debug(f"当前会话管理知识库ID: {knowledge_base_id}")
                 await ConversationKnowledgeLinkDao.create(conversation_id=conv.id, knowledge_id=knowledge_base_id)
 
-        return await cls._format_conversation_response(
-            await ConversationDao.one_with_kb(conv.id)
+        return cls._format_conversation_response(
+            await ConversationDao.get_detail(conv.id)
         )
 
     @classmethod
@@ -79,35 +132,50 @@ class ChatService:
             use_memory=update_data.use_memory
         )
 
-        return await cls._format_conversation_response(
-            await ConversationDao.one_with_kb(update_data.conv_id)
+        return cls._format_conversation_response(
+            await ConversationDao.get_detail(update_data.conv_id)
         )
 
     @classmethod
-    async def list_conversations(cls, page: int, size: int):
-        """分页获取用户对话列表"""
-        total = await ConversationDao.cnt_conversation_total()
-        conversations = await ConversationDao.list_with_kb(page, size)
-        return PageModel(total=total, data=[{
-            "id": conv.id,
-            "title": conv.title,
-            "model": conv.model,
-            "knowledge_bases": [
-                {
-                    "id": kb.id,
-                    "name": kb.name,
-                    "desc": kb.desc,
-                    "model": kb.model,
-                    "collection_name": kb.collection_name,
-                    "index_name": kb.index_name,
-                }
-                for kb in conv.knowledge_bases
-            ],
-            "updated_at": conv.updated_at.isoformat()
+    async def list_conversations(cls, page: int, size: int, cursor: Optional[str] = None,
+                                 with_total: Optional[bool] = None):
+        """
+        分页获取用户对话列表
+        :param page: 页码(偏移分页)，指定 cursor 时忽略
+        :param size: 每页数量
+        :param cursor: 游标分页，首页传空字符串，之后传上一页返回的 next_cursor
+        :param with_total: 是否返回总数，偏移分页默认返回，游标分页默认不返回
+        """
+        keyset = cursor is not None
+        if with_total is None:
+            with_total = not keyset
+        after = cls._decode_cursor(cursor) if cursor else None
+        conversations, total, has_more = await ConversationDao.list_summaries(page, size, after=after,
+                                                                              with_total=with_total)
+        next_cursor = cls._encode_cursor(conversations[-1]) if has_more else None
+        return CursorPageModel(total=total, has_more=has_more, next_cursor=next_cursor, data=[{
+            "id": conv["id"],
+            "title": conv["title"],
+            "model": conv["model"],
+            "knowledge_bases": conv["knowledge_bases"],
+            "updated_at": conv["updated_at"].isoformat()
         }
             for conv in conversations
         ])
 
+    @staticmethod
+    def _encode_cursor(conv: Dict) -> str:
+        raw = json.dumps([conv["updated_at"].isoformat(), conv["id"]])
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        try:
+            updated_at, conv_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return datetime.fromisoformat(updated_at), conv_id
+        except Exception:
+            raise ValueError("无效的分页游标")
+
     @classmethod
     async def get_message_history(cls, conv_id: str, limit: int):
         """获取对话历史消息"""
@@ -117,272 +185,557 @@ class ChatService:
     async def clear_message_history(cls, conv_id: str):
         """软删除对话历史消息"""
         # 先删除关联消息
-        return await MessageDao.delete_conversation_messages(conv_id)
+        result = await MessageDao.delete_conversation_messages(conv_id)
+        # 清空滚动摘要
+        await ConversationDao.update_summary(conv_id, None, None)
+        return result
+
+    @classmethod
+    async def is_model_busy(cls, conv_id: str) -> bool:
+        """会话所用模型的准入等待队列已满，可在开始流式响应前直接拒绝"""
+        if not AdmissionController.is_enabled():
+            return False
+        conversation = await ConversationDao.get_config(conv_id)
+        if conversation is None:
+            return False
+        # 路由前无法确定实际调用的供应商 按默认模型配置判断
+        return AdmissionController.is_saturated(conversation.model, ModelFactory._get_default_model_config().get("mark"))
 
     @classmethod
-    async def stream_chat_response(cls, message_data: ChatMessageSend) -> Generator:
-        """流式聊天处理"""
+    async def stream_chat_response(cls, message_data: ChatMessageSend,
+                                   is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Generator:
+        """
+        流式聊天处理
+        :param message_data: 用户消息
+        :param is_disconnected: 客户端断开检测(如 Request.is_disconnected)，断开后立即停止模型生成并保存已生成的部分回复
+        """
+        request_start = time.perf_counter()
         # 来源信息
         source_msg_list: List[SourceMsg] = []
         # 获取对话配置
-        conversation: Conversation = await ConversationDao.get(message_data.conv_id)
+        # 会话配置读穿缓存 不加载消息列表
+        conversation: ConversationConfig = await ConversationDao.get_config(message_data.conv_id)
         if not conversation:
             raise HTTPException(status_code=404, detail="对话不存在")
+        metric_labels = cls._metric_labels(conversation, message_data)
+        knowledge_ids = [knowledge_base.id for knowledge_base in conversation.knowledge_bases]
 
-        # 最终给模型的输入
-        final_query = message_data.message
-
-        # 获取知识库召回内容
-        kb_source_list = None
+        # 检索门控 按消息内容判定值得查询的检索来源 寒暄/致谢等消息跳过检索
+        enabled_sources = set()
         if len(conversation.knowledge_bases) > 0:
-            logger_util.debug(f"用户开启并使用知识库检索")
-            try:
-                final_query, kb_source_list = await cls._append_kb_recall_msg(conversation.knowledge_bases, final_query)
-            except Exception as e:
-                logger_util.error(f"知识库召回内容失败: {e}")
-
-        # 获取网络搜索内容
-        web_source_list = None
+            enabled_sources.add("kb")
         if message_data.search is True:
+            enabled_sources.add("web")
+        if conversation.use_memory == 1:
+            enabled_sources.add("memory")
+        gated_sources = RetrievalGateService.decide(message_data.message, enabled_sources)
+
+        # 历史记录是对话必需的上下文 不同于可选的检索增强 不参与超时丢弃 与前置阶段并发执行 失败时请求失败
+        async def _load_history():
+            with chat_stage_histogram.time(stage="history_load", **metric_labels):
+                return await cls._build_openai_messages(conversation)
+
+        history_task = asyncio.create_task(_load_history())
+
+        # 并发执行对话前置阶段(知识库召回/网络检索/记忆召回) 每个阶段独立超时
+        stages = {}
+        if "kb" in gated_sources:
+            logger_util.debug(f"用户开启并使用知识库检索")
+            stages["kb_recall"] = cls._append_kb_recall_msg(conversation.knowledge_bases, message_data.message,
+                                                            conversation.model)
+        if "web" in gated_sources:
             logger_util.debug(f"用户开启并使用网络检索")
+            stages["web_search"] = cls._append_web_search_msg(message_data.message)
+        if "memory" in gated_sources:
+            logger_util.debug(f"用户开启并使用记忆")
+            stages["memory_recall"] = cls._append_memory_msg(message_data.message, message_data.conv_id)
+        stages_task = asyncio.create_task(cls._run_stages_with_deadline(stages, metric_labels))
+        try:
+            # 知识库对话语义缓存 与前置阶段并发查询 命中时直接回放缓存回答并放弃前置阶段
+            semantic_lookup = None
+            if "kb" in gated_sources and SemanticCacheService.is_applicable(conversation, message_data):
+                semantic_lookup = await cls._lookup_semantic_cache(conversation, message_data, history_task)
+            if semantic_lookup is not None and semantic_lookup.hit:
+                async for frame in cls._replay_cached_answer(message_data, semantic_lookup):
+                    yield frame
+                return
+
             try:
-                final_query, web_source_list = await cls._append_web_search_msg(message_data.message, final_query)
+                stage_results = await stages_task
+                history_messages = await history_task
             except Exception as e:
-                logger_util.error(f"网络检索失败：{e}")
-
-        # 添加/召回记忆
-        if conversation.use_memory == 1:
-            logger_util.debug(f"用户开启并使用记忆")
+                logger_util.error(f"加载历史记录失败: {e}")
+                yield f"data: [ERROR] 历史记录加载失败\n\n"
+                return
+        finally:
+            for task in (stages_task, history_task):
+                if not task.done():
+                    task.cancel()
+
+        if "memory" in gated_sources:
+            # 使用Celery后台添加记忆 在记忆召回结束后提交 不受召回超时影响
             try:
-                final_query = await cls._append_memory_msg(message_data.message, final_query, message_data.conv_id)
+                celery_add_memory.delay(query=message_data.message, user_id=message_data.conv_id)
             except Exception as e:
-                logger_util.error(f"记忆召回失败: {e}")
-
-        # 获取 历史记录
-        # 构造 OpenAI 请求参数
-        system_prompt = [{'role': 'system', 'content': f'{conversation.system_prompt}'}]
-        history_messages = await cls._build_openai_messages(message_data.conv_id)
-        current_message = [{'role': 'user', 'content': f'{final_query}'}]
-        messages = system_prompt + history_messages + current_message
+                logger_util.error(f"提交记忆写入任务失败: {e}")
+
+        # 获取知识库召回内容
+        kb_recall_chunk, kb_source_list = stage_results.get("kb_recall") or ("", None)
+        # 获取网络搜索内容
+        web_search_info, web_source_list = stage_results.get("web_search") or ("", None)
+        # 召回记忆
+        memory_str = stage_results.get("memory_recall") or ""
+
+        # 构造 OpenAI 请求参数 系统提示词及历史消息保持稳定 参考内容统一放在末尾的用户消息中
+        messages = PromptBuilder.build(
+            system_prompt=conversation.system_prompt,
+            history=history_messages,
+            message=message_data.message,
+            kb_context=kb_recall_chunk,
+            web_context=web_search_info,
+            memory_context=memory_str
+        )
         logger_util.debug(f"当前请求模型完整请求消息: {messages}")
 
-        # 保存用户消息并记录ID
+        # 保存用户消息 延迟写入模式下不等待落库 在 END 事件前确认
         try:
-            user_msg = await MessageDao.create_message(
-                conv_id=message_data.conv_id,
-                role="user",
-                content=message_data.message,
-                source=None
-            )
-            user_msg_id = user_msg.id
-            logger_util.debug(f"保存用户消息ID: {user_msg_id}")
+            with chat_stage_histogram.time(stage="db_write", **metric_labels):
+                user_saved = await cls._save_message(
+                    conv_id=message_data.conv_id,
+                    role="user",
+                    content=message_data.message,
+                    source=None
+                )
         except Exception as e:
             logger_util.error(f"保存用户消息失败: {e}")
             yield f"data: [ERROR] 消息保存失败\n\n"
             return
 
         try:
-            # 创建模型调用客户端
-            client = ModelFactory.create_client(llm_name=conversation.model)
             # 完整的模型回复
             full_response = []
+            response = None
+            disconnected = False
+            # 返回来源信息
+            if web_source_list is not None:
+                source_msg_list.extend(web_source_list)
+            if kb_source_list is not None:
+                source_msg_list.extend(kb_source_list)
+            # 首token时间 用于计算生成速度
+            # 首token时间及供应商返回的用量
+            stream_stats = {}
             try:
-                response = await client.generate_text(
+                generation_start = time.perf_counter()
+                # 按路由策略选择模型配置 支持对冲请求及失败切换
+                response = await ModelRouter.stream_chat(
+                    llm_name=conversation.model,
                     messages=messages,
                     temperature=message_data.temperature or conversation.temperature,
                     max_tokens=message_data.max_tokens,
-                    stream=True
                 )
 
                 # yield f"data: [START]\n\n"
                 yield cls._format_stream_response(event="START", text="")
-                for chunk in response:
-                    content = chunk.choices[0].delta.content or ""
-                    if content is not None:
+                # 按时间窗口/字节上限合并增量 减少帧数量
+                contents = SSEUtil.coalesce(
+                    cls._iter_stream_content(response, stream_stats),
+                    flush_interval=get_config("chat.sse.flush_interval_ms", default_sse_flush_interval_ms) / 1000,
+                    flush_bytes=get_config("chat.sse.flush_bytes", default_sse_flush_bytes)
+                )
+                try:
+                    async for content in contents:
                         full_response.append(content)
-                        # yield f"data: {content}\n\n"
+                        if is_disconnected is not None and await is_disconnected():
+                            disconnected = True
+                            break
                         yield cls._format_stream_response(event="MESSAGE", text=content)
-
-                        # await asyncio.sleep(0.02)  # 控制流式速度
+                finally:
+                    await contents.aclose()
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端断开时 StreamingResponse 会取消或关闭生成器
+                cls._abort_generation(message_data.conv_id, conversation.model, response, full_response, source_msg_list,
+                                      messages, knowledge_ids)
+                raise
+            except AdmissionRejected:
+                raise
             except Exception as e:
                 error_msg = f"模型响应失败: {str(e)}"
                 raise Exception(error_msg)
 
-            # 返回来源信息
-            if web_source_list is not None:
-                source_msg_list.extend(web_source_list)
-            if kb_source_list is not None:
-                source_msg_list.extend(kb_source_list)
+            if disconnected:
+                cls._abort_generation(message_data.conv_id, conversation.model, response, full_response, source_msg_list,
+                                      messages, knowledge_ids)
+                return
+
+            assistant_content = "".join(full_response)
+            cls._observe_generation(conversation.model, metric_labels, assistant_content, generation_start,
+                                    stream_stats.get("first_token_at"))
 
             # 保存助手响应
             try:
-                assistant_content = "".join(full_response)
-                await MessageDao.create_message(
-                    conv_id=message_data.conv_id,
-                    role="assistant",
-                    content=assistant_content,
-                    source=json.dumps([msg.to_dict() for msg in list(set(source_msg_list))], ensure_ascii=False),
-                )
+                with chat_stage_histogram.time(stage="db_write", **metric_labels):
+                    assistant_saved = await cls._save_message(
+                        conv_id=message_data.conv_id,
+                        role="assistant",
+                        content=assistant_content,
+                        source=json.dumps([msg.to_dict() for msg in list(set(source_msg_list))], ensure_ascii=False),
+                    )
                 logger_util.debug(f"保存助手响应消息: {assistant_content}")
             except Exception as e:
                 error_msg = f"保存助手响应信息失败: {e}"
                 raise Exception(error_msg)
 
+            # 写入语义缓存 仅缓存基于知识库召回内容生成的回答(召回超时/失败/无结果时生成的回答不可作为知识库回答复用)
+            if semantic_lookup is not None and kb_recall_chunk:
+                try:
+                    await SemanticCacheService.store(semantic_lookup, message_data.message, assistant_content,
+                                                     list(set(source_msg_list)))
+                except Exception as e:
+                    logger_util.error(f"写入语义缓存失败: {e}")
+
             if len(source_msg_list) != 0:
                 # yield f"data: [SOURCE] {[source_msg.to_dict() for source_msg in list(set(source_msg_list))]}\n\n"
                 yield cls._format_stream_response(event="SOURCE", text="", extra=[source_msg.to_dict() for source_msg in list(set(source_msg_list))])
-            # yield f"data: [END]\n\n"
-            yield cls._format_stream_response(event="END", text="")
 
+            # 消息落库后才确认
+            try:
+                with chat_stage_histogram.time(stage="db_ack", **metric_labels):
+                    user_msg_id, assistant_msg_id = await asyncio.gather(user_saved, assistant_saved)
+            except Exception as e:
+                raise Exception(f"保存消息失败: {e}")
+            # 记录用量 后台批量写入
+            try:
+                await usage_recorder.record(message_data.conv_id, conversation.model, messages, assistant_content,
+                                            usage=stream_stats.get("usage"), message_id=assistant_msg_id,
+                                            knowledge_ids=knowledge_ids)
+            except Exception as e:
+                logger_util.error(f"记录用量失败: {e}")
+            # yield f"data: [END]\n\n"
+            yield cls._format_stream_response(event="END", text="", extra={
+                "user_message_id": user_msg_id,
+                "assistant_message_id": assistant_msg_id
+            })
+            chat_request_histogram.observe(time.perf_counter() - request_start, **metric_labels)
+
+        except AdmissionRejected as e:
+            # 模型繁忙 快速返回繁忙事件 客户端可按 retry_after 重试
+            await cls._rollback_user_message(user_saved)
+            yield cls._format_stream_response(event="BUSY", text=f"{e}", extra={"retry_after": round(e.retry_after)})
         except Exception as e:
             logger_util.error(f"模型调用或保存模型回复失败: {str(e)}")
             # 回滚用户保存消息
-            try:
-                await MessageDao.delete_message(user_msg_id)
-                logger_util.info(f"已回滚用户消息: {user_msg_id}")
-            except Exception as delete_error:
-                logger_util.error(f"消息回滚失败: {delete_error}")
+            await cls._rollback_user_message(user_saved)
             # yield f"data: [ERROR] {e}\n\n"
-            cls._format_stream_response(event="ERROR", text=f"{e}")
+            yield cls._format_stream_response(event="ERROR", text=f"{e}")
+
+    @classmethod
+    async def _rollback_user_message(cls, user_saved: asyncio.Future):
+        """回滚已保存的用户消息"""
+        try:
+            user_msg_id = await user_saved
+            await MessageDao.delete_message(user_msg_id)
+            logger_util.info(f"已回滚用户消息: {user_msg_id}")
+        except Exception as delete_error:
+            logger_util.error(f"消息回滚失败: {delete_error}")
 
     @classmethod
-    async def _build_openai_messages(cls, conv_id: str):
-        """构建 OpenAI 需要的消息格式"""
-        messages = await MessageDao.get_conversation_messages(conv_id)
-        return [{"role": msg.role, "content": msg.content} for msg in messages]
+    async def _save_message(cls, conv_id: str, role: str, content: str, source: Optional[str],
+                            truncated: int = 0) -> asyncio.Future:
+        """
+        保存消息，返回结果为消息ID的 Future。
+        延迟写入模式下消息进入批量写入队列，Future 在落库后完成；否则直接写入数据库，返回已完成的 Future。
+        """
+        if message_writer.enabled:
+            return await message_writer.submit(conv_id, role, content, source, truncated)
+        msg = await MessageDao.create_message(conv_id=conv_id, role=role, content=content, source=source,
+                                              truncated=truncated)
+        saved = asyncio.get_running_loop().create_future()
+        saved.set_result(msg.id)
+        return saved
 
     @classmethod
-    async def _format_conversation_response(cls, conv: Conversation):
+    def _metric_labels(cls, conversation: ConversationConfig, message_data: ChatMessageSend) -> Dict[str, str]:
         return {
-            "id": conv.id,
-            "title": conv.title,
-            "model": conv.model,
-            "system_prompt": conv.system_prompt,
-            "temperature": conv.temperature,
-            "knowledge_bases": [
-                {
-                    "id": kb.id,
-                    "name": kb.name,
-                    "desc": kb.desc,
-                    "model": kb.model,
-                    "collection_name": kb.collection_name,
-                    "index_name": kb.index_name,
-                }
-                for kb in conv.knowledge_bases
-            ],
-            "created_at": conv.created_at.isoformat(),
-            "updated_at": conv.updated_at.isoformat()
+            "model": conversation.model,
+            "kb": str(len(conversation.knowledge_bases) > 0).lower(),
+            "web": str(message_data.search is True).lower(),
+            "memory": str(conversation.use_memory == 1).lower(),
         }
 
     @classmethod
-    async def _append_kb_recall_msg(cls, knowledge_bases: List[Knowledge], message: str):
+    def _observe_generation(cls, model: str, metric_labels: Dict[str, str], content: str, generation_start: float,
+                            first_token_at: Optional[float]):
+        """记录首token耗时及生成速度"""
+        if first_token_at is None:
+            return
+        chat_ttft_histogram.observe(first_token_at - generation_start, **metric_labels)
+        duration = time.perf_counter() - first_token_at
+        if duration > 0:
+            chat_tokens_per_second_histogram.observe(TokenUtil.count_tokens(content, model) / duration, **metric_labels)
+
+    @classmethod
+    def _abort_generation(cls, conv_id: str, model: str, response, full_response: List[str],
+                          source_msg_list: List[SourceMsg], messages: List[Dict], knowledge_ids: List[str]):
+        """
+        客户端断开后终止模型生成。
+        生成器此时处于取消/关闭状态，关闭上游流及保存部分回复放在独立任务中执行。
+        """
+        logger_util.info(f"客户端已断开, 终止会话 {conv_id} 的模型生成")
+        chat_disconnect_counter.inc(model=model)
+        task = asyncio.create_task(
+            cls._close_and_save_partial(conv_id, model, response, "".join(full_response), list(set(source_msg_list)),
+                                        messages, knowledge_ids)
+        )
+        cls._background_tasks.add(task)
+        task.add_done_callback(cls._background_tasks.discard)
+
+    @classmethod
+    async def _close_and_save_partial(cls, conv_id: str, model: str, response, partial_content: str,
+                                      source_msg_list: List[SourceMsg], messages: List[Dict],
+                                      knowledge_ids: List[str]):
+        if response is None:
+            return
+        try:
+            # 关闭连接 供应商随之停止生成
+            await response.close()
+        except Exception as e:
+            logger_util.warning(f"关闭模型流式响应失败: {e}")
+        message_id = None
+        if partial_content:
+            message_id = await cls._save_partial(conv_id, partial_content, source_msg_list)
+        # 已发送的输入及部分输出同样计费 供应商未返回用量 按本地分词估算
+        try:
+            await usage_recorder.record(conv_id, model, messages, partial_content, message_id=message_id,
+                                        knowledge_ids=knowledge_ids, truncated=1)
+        except Exception as e:
+            logger_util.error(f"记录截断生成用量失败: {e}")
+
+    @classmethod
+    async def _save_partial(cls, conv_id: str, partial_content: str,
+                            source_msg_list: List[SourceMsg]) -> Optional[str]:
+        """保存截断的助手响应，返回消息ID"""
+        try:
+            message_id = await (await cls._save_message(
+                conv_id=conv_id,
+                role="assistant",
+                content=partial_content,
+                source=json.dumps([msg.to_dict() for msg in source_msg_list], ensure_ascii=False),
+                truncated=1
+            ))
+            logger_util.debug(f"保存截断的助手响应消息: {partial_content}")
+            return message_id
+        except Exception as e:
+            logger_util.error(f"保存截断的助手响应消息失败: {e}")
+            return None
+
+    @classmethod
+    async def _replay_cached_answer(cls, message_data: ChatMessageSend, semantic_lookup: SemanticCacheLookup):
+        """以流式事件回放语义缓存命中的回答，并照常保存用户消息与助手回复"""
+        source_msg_list = list(set(semantic_lookup.sources))
+        try:
+            user_saved = await cls._save_message(
+                conv_id=message_data.conv_id,
+                role="user",
+                content=message_data.message,
+                source=None
+            )
+            assistant_saved = await cls._save_message(
+                conv_id=message_data.conv_id,
+                role="assistant",
+                content=semantic_lookup.answer,
+                source=json.dumps([msg.to_dict() for msg in source_msg_list], ensure_ascii=False),
+            )
+            user_msg_id, assistant_msg_id = await asyncio.gather(user_saved, assistant_saved)
+        except Exception as e:
+            logger_util.error(f"保存语义缓存回放消息失败: {e}")
+            yield f"data: [ERROR] 消息保存失败\n\n"
+            return
+
+        yield cls._format_stream_response(event="START", text="")
+        answer = semantic_lookup.answer
+        for offset in range(0, len(answer), semantic_cache_replay_chunk_size):
+            yield cls._format_stream_response(event="MESSAGE", text=answer[offset:offset + semantic_cache_replay_chunk_size])
+        if len(source_msg_list) != 0:
+            yield cls._format_stream_response(event="SOURCE", text="", extra=[source_msg.to_dict() for source_msg in source_msg_list])
+        yield cls._format_stream_response(event="END", text="", extra={
+            "user_message_id": user_msg_id,
+            "assistant_message_id": assistant_msg_id
+        })
+
+    @classmethod
+    async def _build_openai_messages(cls, conversation: ConversationConfig):
+        """构建 OpenAI 需要的消息格式(按模型 token 预算截取 更早的消息以滚动摘要代替)"""
+        history_messages, history_stats = await HistoryService.build_history(
+            conv_id=conversation.id,
+            model=conversation.model,
+            summary=conversation.summary,
+            summary_until=conversation.summary_until
+        )
+        logger_util.debug(f"历史记录token统计: {history_stats}")
+        return history_messages
+
+    @classmethod
+    async def _lookup_semantic_cache(cls, conversation: ConversationConfig, message_data: ChatMessageSend,
+                                     history_task: asyncio.Task) -> Optional[SemanticCacheLookup]:
+        """查询语义缓存。追问依赖上下文(如“展开说说第二点”)，仅对无历史消息的首轮提问查询"""
+        await asyncio.wait([history_task])
+        if history_task.exception() is not None or history_task.result():
+            return None
+        try:
+            return await SemanticCacheService.lookup(conversation, message_data.message)
+        except Exception as e:
+            logger_util.error(f"语义缓存查询失败: {e}")
+            return None
+
+    @classmethod
+    async def _run_stages_with_deadline(cls, stages: Dict[str, Awaitable],
+                                        metric_labels: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        并发执行对话前置阶段，每个阶段使用独立的超时时间(chat.stage_timeout.<阶段名>)。
+        超时或异常的阶段结果被丢弃(记录日志)，仅返回按时完成阶段的结果。
+        :param stages: 阶段名称 -> 待执行协程
+        :param metric_labels: 阶段耗时指标标签
+        :return: 阶段名称 -> 阶段结果
+        """
+        async def _run_stage(name: str, stage: Awaitable):
+            timeout = get_config(f"chat.stage_timeout.{name}", default_stage_timeout)
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(stage, timeout=timeout)
+                logger_util.debug(f"前置阶段 {name} 完成, 耗时: {time.perf_counter() - start:.3f}s")
+                return name, result
+            except asyncio.TimeoutError:
+                logger_util.warning(f"前置阶段 {name} 超时({timeout}s), 已丢弃其结果")
+            except Exception as e:
+                logger_util.error(f"前置阶段 {name} 执行失败: {e}")
+            finally:
+                chat_stage_histogram.observe(time.perf_counter() - start, stage=name, **(metric_labels or {}))
+            return name, None
+
+        stage_results = await asyncio.gather(*[_run_stage(name, stage) for name, stage in stages.items()])
+        return {name: result for name, result in stage_results if result is not None}
+
+    @classmethod
+    def _format_conversation_response(cls, conv: Dict):
+        return {
+            "id": conv["id"],
+            "title": conv["title"],
+            "model": conv["model"],
+            "system_prompt": conv["system_prompt"],
+            "temperature": conv["temperature"],
+            "knowledge_bases": conv["knowledge_bases"],
+            "created_at": conv["created_at"].isoformat(),
+            "updated_at": conv["updated_at"].isoformat()
+        }
+
+    @classmethod
+    async def _append_kb_recall_msg(cls, knowledge_bases: List[Knowledge], message: str, model: str = None):
+        """召回知识库内容，返回拼接到提示词的上下文片段及来源信息"""
         recall_chunk = ""
         source_list: List[SourceMsg] = []
         if knowledge_bases:
-            retrieve_resp = await RetrieverService.retrieve(
+            fusion = get_config("chat.fusion.method", default_fusion_method)
+            retrieve_resp = await RetrieverService.rerank_retrieve(
                 query=message,
+                top_k=int(get_config("chat.fusion.top_k", default_fusion_top_k)),
+                candidate_top_k=int(get_config("chat.rerank.candidate_top_k", default_rerank_candidate_top_k)),
+                search_top_k=int(get_config("chat.fusion.candidate_top_k", default_fusion_candidate_top_k)),
                 mode="both",
                 milvus_collection_names=[
                     knowledge_base.collection_name
                     for knowledge_base in knowledge_bases
                 ],
-                milvus_fields=['text', 'title', 'source'],
+                milvus_fields=['text', 'title', 'source', 'file_id', 'chunk_index'],
+                milvus_knowledge_ids=[knowledge_base.id for knowledge_base in knowledge_bases],
                 es_index_names=[
                     knowledge_base.index_name
                     for knowledge_base in knowledge_bases
                 ],
-                es_fields=['text', 'metadata.title', 'metadata.source'],
-                top_k=3
+                es_fields=['text', 'metadata.title', 'metadata.source', 'metadata.file_id', 'metadata.chunk_index'],
+                fusion=None if fusion == "none" else fusion
             )
-            for retrieve_result in retrieve_resp:
-                # 返回object_name minio获取预签名链接
-                minio_object_name = retrieve_result.metadata['source']
-                minio_file_url = minio_client.get_presigned_url(object_name=minio_object_name)
+            # 合并相邻分片、裁剪重叠内容并按预算填充
+            token_budget = int(get_config("chat.context_packer.token_budget", default_kb_context_token_budget))
+            packed = ContextPacker.pack(retrieve_resp, token_budget, model)
+            recall_chunk = packed.text
+            # 来源仅包含实际进入上下文的分片 同一文件只保留一条 {object_name: title}
+            sources = {}
+            for packed_result in packed.results:
+                sources.setdefault(packed_result.metadata['source'], packed_result.metadata['title'])
+            # 返回object_name minio获取预签名链接(同步调用 在线程中执行 避免阻塞事件循环)
+            minio_file_urls = await asyncio.gather(*[
+                asyncio.to_thread(minio_client.get_presigned_url, object_name=minio_object_name)
+                for minio_object_name in sources
+            ])
+            for (minio_object_name, title), minio_file_url in zip(sources.items(), minio_file_urls):
                 # 保存来源信息
-                source_list.append(SourceMsg(source="kb", title=retrieve_result.metadata['title'], url=minio_file_url))
-                # TODO 考虑是否抽象为配置项
-                if retrieve_result.source == 'milvus' and float(retrieve_result.score) > 0.8:
-                    recall_chunk += f"Title: {retrieve_result.metadata['title']}\nContent: {retrieve_result.text}\n\n"
-                if retrieve_result.source == 'es' and float(retrieve_result.score) < 4:
-                    recall_chunk += f"Title: {retrieve_result.metadata['title']}\nContent: {retrieve_result.text}\n\n"
+                source_list.append(SourceMsg(source="kb", title=title, url=minio_file_url,
+                                             object_name=minio_object_name))
 
         if recall_chunk:
-            return f"""
-                    【上下文参考】
-                    {recall_chunk.strip()}
-                    
-                    【用户最新消息】
-                    {message}
-                    
-                    【生成要求】
-                    请基于上下文参考内容，用自然对话的方式响应用户消息。注意:
-                    1. 不要使用"根据检索内容"、"根据资料"、"根据记忆"等暴露检索过程的表述.
-                    2. 不要直接引用上下文中的标题或元数据.
-                    3. 若上下文内容与用户需求无关，则忽略它直接回答.
-            """, source_list
+            return recall_chunk, source_list
         else:
-            return message, None
+            return "", None
 
     @classmethod
-    async def _append_web_search_msg(cls, query: str, message: str):
+    async def _append_web_search_msg(cls, query: str):
+        """网络检索，返回拼接到提示词的检索内容及来源信息"""
         search_tool = WebSearchTool()
         web_search_info = ""
         source_list: List[SourceMsg] = []
         # 一级检索
-        search_results = search_tool.search_baidu(query, size=3, lm=3)
-        # 二级检索
-        for search_item in search_results:
-            # TODO 拼接检索内容到提示词final_query
-            search_content = search_tool.get_page_detail(search_item.url)
+        search_results = await asyncio.to_thread(search_tool.search_baidu, query, size=3, lm=3)
+        # 二级检索 并发获取网页详情
+        search_contents = await asyncio.gather(*[
+            asyncio.to_thread(search_tool.get_page_detail, search_item.url)
+            for search_item in search_results
+        ])
+        for search_item, search_content in zip(search_results, search_contents):
             if search_content is not None:
                 source_list.append(SourceMsg(source="web", title=search_item.name, url=search_item.url))
                 web_search_info += f"Title: {search_item.name}\nContent: {search_content}\n\n"
         if web_search_info:
-            return f"""
-                【网络检索内容】
-                {web_search_info}
-                
-                {message}
-            """, source_list
+            return web_search_info, source_list
         else:
-            return message, None
+            return "", None
 
     @classmethod
-    async def _append_memory_msg(cls, query: str, message: str, user_id):
+    async def _append_memory_msg(cls, query: str, user_id):
+        """召回记忆，返回拼接到提示词的记忆内容"""
         # user_id 用来标识唯一记忆
         from awsome.services.constant import memory_config
-        memory_tool = MemoryUtil(memory_config)
+
+        def _search_memories():
+            memory_tool = MemoryUtil(memory_config)
+            return memory_tool.search_memories(query=query, user_id=user_id, limit=3)
+
         # 检索记忆
-        related_memories, memory_str = memory_tool.search_memories(query=query, user_id=user_id, limit=3)
-        # 添加记忆
-        # memory_tool.add_memory(text=query, user_id=user_id)
-        # 使用Celery后台添加记忆
-        celery_add_memory.delay(query=query, user_id=user_id)
+        related_memories, memory_str = await asyncio.to_thread(_search_memories)
         # 向量库记忆
         original_memories = related_memories.get("results", [])
         # 图记忆
         graph_entities = related_memories.get("relations", [])
         if len(graph_entities) == 0:
-            return message
+            return ""
         else:
-            return f"""
-                【用户相关记忆】
-                {memory_str}
-                
-                {message}
-            """
+            return memory_str
+
+    @classmethod
+    async def _iter_stream_content(cls, response, stream_stats: Optional[Dict] = None):
+        """从模型流式响应中提取增量文本，stream_stats 用于记录首token时间及供应商返回的用量"""
+        async for chunk in response:
+            # 开启 include_usage 时末尾数据块携带用量统计
+            if stream_stats is not None and getattr(chunk, "usage", None) is not None:
+                stream_stats["usage"] = chunk.usage
+            # 部分供应商会返回无choices的数据块(如usage统计)
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                if stream_stats is not None and "first_token_at" not in stream_stats:
+                    stream_stats["first_token_at"] = time.perf_counter()
+                yield content
 
     @classmethod
     def _format_stream_response(cls, event: str, text: str, extra=None):
-        if extra is not None:
-            stream_resp = {
-                "event": event,
-                "text": text,
-                "extra": extra
-            }
-        else:
-            stream_resp = {
-                "event": event,
-                "text": text
-            }
-        return f"data: {json.dumps(stream_resp, ensure_ascii=False)}\n\n"
+        return SSEUtil.format_event(event=event, text=text, extra=extra)
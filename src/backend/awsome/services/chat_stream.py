@@ -0,0 +1,182 @@
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator, Optional, Tuple
+
+from awsome.models.v1.chat import ChatMessageSend
+from awsome.services.base import BaseService
+from awsome.services.chat import ChatService
+from awsome.services.constant import default_resumable_stream_ttl, default_resumable_stream_attach_timeout, \
+    default_resumable_stream_block_ms
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.redis_util import AsyncRedisUtil
+from awsome.utils.sse_util import SSEUtil
+
+# XREAD BLOCK 会独占连接 使用独立连接池
+stream_redis_util = AsyncRedisUtil(max_connections=int(get_config("chat.resumable_stream.max_connections", 200)))
+
+# 流结束标记
+STREAM_EOF = b"eof"
+
+
+class ChatStreamService(BaseService):
+    """
+    可续传的对话流。
+    模型生成在后台任务中进行，每一帧按序号写入该条消息的 Redis Stream(条目ID为 0-{seq})，
+    客户端连接只负责从 Redis Stream 读取并转发，SSE 帧携带 id: {stream_id}:{seq}。
+    连接中断后携带 Last-Event-ID 重连即可补发遗漏的帧并继续跟随生成，不会重新生成；
+    连接可落在任意实例上。所有连接均断开超过 attach_timeout 秒时终止生成。
+    对话流记录所属会话，续传时会话不一致视为不存在。
+    """
+    # 持有后台任务引用 防止任务被回收
+    _background_tasks = set()
+
+    @staticmethod
+    def _key(stream_id: str) -> str:
+        return f"awsome:chat_stream:{stream_id}"
+
+    @staticmethod
+    def _attach_key(stream_id: str) -> str:
+        return f"awsome:chat_stream:{stream_id}:attached"
+
+    @staticmethod
+    def _producing_key(stream_id: str) -> str:
+        return f"awsome:chat_stream:{stream_id}:producing"
+
+    @staticmethod
+    def _owner_key(stream_id: str) -> str:
+        return f"awsome:chat_stream:{stream_id}:owner"
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return bool(get_config("chat.resumable_stream.enabled", False))
+
+    @staticmethod
+    def parse_last_event_id(last_event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+        """
+        解析 Last-Event-ID。
+
+        :param last_event_id: 格式为 {stream_id}:{seq}
+        :return: (stream_id, seq)，格式不正确时返回 None
+        """
+        if not last_event_id:
+            return None
+        stream_id, _, seq = last_event_id.strip().rpartition(":")
+        if not stream_id or not seq.isdigit():
+            return None
+        return stream_id, int(seq)
+
+    @classmethod
+    async def start(cls, message_data: ChatMessageSend) -> str:
+        """
+        在后台开始生成回复。
+
+        :param message_data: 用户消息。
+        :return: stream_id
+        """
+        stream_id = uuid.uuid4().hex
+        attach_timeout = int(get_config("chat.resumable_stream.attach_timeout", default_resumable_stream_attach_timeout))
+        max_duration = int(get_config("chat.resumable_stream.max_duration", 600))
+        # 先标记已连接 避免消费者尚未开始读取时被判定为断开
+        # 生成标记用于区分 尚未产生首帧 与 已过期
+        pipe = stream_redis_util.pipeline(transaction=False)
+        pipe.set(cls._attach_key(stream_id), 1, ex=attach_timeout)
+        pipe.set(cls._producing_key(stream_id), 1, ex=max_duration)
+        pipe.set(cls._owner_key(stream_id), message_data.conv_id,
+                 ex=max(max_duration, int(get_config("chat.resumable_stream.ttl", default_resumable_stream_ttl))))
+        await pipe.execute()
+        task = asyncio.create_task(cls._produce(stream_id, message_data))
+        cls._background_tasks.add(task)
+        task.add_done_callback(cls._background_tasks.discard)
+        return stream_id
+
+    @classmethod
+    async def _produce(cls, stream_id: str, message_data: ChatMessageSend):
+        key = cls._key(stream_id)
+        ttl = int(get_config("chat.resumable_stream.ttl", default_resumable_stream_ttl))
+        # 生成过程中使用较长的过期时间兜底 生成结束后缩短为 ttl
+        generating_ttl = max(ttl, int(get_config("chat.resumable_stream.max_duration", 600)))
+        seq = 0
+        try:
+            async for frame in ChatService.stream_chat_response(message_data,
+                                                                is_disconnected=cls._detached_checker(stream_id)):
+                seq += 1
+                pipe = stream_redis_util.pipeline(transaction=False)
+                pipe.xadd(key, {"frame": frame}, id=f"0-{seq}")
+                pipe.expire(key, generating_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger_util.error(f"对话流 {stream_id} 生成失败: {e}")
+            try:
+                await stream_redis_util.client.xadd(key, {"frame": SSEUtil.format_event(event="ERROR", text=f"{e}")},
+                                                    id=f"0-{seq + 1}")
+                seq += 1
+            except Exception as write_error:
+                logger_util.error(f"对话流 {stream_id} 写入错误信息失败: {write_error}")
+        finally:
+            try:
+                pipe = stream_redis_util.pipeline(transaction=False)
+                pipe.xadd(key, {"frame": "", "state": STREAM_EOF}, id=f"0-{seq + 1}")
+                pipe.expire(key, ttl)
+                pipe.expire(cls._owner_key(stream_id), ttl)
+                pipe.delete(cls._attach_key(stream_id), cls._producing_key(stream_id))
+                await pipe.execute()
+            except Exception as e:
+                logger_util.error(f"对话流 {stream_id} 写入结束标记失败: {e}")
+
+    @classmethod
+    def _detached_checker(cls, stream_id: str):
+        """生成期间检测是否仍有连接在读取，Redis 查询按秒节流"""
+        state = {"checked_at": 0.0, "detached": False}
+
+        async def is_detached() -> bool:
+            now = time.monotonic()
+            if not state["detached"] and now - state["checked_at"] >= 1:
+                state["checked_at"] = now
+                try:
+                    state["detached"] = not await stream_redis_util.client.exists(cls._attach_key(stream_id))
+                except Exception as e:
+                    logger_util.warning(f"检测对话流 {stream_id} 连接状态失败: {e}")
+            return state["detached"]
+
+        return is_detached
+
+    @classmethod
+    async def follow(cls, stream_id: str, conv_id: str, last_seq: int = 0) -> AsyncIterator[str]:
+        """
+        读取对话流，先补发 last_seq 之后的帧，再跟随生成直至结束。
+
+        :param stream_id: 对话流ID。
+        :param conv_id: 请求的会话ID，须与对话流所属会话一致。
+        :param last_seq: 客户端已收到的最后一帧序号。
+        :return: SSE 帧异步迭代器
+        """
+        key = cls._key(stream_id)
+        attach_key = cls._attach_key(stream_id)
+        attach_timeout = int(get_config("chat.resumable_stream.attach_timeout", default_resumable_stream_attach_timeout))
+        block_ms = int(get_config("chat.resumable_stream.block_ms", default_resumable_stream_block_ms))
+        last_id = f"0-{last_seq}"
+        owner = await stream_redis_util.client.get(cls._owner_key(stream_id))
+        if owner is None or owner.decode() != conv_id:
+            # 不区分 不存在 与 不属于该会话 避免泄露其他会话的对话流
+            yield SSEUtil.format_event(event="ERROR", text="对话流不存在或已过期")
+            return
+        while True:
+            # 续期连接标记 保持生成(仅续期仍存在的标记 生成结束后删除的标记不会被重新创建)
+            pipe = stream_redis_util.pipeline(transaction=False)
+            pipe.set(attach_key, 1, ex=attach_timeout, xx=True)
+            pipe.exists(key, cls._producing_key(stream_id))
+            _, exists_count = await pipe.execute()
+            if not exists_count:
+                yield SSEUtil.format_event(event="ERROR", text="对话流不存在或已过期")
+                return
+
+            response = await stream_redis_util.client.xread({key: last_id}, count=100, block=block_ms)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id.decode()
+                    if fields.get(b"state") == STREAM_EOF:
+                        return
+                    seq = last_id.split("-", 1)[1]
+                    yield f"id: {stream_id}:{seq}\n{fields[b'frame'].decode()}"
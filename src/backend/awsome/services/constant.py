@@ -93,4 +93,90 @@ memory_config = {
         }
     },
     "version": "v1.1"  # v1.1配置支持Graph
-}
\ No newline at end of file
+}
+
+"""
+对话配置默认值
+"""
+# 对话前置阶段默认超时时间(秒)
+default_stage_timeout = 3
+# 历史记录默认 token 预算
+default_history_token_budget = 3000
+# 历史记录单次加载的最大消息数
+default_history_max_messages = 100
+# 滚动摘要最大生成 token 数
+default_summary_max_tokens = 500
+# 单次滚动摘要请求中对话内容的最大 token 数
+default_summary_input_tokens = 4000
+# 语义缓存回放时每个流式事件的字符数
+semantic_cache_replay_chunk_size = 32
+# 流式响应合并时间窗口(毫秒)
+default_sse_flush_interval_ms = 20
+# 流式响应合并字节上限
+default_sse_flush_bytes = 256
+# 可续传对话流结束后的保留时间(秒)
+default_resumable_stream_ttl = 300
+# 可续传对话流无连接读取时终止生成的等待时间(秒)
+default_resumable_stream_attach_timeout = 15
+# 可续传对话流单次阻塞读取时长(毫秒)
+default_resumable_stream_block_ms = 5000
+# 模型路由对冲请求延迟取首选模型首token延迟的分位数
+default_hedge_percentile = 0.95
+# 模型路由对冲请求延迟下限(毫秒)
+default_hedge_min_delay_ms = 300
+# 模型路由对冲请求延迟上限(毫秒) 首选模型无延迟样本时使用
+default_hedge_max_delay_ms = 3000
+# 模型路由统计滚动窗口大小
+default_router_window_size = 100
+# 模型路由错误率超过该值的候选降级排序
+default_router_max_error_rate = 0.5
+# 模型路由候选配置缓存时间(秒)
+default_router_model_cfg_ttl = 60
+# 消息延迟写入单批最大条数
+default_write_behind_batch_size = 200
+# 消息延迟写入合并时间窗口(毫秒)
+default_write_behind_flush_interval_ms = 10
+# 消息延迟写入队列容量 队列满时提交方等待
+default_write_behind_max_queue_size = 10000
+# 检索门控 寒暄/致谢/应答类短语(匹配时忽略标点、空白及大小写) 消息完全由这些短语组成时跳过全部检索
+default_gate_chitchat_phrases = (
+    "你好", "您好", "嗨", "哈喽", "在吗", "在不在", "早上好", "中午好", "下午好", "晚上好", "晚安",
+    "谢谢", "谢谢你", "多谢", "感谢", "非常感谢", "太感谢", "辛苦了", "好的", "好", "嗯", "行", "可以", "收到", "明白",
+    "懂了", "知道了", "没问题", "不客气", "不用了", "再见", "拜拜", "哈", "厉害", "棒", "对", "是的", "ok",
+    "hi", "hello", "hey", "thanks", "thankyou", "thanksalot", "thankssomuch", "thx", "okay", "yes", "no",
+    "bye", "goodbye", "cool", "great", "nice", "gotit", "good", "sure",
+)
+# 知识库召回上下文 token 预算
+default_kb_context_token_budget = 2000
+# 模型请求等待准入的最长时间(毫秒) 预计等待超过该值时立即拒绝
+default_admission_max_wait_ms = 3000
+# 每个模型/供应商的准入等待队列容量
+default_admission_max_queue_size = 100
+# 未指定 max_tokens 时按该值预估输出 token 数
+default_admission_completion_tokens = 500
+# 用量记录单批最大条数
+default_usage_batch_size = 200
+# 用量记录合并时间窗口(毫秒)
+default_usage_flush_interval_ms = 1000
+# 用量记录队列容量 队列满时提交方等待
+default_usage_max_queue_size = 10000
+# 检索专用线程池最大线程数(向量化/Milvus/ES 同步调用)
+default_retrieval_max_workers = 16
+# 知识库召回融合排序方式 rrf: 倒数排名融合 weighted: 归一化分数加权 none: 不融合
+default_fusion_method = "rrf"
+# RRF 平滑常数
+default_fusion_rrf_k = 60
+# 每个集合/索引的召回候选数量
+default_fusion_candidate_top_k = 10
+# 融合后保留的召回数量
+default_fusion_top_k = 5
+# 重排序候选数量(融合后取前 N 条参与重排序)
+default_rerank_candidate_top_k = 20
+# 重排序时间预算(毫秒) 超时按融合排名返回
+default_rerank_budget_ms = 300
+# 重排序接口请求超时(秒)
+default_rerank_http_timeout = 5
+# 查询向量进程内缓存最大条数
+default_embedding_cache_max_entries = 2048
+# 查询向量 Redis 缓存过期时间(秒)
+default_embedding_cache_ttl = 86400
@@ -0,0 +1,195 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from awsome.models.schemas.retriever import RetrieverResult
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
+from awsome.utils.token_util import TokenUtil
+
+packer_saved_tokens_histogram = metrics.histogram(
+    "awsome_context_packer_saved_tokens",
+    "知识库上下文打包相比直接拼接全部召回片段节省的 token 数",
+    buckets=(0, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+)
+packer_used_tokens_histogram = metrics.histogram(
+    "awsome_context_packer_used_tokens",
+    "知识库上下文打包后的 token 数",
+    buckets=(0, 100, 200, 500, 1000, 2000, 4000, 8000, 16000)
+)
+
+# 判定重叠时用于定位的最短前缀长度 过短的公共片段视为巧合不做裁剪
+_MIN_OVERLAP = 16
+# 剩余预算不足该值时不再截断填充
+_MIN_FILL_TOKENS = 64
+
+
+class PackedContext:
+    def __init__(self, text: str, results: List[RetrieverResult], used_tokens: int, raw_tokens: int):
+        """
+        上下文打包结果。
+        :param text: 拼接到提示词的上下文
+        :param results: 被选入上下文的召回结果
+        :param used_tokens: 上下文 token 数
+        :param raw_tokens: 直接拼接全部召回片段的 token 数
+        """
+        self.text = text
+        self.results = results
+        self.used_tokens = used_tokens
+        self.raw_tokens = raw_tokens
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.raw_tokens - self.used_tokens, 0)
+
+
+class _Segment:
+    """同一文件内相邻分片合并后的片段"""
+
+    def __init__(self, title: str, rank: int):
+        self.title = title
+        self.rank = rank
+        self.texts: List[str] = []
+        self.results: List[RetrieverResult] = []
+
+    def append(self, result: RetrieverResult, rank: int):
+        self.rank = min(self.rank, rank)
+        self.results.append(result)
+        text = ContextPacker.chunk_content(result)
+        if self.texts:
+            text = text[ContextPacker.overlap_length(self.texts[-1], text):]
+        if text:
+            self.texts.append(text)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.texts)
+
+
+class ContextPacker:
+    """
+    知识库上下文打包。
+    按 file_id/chunk_index 去重并合并同一文件的相邻分片(去除 Milvus 文本的文件名前缀后裁剪分片间的重叠文本)，
+    再按召回排名依次填充 token 预算，超出预算的片段跳过或截断。
+    """
+
+    @staticmethod
+    def format_chunk(title: str, text: str) -> str:
+        return f"Title: {title}\nContent: {text}\n\n"
+
+    @staticmethod
+    def chunk_content(result: RetrieverResult) -> str:
+        """返回分片正文：Milvus 入库文本为 "文件名:分片"，去除文件名前缀(标题单独输出)"""
+        text = result.text or ""
+        prefix = f"{(result.metadata or {}).get('title') or ''}:"
+        if result.source == "milvus" and prefix != ":" and text.startswith(prefix):
+            return text[len(prefix):]
+        return text
+
+    @staticmethod
+    def overlap_length(previous: str, current: str) -> int:
+        """返回 previous 的后缀与 current 的前缀重叠的最大长度"""
+        max_length = min(len(previous), len(current))
+        if max_length < _MIN_OVERLAP:
+            return 0
+        probe = current[:_MIN_OVERLAP]
+        start = len(previous) - max_length
+        while True:
+            position = previous.find(probe, start)
+            if position < 0:
+                return 0
+            length = len(previous) - position
+            if current.startswith(previous[position:]):
+                return length
+            start = position + 1
+
+    @staticmethod
+    def _rank(results: List[RetrieverResult]) -> List[Tuple[int, RetrieverResult]]:
+        """
+        计算召回排名。
+        已融合排序或重排序的结果直接取其在列表中的名次；
+        否则不同来源(向量相似度/BM25)及度量方式的分数不可直接比较，
+        因此取结果在其所属集合/索引中的名次，名次相同时保持原顺序。
+        """
+        if results and all(result.fused_score is not None or result.rerank_score is not None for result in results):
+            return list(enumerate(results))
+        positions: Dict[Tuple[str, str], int] = defaultdict(int)
+        ranked = []
+        for result in results:
+            key = (result.source, result.name)
+            ranked.append((positions[key], result))
+            positions[key] += 1
+        return sorted(ranked, key=lambda item: item[0])
+
+    @classmethod
+    def _build_segments(cls, results: List[RetrieverResult]) -> List[_Segment]:
+        best: Dict[Tuple, Tuple[int, RetrieverResult]] = {}
+        for rank, result in cls._rank(results):
+            metadata = result.metadata or {}
+            file_id, chunk_index = metadata.get("file_id"), metadata.get("chunk_index")
+            key = (file_id, int(chunk_index)) if file_id and chunk_index is not None else (result.source, result.id)
+            # 同一分片被多路召回时保留排名最高的一条
+            if key not in best:
+                best[key] = (rank, result)
+
+        segments: List[_Segment] = []
+        by_file: Dict[str, List[Tuple[int, int, RetrieverResult]]] = defaultdict(list)
+        for key, (rank, result) in best.items():
+            if isinstance(key[1], int) and (result.metadata or {}).get("file_id"):
+                by_file[key[0]].append((key[1], rank, result))
+            else:
+                segment = _Segment((result.metadata or {}).get("title", ""), rank)
+                segment.append(result, rank)
+                segments.append(segment)
+        for chunks in by_file.values():
+            chunks.sort(key=lambda item: item[0])
+            segment, previous_index = None, None
+            for chunk_index, rank, result in chunks:
+                if segment is None or chunk_index != previous_index + 1:
+                    segment = _Segment((result.metadata or {}).get("title", ""), rank)
+                    segments.append(segment)
+                segment.append(result, rank)
+                previous_index = chunk_index
+        segments.sort(key=lambda item: item.rank)
+        return segments
+
+    @classmethod
+    def pack(cls, results: List[RetrieverResult], token_budget: int, model: Optional[str] = None) -> PackedContext:
+        """
+        打包召回结果。
+
+        :param results: 召回结果(各来源内按相关性排序)
+        :param token_budget: 上下文 token 预算
+        :param model: 模型名称，用于选择分词器
+        :return: 打包结果
+        """
+        raw_tokens = sum(
+            TokenUtil.count_tokens(cls.format_chunk((result.metadata or {}).get("title", ""), result.text or ""), model)
+            for result in results
+        )
+        parts: List[str] = []
+        selected: List[RetrieverResult] = []
+        used_tokens = 0
+        for segment in cls._build_segments(results):
+            chunk = cls.format_chunk(segment.title, segment.text)
+            tokens = TokenUtil.count_tokens(chunk, model)
+            remaining = token_budget - used_tokens
+            if tokens > remaining:
+                if remaining < _MIN_FILL_TOKENS:
+                    continue
+                # 预算不足以容纳完整片段时截断正文
+                overhead = TokenUtil.count_tokens(cls.format_chunk(segment.title, ""), model)
+                text = TokenUtil.truncate(segment.text, remaining - overhead, model)
+                if not text:
+                    continue
+                chunk = cls.format_chunk(segment.title, text)
+                tokens = TokenUtil.count_tokens(chunk, model)
+            parts.append(chunk)
+            selected.extend(segment.results)
+            used_tokens += tokens
+
+        packed = PackedContext("".join(parts), selected, used_tokens, raw_tokens)
+        packer_used_tokens_histogram.observe(packed.used_tokens)
+        packer_saved_tokens_histogram.observe(packed.saved_tokens)
+        logger_util.debug(f"知识库上下文打包: 召回 {len(results)} 条 {raw_tokens} tokens -> "
+                          f"{len(selected)} 条 {used_tokens} tokens, 节省 {packed.saved_tokens} tokens")
+        return packed
@@ -0,0 +1,173 @@
+import asyncio
+from typing import List, Dict, Optional, Tuple
+
+from awsome.models.dao.conversations import ConversationDao
+from awsome.models.dao.messages import MessageDao
+from awsome.services.base import BaseService
+from awsome.services.constant import default_history_token_budget, default_history_max_messages, \
+    default_summary_max_tokens, default_summary_input_tokens
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.model_factory import ModelFactory
+from awsome.utils.token_util import TokenUtil, MESSAGE_TOKEN_OVERHEAD
+
+SUMMARY_PROMPT = """你是对话摘要助手。请将【已有摘要】与【新增对话】合并为一份简洁的中文摘要，
+保留用户的身份信息、偏好、关键事实、结论以及尚未解决的问题，不要编造内容，不超过300字。
+
+【已有摘要】
+{summary}
+
+【新增对话】
+{dialogue}"""
+
+
+class HistoryService(BaseService):
+    """
+    历史记录构建服务。
+    在模型的 token 预算内保留最新的若干轮原文，更早的消息由后台任务折叠为滚动摘要并保存在会话上。
+    最新一条消息单独超出预算时截断保留，不丢弃全部上下文。
+    """
+    # 正在进行摘要的会话ID 避免同一会话重复提交摘要任务
+    _summarizing = set()
+    # 持有后台任务引用 防止任务被回收
+    _background_tasks = set()
+
+    @classmethod
+    def get_token_budget(cls, model: str) -> int:
+        """获取模型的历史记录 token 预算，支持按模型名覆盖"""
+        model_token_budget = get_config("chat.history.model_token_budget") or {}
+        if model in model_token_budget:
+            return int(model_token_budget[model])
+        return int(get_config("chat.history.token_budget", default_history_token_budget))
+
+    @classmethod
+    async def build_history(cls, conv_id: str, model: str, summary: Optional[str] = None,
+                            summary_until: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+        """
+        构建预算内的 OpenAI 格式历史消息。
+
+        :param conv_id: 会话ID。
+        :param model: 会话使用的模型，用于计算 token 及预算。
+        :param summary: 会话已有的滚动摘要。
+        :param summary_until: 滚动摘要覆盖到的最后一条消息ID。
+        :return: (历史消息列表, token 统计信息)
+        """
+        max_messages = int(get_config("chat.history.max_messages", default_history_max_messages))
+        rows = await cls._load_messages(conv_id, max_messages)
+
+        # 跳过已被摘要覆盖的消息 摘要边界不在加载范围内时视为全部消息均未被覆盖
+        start = 0
+        if summary and summary_until:
+            for index, row in enumerate(rows):
+                if row["id"] == summary_until:
+                    start = index + 1
+                    break
+
+        budget = cls.get_token_budget(model)
+        summary_message = cls._summary_message(summary)
+        summary_tokens = TokenUtil.count_message_tokens(summary_message, model) if summary_message else 0
+        turn_tokens = [TokenUtil.count_message_tokens(row, model) for row in rows]
+
+        # 从最新消息开始向前填充预算
+        window_start = len(rows)
+        used_tokens = summary_tokens
+        while window_start > start and used_tokens + turn_tokens[window_start - 1] <= budget:
+            window_start -= 1
+            used_tokens += turn_tokens[window_start]
+
+        history_messages = [{"role": row["role"], "content": row["content"]} for row in rows[window_start:]]
+        # 最新一条消息单独超出剩余预算 截断后保留
+        remaining = budget - used_tokens - MESSAGE_TOKEN_OVERHEAD
+        if window_start == len(rows) > start and remaining > 0:
+            row = rows[-1]
+            content = TokenUtil.truncate(row["content"], remaining, model)
+            if content:
+                history_messages.append({"role": row["role"], "content": content})
+                window_start -= 1
+                turn_tokens[window_start] = TokenUtil.count_message_tokens(history_messages[-1], model)
+                used_tokens += turn_tokens[window_start]
+
+        # 预算外且尚未被摘要覆盖的消息 提交后台摘要
+        if window_start > start:
+            cls._schedule_summary(conv_id, model, summary, rows[start:window_start])
+
+        if summary_message:
+            history_messages.insert(0, summary_message)
+
+        stats = {
+            "budget": budget,
+            "history_tokens": used_tokens,
+            "summary_tokens": summary_tokens,
+            "turn_tokens": turn_tokens[window_start:],
+            "dropped_messages": window_start - start,
+        }
+        return history_messages, stats
+
+    @classmethod
+    async def _load_messages(cls, conv_id: str, limit: int) -> List[Dict]:
+        return await MessageDao.get_recent_history(conv_id, limit)
+
+    @classmethod
+    def _summary_message(cls, summary: Optional[str]) -> Optional[Dict]:
+        if not summary:
+            return None
+        return {"role": "system", "content": f"【历史对话摘要】\n{summary}"}
+
+    @classmethod
+    def _schedule_summary(cls, conv_id: str, model: str, summary: Optional[str], rows: List[Dict]):
+        """提交后台摘要任务，同一会话同时只运行一个"""
+        if conv_id in cls._summarizing:
+            return
+        cls._summarizing.add(conv_id)
+        task = asyncio.create_task(cls._summarize(conv_id, model, summary, rows))
+        cls._background_tasks.add(task)
+        task.add_done_callback(cls._background_tasks.discard)
+
+    @classmethod
+    def _dialogue_batches(cls, rows: List[Dict], model: str, max_tokens: int) -> List[Tuple[str, str]]:
+        """
+        将消息按 token 上限分批拼接为对话文本，单条消息超出上限时截断。
+
+        :return: [(对话文本, 该批最后一条消息ID)]
+        """
+        batches = []
+        lines, used_tokens = [], 0
+        for row in rows:
+            line = f"{row['role']}: {row['content']}"
+            tokens = TokenUtil.count_tokens(line, model)
+            if tokens > max_tokens:
+                line = TokenUtil.truncate(line, max_tokens, model)
+                tokens = TokenUtil.count_tokens(line, model)
+            if lines and used_tokens + tokens > max_tokens:
+                batches.append(("\n".join(lines), last_id))
+                lines, used_tokens = [], 0
+            lines.append(line)
+            used_tokens += tokens
+            last_id = row["id"]
+        if lines:
+            batches.append(("\n".join(lines), last_id))
+        return batches
+
+    @classmethod
+    async def _summarize(cls, conv_id: str, model: str, summary: Optional[str], rows: List[Dict]):
+        try:
+            client = ModelFactory.create_client(llm_name=model)
+            max_input_tokens = int(get_config("chat.history.summary_input_tokens", default_summary_input_tokens))
+            # 对话内容超出单次请求上限时分批 依次折叠进摘要 每批完成后保存进度
+            for dialogue, last_id in cls._dialogue_batches(rows, model, max_input_tokens):
+                response = await client.generate_text(
+                    messages=[{"role": "user",
+                               "content": SUMMARY_PROMPT.format(summary=summary or "无", dialogue=dialogue)}],
+                    temperature=0.1,
+                    max_tokens=int(get_config("chat.history.summary_max_tokens", default_summary_max_tokens)),
+                )
+                new_summary = (response.choices[0].message.content or "").strip()
+                if not new_summary:
+                    break
+                summary = new_summary
+                await ConversationDao.update_summary(conv_id, summary, last_id)
+            logger_util.debug(f"会话 {conv_id} 折叠 {len(rows)} 条消息至滚动摘要")
+        except Exception as e:
+            logger_util.error(f"会话 {conv_id} 生成滚动摘要失败: {e}")
+        finally:
+            cls._summarizing.discard(conv_id)
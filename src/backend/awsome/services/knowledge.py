@@ -2,6 +2,8 @@ import json
 
 from awsome.models.v1.knowledge import KnowledgeCreate, KnowledgeUpdate
 from awsome.services.base import BaseService
+from awsome.services.semantic_cache import SemanticCacheService
+from awsome.models.dao.conversations import ConversationDao
 from awsome.models.dao.knowledge import KnowledgeDao
 from awsome.utils.elasticsearch_util import ElasticSearchUtil
 from awsome.utils.milvus_util import MilvusUtil
@@ -11,6 +13,7 @@ from fastapi import HTTPException
 import uuid
 from awsome.services.constant import redis_default_model_key
 from awsome.models.schemas.response import PageModel
+from awsome.settings import get_config
 
 # 实例化milvus
 milvus_client = MilvusUtil()
@@ -35,13 +38,20 @@ class KnowledgeService(BaseService):
                 raise HTTPException(status_code=500, detail=f"未设置默认模型配置")
             knowledge_create.model = json.loads(redis_util.get(redis_default_model_key)).get("embedding_name")
         try:
-            # 创建MilvusCollection
-            milvus_client.create_collection(new_milvus_collection_name,  # 集合名
-                                            milvus_default_fields_1024)  # 属性
-            # 创建MilvusIndex
-            milvus_client.create_index_on_field(new_milvus_collection_name,  # 集合名
-                                                "vector",  # 创建索引的属性
-                                                milvus_default_index_params)  # 索引参数
+            if get_config("storage.milvus.shared_collection", False):
+                # 共享集合 同维度知识库共用一个集合 按 knowledge_id 分区
+                new_milvus_collection_name = milvus_client.shared_collection_name(1024)
+                milvus_client.ensure_collection(new_milvus_collection_name,
+                                                milvus_default_fields_1024,
+                                                milvus_default_index_params)
+            else:
+                # 创建MilvusCollection
+                milvus_client.create_collection(new_milvus_collection_name,  # 集合名
+                                                milvus_default_fields_1024)  # 属性
+                # 创建MilvusIndex
+                milvus_client.create_index_on_field(new_milvus_collection_name,  # 集合名
+                                                    "vector",  # 创建索引的属性
+                                                    milvus_default_index_params)  # 索引参数
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"创建Milvus集合异常: {str(e)}")
 
@@ -71,7 +81,11 @@ class KnowledgeService(BaseService):
 
             # 删除MilvusCollection
             drop_collection_name = drop_knowledge.collection_name
-            milvus_client.delete_collection(drop_collection_name)
+            if milvus_client.is_shared_collection(drop_collection_name):
+                # 共享集合仅删除该知识库的向量
+                milvus_client.delete_collection_file(drop_collection_name, f"knowledge_id == '{id}'")
+            else:
+                milvus_client.delete_collection(drop_collection_name)
 
             # ES索引存在 同步删除ES索引
             drop_es_index_name = drop_knowledge.index_name
@@ -80,13 +94,18 @@ class KnowledgeService(BaseService):
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"删除Milvus集合异常: {str(e)}")
         await KnowledgeDao.delete_by_id(id)
+        # 知识库删除 语义缓存及绑定会话的配置缓存失效
+        SemanticCacheService.bump_kb_version(id)
+        await ConversationDao.invalidate_config_by_knowledge(id)
         return True
 
     @classmethod
     async def update_knowledge(cls, knowledge_update: KnowledgeUpdate):
-        return await KnowledgeDao.update(knowledge_update.id,
-                                         knowledge_update.name,
-                                         knowledge_update.desc)
+        knowledge = await KnowledgeDao.update(knowledge_update.id,
+                                              knowledge_update.name,
+                                              knowledge_update.desc)
+        await ConversationDao.invalidate_config_by_knowledge(knowledge_update.id)
+        return knowledge
 
     @classmethod
     async def list_knowledge_by_page(cls, page, size):
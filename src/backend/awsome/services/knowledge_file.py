@@ -5,6 +5,7 @@ from awsome.models.dao.knowledge_file import KnowledgeFile
 from awsome.models.schemas.response import PageModel
 from awsome.models.v1.knowledge_file import UploadFileInfo
 from awsome.services.base import BaseService
+from awsome.services.semantic_cache import SemanticCacheService
 from awsome.utils.milvus_util import MilvusUtil
 from awsome.utils.elasticsearch_util import ElasticSearchUtil
 from awsome.utils.minio_util import MinioUtil
@@ -79,6 +80,9 @@ class KnowledgeFileService(BaseService):
         delete_kb_info: Knowledge = await KnowledgeDao.select(delete_kb_file_info.kb_id)
         # 删除Milvus中文件
         delete_expr = f"file_id == '{kb_file_id}'"
+        if milvus_client.is_shared_collection(delete_kb_info.collection_name):
+            # 共享集合按分区键过滤 仅扫描该知识库的分区
+            delete_expr = f"knowledge_id == '{delete_kb_info.id}' and {delete_expr}"
         milvus_client.delete_collection_file(delete_kb_info.collection_name, delete_expr)
         # 删除ES中文件
         delete_query = {
@@ -93,3 +97,5 @@ class KnowledgeFileService(BaseService):
         es_client.delete_documents(delete_kb_info.index_name, delete_query)
         # 删除数据库文件记录
         await KnowledgeFileDao.delete_by_kb_file_id(kb_file_id)
+        # 知识库内容变化 语义缓存失效
+        SemanticCacheService.bump_kb_version(delete_kb_file_info.kb_id)
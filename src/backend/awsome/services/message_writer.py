@@ -0,0 +1,60 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from awsome.models.dao.messages import MessageDao, new_message_id
+from awsome.services.constant import default_write_behind_batch_size, default_write_behind_flush_interval_ms, \
+    default_write_behind_max_queue_size
+from awsome.settings import get_config
+from awsome.utils.batch_writer_util import BatchWriter
+from awsome.utils.metrics_util import metrics
+
+write_batch_histogram = metrics.histogram(
+    "awsome_message_write_batch_size",
+    "延迟写入模式下每个事务写入的消息数",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+
+
+class MessageWriter(BatchWriter):
+    """
+    消息延迟写入(write-behind)。
+    消息先进入进程内有界队列，由后台任务合并为多行 INSERT 批量提交；
+    提交成功后对应的 Future 返回消息ID，调用方需在确认(END 事件)前等待该 Future，以保证已确认的消息均已落库。
+    """
+
+    def __init__(self):
+        super().__init__(
+            name="消息延迟写入",
+            batch_size=int(get_config("chat.write_behind.batch_size", default_write_behind_batch_size)),
+            flush_interval=int(
+                get_config("chat.write_behind.flush_interval_ms", default_write_behind_flush_interval_ms)) / 1000,
+            max_queue_size=int(get_config("chat.write_behind.max_queue_size", default_write_behind_max_queue_size)),
+            batch_histogram=write_batch_histogram
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(get_config("chat.write_behind.enabled", False))
+
+    async def submit(self, conv_id: str, role: str, content: str, source: Optional[str],
+                     truncated: int = 0) -> asyncio.Future:
+        """
+        提交一条消息，队列已满时等待。
+
+        :return: Future，写入成功后结果为消息ID，写入失败时抛出异常
+        """
+        return await self.put({
+            "id": new_message_id(),
+            "conv_id": conv_id,
+            "role": role,
+            "content": content,
+            "source": source,
+            "truncated": truncated,
+        })
+
+    async def _write(self, items: List[Dict]) -> List[str]:
+        await MessageDao.create_messages(items)
+        return [row["id"] for row in items]
+
+
+message_writer = MessageWriter()
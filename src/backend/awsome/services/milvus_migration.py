@@ -0,0 +1,132 @@
+"""
+知识库向量迁移：将独立集合(c_awsome_<uuid>)中的向量迁移到同维度的共享集合(c_awsome_shared_<维度>)。
+存在未完成向量化文件的知识库默认跳过(--force 强制迁移)；排队中的向量化任务执行时会读取知识库当前的集合名称。
+重复执行是安全的：写入前先清除共享集合中该知识库的已有向量。
+
+python -m awsome.services.milvus_migration [--kb-id ID ...] [--batch-size 1000] [--drop] [--dry-run] [--force]
+"""
+import argparse
+import asyncio
+from typing import List, Optional
+
+from pymilvus import Collection
+
+from awsome.models.dao import *  # 确保已加载全部DAO
+from awsome.models.dao.conversations import ConversationDao
+from awsome.models.dao.knowledge import Knowledge, KnowledgeDao
+from awsome.models.dao.knowledge_file import KnowledgeFileDao
+from awsome.services.constant import milvus_default_fields_768, milvus_default_fields_1024, \
+    milvus_default_index_params
+from awsome.services.semantic_cache import SemanticCacheService
+from awsome.utils.logger_util import logger_util
+from awsome.utils.milvus_util import MilvusUtil
+
+_DEFAULT_FIELDS = {1024: milvus_default_fields_1024, 768: milvus_default_fields_768}
+
+
+def _count(collection: Collection, expr: str = "") -> int:
+    return int(collection.query(expr=expr, output_fields=["count(*)"])[0]["count(*)"])
+
+
+def _vector_dim(collection: Collection) -> Optional[int]:
+    for field in collection.schema.fields:
+        if field.name == "vector":
+            return int(field.params.get("dim"))
+    return None
+
+
+def _copy(source: Collection, target: Collection, kb_id: str, batch_size: int) -> int:
+    """分批读取源集合全部向量写入共享集合，统一写入 knowledge_id"""
+    fields = [field.name for field in source.schema.fields if not field.is_primary]
+    iterator = source.query_iterator(batch_size=batch_size, expr="", output_fields=fields)
+    copied = 0
+    try:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                break
+            target.insert([{**{name: row[name] for name in fields}, "knowledge_id": kb_id} for row in batch])
+            copied += len(batch)
+            logger_util.debug(f"知识库 {kb_id} 已迁移 {copied} 条")
+    finally:
+        iterator.close()
+    target.flush()
+    return copied
+
+
+async def migrate_knowledge(knowledge: Knowledge, batch_size: int = 1000, drop: bool = False,
+                            dry_run: bool = False, force: bool = False) -> int:
+    """
+    迁移单个知识库。
+
+    :param knowledge: 知识库
+    :param batch_size: 每批读取/写入条数
+    :param drop: 迁移并校验成功后删除源集合
+    :param dry_run: 仅打印迁移计划
+    :param force: 存在未完成向量化的文件时仍然迁移
+    :return: 迁移条数
+    """
+    source_name = knowledge.collection_name
+    if MilvusUtil.is_shared_collection(source_name):
+        logger_util.info(f"知识库 {knowledge.id} 已使用共享集合 {source_name}，跳过")
+        return 0
+    if not source_name or not MilvusUtil.check_collection_exists(source_name):
+        logger_util.warning(f"知识库 {knowledge.id} 的集合 {source_name} 不存在，跳过")
+        return 0
+    pending = await KnowledgeFileDao.cnt_pending_by_kb_id(knowledge.id)
+    if pending and not force:
+        # 执行中的向量化任务可能仍在向源集合写入 迁移后这部分向量将丢失
+        logger_util.warning(f"知识库 {knowledge.id} 有 {pending} 个文件未完成向量化，跳过(可使用 --force 强制迁移)")
+        return 0
+
+    source = Collection(source_name)
+    dim = _vector_dim(source)
+    if dim not in _DEFAULT_FIELDS:
+        logger_util.warning(f"知识库 {knowledge.id} 的集合 {source_name} 向量维度 {dim} 无默认字段定义，跳过")
+        return 0
+    target_name = MilvusUtil.shared_collection_name(dim)
+    MilvusUtil.load_collection(source_name)
+    total = _count(source)
+    logger_util.info(f"知识库 {knowledge.id}({knowledge.name}): {source_name} -> {target_name}, {total} 条")
+    if dry_run:
+        return total
+
+    MilvusUtil.ensure_collection(target_name, _DEFAULT_FIELDS[dim], milvus_default_index_params)
+    kb_expr = f"knowledge_id == '{knowledge.id}'"
+    # 清除上次中断残留的向量
+    MilvusUtil.delete_collection_file(target_name, kb_expr)
+    target = Collection(target_name)
+    copied = _copy(source, target, knowledge.id, batch_size)
+    migrated = _count(target, kb_expr)
+    if copied != total or migrated != total:
+        raise RuntimeError(f"知识库 {knowledge.id} 迁移校验失败: 源 {total} 条, 读取 {copied} 条, 写入 {migrated} 条")
+
+    await KnowledgeDao.update_collection_name(knowledge.id, target_name)
+    # 会话配置缓存中记录了集合名称
+    await ConversationDao.invalidate_config_by_knowledge(knowledge.id)
+    SemanticCacheService.bump_kb_version(knowledge.id)
+    if drop:
+        MilvusUtil.delete_collection(source_name)
+    logger_util.info(f"知识库 {knowledge.id} 迁移完成 {migrated} 条")
+    return migrated
+
+
+async def main(kb_ids: Optional[List[str]], batch_size: int, drop: bool, dry_run: bool, force: bool):
+    MilvusUtil()  # 建立连接
+    knowledge_list = await KnowledgeDao.get_many(kb_ids) if kb_ids else await KnowledgeDao.select()
+    total = 0
+    for knowledge in knowledge_list:
+        total += await migrate_knowledge(knowledge, batch_size=batch_size, drop=drop, dry_run=dry_run,
+                                        force=force)
+    logger_util.info(f"{'计划' if dry_run else '完成'}迁移 {len(knowledge_list)} 个知识库 共 {total} 条向量")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="将知识库独立集合迁移到共享分区键集合")
+    parser.add_argument("--kb-id", action="append", dest="kb_ids", help="仅迁移指定知识库 可重复指定")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批读取/写入条数")
+    parser.add_argument("--drop", action="store_true", help="迁移并校验成功后删除源集合")
+    parser.add_argument("--dry-run", action="store_true", help="仅打印迁移计划")
+    parser.add_argument("--force", action="store_true", help="存在未完成向量化的文件时仍然迁移")
+    args = parser.parse_args()
+    asyncio.run(main(args.kb_ids, args.batch_size, args.drop, args.dry_run, args.force))
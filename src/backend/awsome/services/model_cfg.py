@@ -4,6 +4,7 @@ from awsome.models.v1.model_cfg import ModelCfgCreate
 from awsome.services.base import BaseService
 from awsome.models.dao.model_cfg import ModelCfgDao
 from awsome.models.dao.model_cfg import ModelCfg
+from awsome.services.model_router import ModelRouter
 from awsome.utils.tools import EncryptionTool
 
 encryption_tool = EncryptionTool()
@@ -17,7 +18,9 @@ class ModelCfgService(BaseService):
 
     @classmethod
     def delete_model_cfg(cls, id):
-        return ModelCfgDao.delete_by_id(id)
+        result = ModelCfgDao.delete_by_id(id)
+        ModelRouter.invalidate_model_cfg(id)
+        return result
 
     @classmethod
     def get_model_cfg(cls):
@@ -0,0 +1,282 @@
+import asyncio
+import time
+from collections import deque
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from awsome.models.dao.model_cfg import ModelCfgDao
+from awsome.services.admission import AdmissionRejected
+from awsome.services.base import BaseService
+from awsome.services.constant import default_hedge_percentile, default_hedge_min_delay_ms, \
+    default_hedge_max_delay_ms, default_router_window_size, default_router_max_error_rate, \
+    default_router_model_cfg_ttl
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
+from awsome.utils.model_factory import ModelFactory
+from awsome.utils.tools import EncryptionTool
+
+encryption_tool = EncryptionTool()
+
+route_attempt_counter = metrics.counter(
+    "awsome_model_router_attempts_total",
+    "模型路由发起的请求数 kind: primary/hedge/fallback",
+    labelnames=("candidate", "kind")
+)
+route_result_counter = metrics.counter(
+    "awsome_model_router_results_total",
+    "模型路由请求结果 result: win/error/lost(先发起但被对冲请求超过)/cancelled",
+    labelnames=("candidate", "result")
+)
+
+
+class RouteCandidate:
+    def __init__(self, name: str, config: Dict, index: int):
+        """
+        路由候选模型。
+        :param name: 候选名称 {model_cfg_id}:{llm_name}，用于统计及指标
+        :param config: ModelFactory 模型配置
+        :param index: 配置顺序
+        """
+        self.name = name
+        self.config = config
+        self.index = index
+
+
+class CandidateStats:
+    """候选模型滚动窗口统计：首 token 延迟及成功/失败"""
+
+    def __init__(self, window_size: int):
+        self.ttft = deque(maxlen=window_size)
+        self.outcomes = deque(maxlen=window_size)
+
+    def record_ttft(self, seconds: float):
+        self.ttft.append(seconds)
+
+    def record_outcome(self, success: bool):
+        self.outcomes.append(success)
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def ttft_percentile(self, percentile: float) -> Optional[float]:
+        if not self.ttft:
+            return None
+        return float(np.percentile(self.ttft, percentile * 100))
+
+
+class RoutedStream:
+    """路由选中的流式响应，先返回等待首 token 期间缓冲的数据块，接口与 AsyncStream 一致"""
+
+    def __init__(self, stream, buffered: List, candidate: RouteCandidate, stats: CandidateStats):
+        self.stream = stream
+        self.buffered = buffered
+        self.candidate = candidate
+        self.stats = stats
+
+    async def __aiter__(self):
+        for chunk in self.buffered:
+            yield chunk
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        except Exception:
+            # 首 token 之后的失败无法切换 仅计入错误率
+            self.stats.record_outcome(False)
+            raise
+
+    async def close(self):
+        await self.stream.close()
+
+
+class ModelRouter(BaseService):
+    """
+    多模型配置路由。
+    候选为系统默认模型配置及 chat.routing.candidates 中配置的 ModelCfg，按滚动错误率及首 token 延迟排序。
+    首选候选在其首 token 延迟分位数内未返回 token 时向下一候选发起对冲请求，先返回 token 者胜出，另一路关闭；
+    候选在首 token 前失败时自动切换至下一候选。
+    """
+    _stats: Dict[str, CandidateStats] = {}
+    # ModelCfg 配置缓存 避免每次请求查询数据库 {model_cfg_id: (过期时间, 配置)}
+    _model_cfg_cache: Dict[str, Tuple[float, Dict]] = {}
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return bool(get_config("chat.routing.enabled", False))
+
+    @classmethod
+    def _get_stats(cls, name: str) -> CandidateStats:
+        if name not in cls._stats:
+            cls._stats[name] = CandidateStats(int(get_config("chat.routing.window_size", default_router_window_size)))
+        return cls._stats[name]
+
+    @classmethod
+    def _load_model_cfg(cls, model_cfg_id: str) -> Optional[Dict]:
+        cached = cls._model_cfg_cache.get(model_cfg_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        model_cfg = ModelCfgDao.select_one_with_provider(model_cfg_id)
+        if model_cfg is None:
+            cls._model_cfg_cache.pop(model_cfg_id, None)
+            logger_util.warning(f"路由候选模型配置不存在: {model_cfg_id}")
+            return None
+        config = {
+            "model_cfg_id": model_cfg[0],
+            "api_key": encryption_tool.decrypt(model_cfg[1]),
+            "base_url": model_cfg[2],
+            "mark": model_cfg[3],
+        }
+        # 按过期时间重新加载 其他实例修改的配置在过期后生效
+        ttl = int(get_config("chat.routing.model_cfg_ttl", default_router_model_cfg_ttl))
+        cls._model_cfg_cache[model_cfg_id] = (time.monotonic() + ttl, config)
+        return config
+
+    @classmethod
+    def invalidate_model_cfg(cls, model_cfg_id: str):
+        """模型配置修改/删除后清除本实例缓存"""
+        cls._model_cfg_cache.pop(model_cfg_id, None)
+
+    @classmethod
+    async def _candidates(cls, llm_name: str) -> List[RouteCandidate]:
+        default_config = dict(ModelFactory._get_default_model_config())
+        default_config["llm_name"] = llm_name
+        candidates = [RouteCandidate(f"{default_config.get('model_cfg_id', 'default')}:{llm_name}", default_config, 0)]
+        for item in get_config("chat.routing.candidates") or []:
+            model_cfg = await asyncio.to_thread(cls._load_model_cfg, item["model_cfg_id"])
+            if model_cfg is None:
+                continue
+            config = dict(model_cfg)
+            config["llm_name"] = item.get("llm_name") or llm_name
+            name = f"{config['model_cfg_id']}:{config['llm_name']}"
+            if name in {candidate.name for candidate in candidates}:
+                continue
+            candidates.append(RouteCandidate(name, config, len(candidates)))
+
+        # 健康的候选优先 其次按首 token 延迟中位数(无样本时视为 0 以便获得样本) 最后按配置顺序
+        max_error_rate = float(get_config("chat.routing.max_error_rate", default_router_max_error_rate))
+
+        def rank(candidate: RouteCandidate):
+            stats = cls._get_stats(candidate.name)
+            return stats.error_rate() > max_error_rate, stats.ttft_percentile(0.5) or 0.0, candidate.index
+
+        return sorted(candidates, key=rank)
+
+    @classmethod
+    def _hedge_delay(cls, candidate: RouteCandidate) -> float:
+        min_delay = int(get_config("chat.routing.hedge_min_delay_ms", default_hedge_min_delay_ms)) / 1000
+        max_delay = int(get_config("chat.routing.hedge_max_delay_ms", default_hedge_max_delay_ms)) / 1000
+        percentile = float(get_config("chat.routing.hedge_percentile", default_hedge_percentile))
+        ttft = cls._get_stats(candidate.name).ttft_percentile(percentile)
+        if ttft is None:
+            return max_delay
+        return min(max(ttft, min_delay), max_delay)
+
+    @classmethod
+    async def _open(cls, candidate: RouteCandidate, messages: List[Dict], **kwargs):
+        """发起流式请求并读取至首个 token，返回 (stream, 已读取的数据块)"""
+        start = time.perf_counter()
+        stream = None
+        try:
+            client = ModelFactory.create_client(candidate.config)
+            stream = await client.generate_text(messages=messages, stream=True, **kwargs)
+            buffered = []
+            async for chunk in stream:
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+            cls._get_stats(candidate.name).record_ttft(time.perf_counter() - start)
+            return stream, buffered
+        except asyncio.CancelledError:
+            # 被取消时未观测到首 token 不在此计入延迟样本 由路由按是否被对冲请求超过记录(见 stream_chat)
+            if stream is not None:
+                await stream.close()
+            raise
+        except Exception:
+            if stream is not None:
+                await stream.close()
+            raise
+
+    @classmethod
+    async def stream_chat(cls, llm_name: str, messages: List[Dict], **kwargs):
+        """
+        流式生成，按路由策略选择模型配置，各候选的上游调用分别经准入控制(按其供应商计入配额)。
+
+        :param llm_name: 会话使用的模型名称。
+        :param messages: OpenAI 格式消息。
+        :param kwargs: 生成参数(temperature/max_tokens 等)。
+        :return: 可 async for 迭代、可 close 的流式响应
+        :raise AdmissionRejected: 模型繁忙，未获准入
+        """
+        if not cls.is_enabled():
+            client = ModelFactory.create_client(llm_name=llm_name)
+            return await client.generate_text(messages=messages, stream=True, **kwargs)
+
+        candidates = await cls._candidates(llm_name)
+        waiting = deque(candidates)
+        pending: Dict[asyncio.Task, RouteCandidate] = {}
+        launched_at: Dict[asyncio.Task, float] = {}
+        # 胜出请求的发起时间
+        won_launched_at = None
+        last_error = None
+
+        def launch(kind: str):
+            candidate = waiting.popleft()
+            route_attempt_counter.inc(candidate=candidate.name, kind=kind)
+            task = asyncio.create_task(cls._open(candidate, messages, **kwargs))
+            pending[task] = candidate
+            launched_at[task] = time.perf_counter()
+            return candidate
+
+        current = launch("primary")
+        try:
+            while pending:
+                # 同时至多两路请求
+                hedge_delay = cls._hedge_delay(current) if waiting and len(pending) < 2 else None
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger_util.info(f"模型 {current.name} 超过 {hedge_delay:.2f}s 未返回token, 发起对冲请求")
+                    current = launch("hedge")
+                    continue
+
+                winner = None
+                for task in done:
+                    candidate = pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        # 未获准入不代表候选异常 不计入错误率
+                        if not isinstance(last_error, AdmissionRejected):
+                            cls._get_stats(candidate.name).record_outcome(False)
+                        route_result_counter.inc(candidate=candidate.name, result="error")
+                        logger_util.warning(f"模型 {candidate.name} 请求失败: {last_error}")
+                    elif winner is None:
+                        winner = (candidate, *task.result())
+                        won_launched_at = launched_at[task]
+                    else:
+                        # 同时返回的多余结果直接关闭
+                        await task.result()[0].close()
+
+                if winner is not None:
+                    candidate, stream, buffered = winner
+                    stats = cls._get_stats(candidate.name)
+                    stats.record_outcome(True)
+                    route_result_counter.inc(candidate=candidate.name, result="win")
+                    return RoutedStream(stream, buffered, candidate, stats)
+
+                if waiting:
+                    current = launch("fallback")
+        finally:
+            now = time.perf_counter()
+            for task, candidate in pending.items():
+                task.cancel()
+                if won_launched_at is not None and launched_at[task] < won_launched_at:
+                    # 先发起却被对冲请求超过 以已等待时长作为首 token 延迟样本(删失值 实际延迟不小于此)
+                    # 持续缓慢的候选延迟分位数随之升高 排序降级
+                    cls._get_stats(candidate.name).record_ttft(now - launched_at[task])
+                    route_result_counter.inc(candidate=candidate.name, result="lost")
+                else:
+                    route_result_counter.inc(candidate=candidate.name, result="cancelled")
+
+        raise last_error or ValueError("无可用的模型配置")
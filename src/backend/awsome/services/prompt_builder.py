@@ -0,0 +1,82 @@
+import re
+from typing import Dict, List, Optional
+
+# 行尾空白
+_TRAILING_SPACE_PATTERN = re.compile(r"[ \t　]+\n")
+# 连续空行
+_BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+_INSTRUCTION = """【生成要求】
+请基于下方参考内容，用自然对话的方式响应用户最新消息。注意:
+1. 不要使用"根据检索内容"、"根据资料"、"根据记忆"等暴露检索过程的表述.
+2. 不要直接引用参考内容中的标题或元数据.
+3. 若参考内容与用户需求无关，则忽略它直接回答."""
+
+# 参考内容的固定顺序及标题
+_CONTEXT_SECTIONS = (
+    ("memory", "【用户相关记忆】"),
+    ("web", "【网络检索内容】"),
+    ("kb", "【上下文参考】"),
+)
+
+
+class PromptBuilder:
+    """
+    对话提示词组装。
+    为命中供应商的前缀缓存(prompt caching)，系统提示词及历史消息逐字节保持稳定，
+    每轮变化的参考内容(知识库/网络检索/记忆)只出现在末尾的用户消息中，且按固定顺序、固定标题及统一空白格式拼接。
+    """
+
+    @staticmethod
+    def normalize(text: Optional[str]) -> str:
+        """统一换行及空白：去除首尾及行尾空白，连续空行合并为一个"""
+        if not text:
+            return ""
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        text = _TRAILING_SPACE_PATTERN.sub("\n", text)
+        return _BLANK_LINES_PATTERN.sub("\n\n", text).strip()
+
+    @classmethod
+    def compose_user_message(cls, message: str, kb_context: str = "", web_context: str = "",
+                             memory_context: str = "") -> str:
+        """
+        组装末尾的用户消息，无参考内容时为原始消息(规范化后)。
+
+        :param message: 用户消息
+        :param kb_context: 知识库召回内容
+        :param web_context: 网络检索内容
+        :param memory_context: 记忆内容
+        """
+        contexts = {"kb": cls.normalize(kb_context), "web": cls.normalize(web_context),
+                    "memory": cls.normalize(memory_context)}
+        message = cls.normalize(message)
+        if not any(contexts.values()):
+            return message
+        parts = [_INSTRUCTION]
+        for name, title in _CONTEXT_SECTIONS:
+            if contexts[name]:
+                parts.append(f"{title}\n{contexts[name]}")
+        parts.append(f"【用户最新消息】\n{message}")
+        return "\n\n".join(parts)
+
+    @classmethod
+    def build(cls, system_prompt: Optional[str], history: List[Dict], message: str, kb_context: str = "",
+              web_context: str = "", memory_context: str = "") -> List[Dict]:
+        """
+        组装 OpenAI 格式消息：系统提示词 -> 历史消息 -> 携带参考内容的用户消息。
+
+        :param system_prompt: 会话系统提示词
+        :param history: 历史消息(含滚动摘要)，内容与保存时一致
+        :param message: 用户消息
+        :param kb_context: 知识库召回内容
+        :param web_context: 网络检索内容
+        :param memory_context: 记忆内容
+        :return: 消息列表
+        """
+        messages = [{"role": "system", "content": cls.normalize(system_prompt)}]
+        messages.extend({"role": item["role"], "content": cls.normalize(item["content"])} for item in history)
+        messages.append({
+            "role": "user",
+            "content": cls.compose_user_message(message, kb_context, web_context, memory_context)
+        })
+        return messages
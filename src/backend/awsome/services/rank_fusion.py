@@ -0,0 +1,118 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from awsome.models.schemas.retriever import RetrieverResult
+from awsome.utils.logger_util import logger_util
+
+# 分数越小越相关的向量距离度量
+_LOWER_IS_BETTER_METRICS = {"L2", "HAMMING", "JACCARD"}
+FUSION_METHODS = ("rrf", "weighted")
+
+
+class RankFusion:
+    """
+    多路召回融合排序。
+    向量检索(距离)与 BM25(相关性)的分数含义和量纲不同，不可直接比较或共用阈值；
+    融合时先在各检索引擎内部排序，再按排名(RRF)或归一化分数(加权)合并为一个排序列表。
+    同一分片被多路召回时合并为一条，并记录其在各引擎中的排名。
+    """
+
+    @staticmethod
+    def _key(result: RetrieverResult) -> Tuple:
+        """分片唯一标识：优先使用 文件ID + 分片序号(各引擎一致)，否则使用 来源 + 集合/索引 + 文档ID"""
+        metadata = result.metadata or {}
+        file_id, chunk_index = metadata.get("file_id"), metadata.get("chunk_index")
+        if file_id and chunk_index is not None:
+            return file_id, int(chunk_index)
+        return result.source, result.name, result.id
+
+    @staticmethod
+    def _parse_score(score) -> float:
+        try:
+            return float(score)
+        except (TypeError, ValueError):
+            return np.nan
+
+    @classmethod
+    def _oriented_scores(cls, results: List[RetrieverResult], lower_is_better: bool) -> np.ndarray:
+        """转换为越大越相关的分数，无法解析的分数视为最不相关"""
+        scores = np.array([cls._parse_score(result.score) for result in results], dtype=np.float64)
+        if lower_is_better:
+            scores = -scores
+        return np.nan_to_num(scores, nan=-np.inf)
+
+    @staticmethod
+    def _normalize(scores: np.ndarray) -> np.ndarray:
+        """min-max 归一化到 [0, 1]，分数全部相同时均为 1"""
+        finite = np.isfinite(scores)
+        if not finite.any():
+            return np.zeros_like(scores)
+        low, high = scores[finite].min(), scores[finite].max()
+        if high == low:
+            return np.where(finite, 1.0, 0.0)
+        return np.where(finite, (scores - low) / (high - low), 0.0)
+
+    @classmethod
+    def fuse(cls, results: List[RetrieverResult], method: str = "rrf", top_k: int = 5,
+             weights: Optional[Dict[str, float]] = None, rrf_k: int = 60,
+             milvus_metric: str = "L2") -> List[RetrieverResult]:
+        """
+        融合多路召回结果。
+
+        :param results: 各引擎召回结果
+        :param method: rrf: 倒数排名融合 sum(w / (k + rank)) weighted: 各引擎 min-max 归一化分数加权求和
+        :param top_k: 融合后返回数量
+        :param weights: 各引擎权重 {"milvus": 1.0, "es": 1.0}，未配置的引擎权重为 1
+        :param rrf_k: RRF 平滑常数
+        :param milvus_metric: Milvus 度量方式，用于判断分数方向
+        :return: 按融合分数降序的召回结果，ranks 为各引擎内排名(从 1 开始)，fused_score 为融合分数
+        """
+        if method not in FUSION_METHODS:
+            raise ValueError(f"不支持的融合方式: {method}")
+        if not results or top_k <= 0:
+            return []
+        weights = weights or {}
+        engines = list(dict.fromkeys(result.source for result in results))
+
+        docs: List[RetrieverResult] = []
+        rows: Dict[Tuple, int] = {}
+        entries: List[Tuple[int, int, int, float]] = []  # (文档行, 引擎列, 排名, 归一化分数)
+        for column, engine in enumerate(engines):
+            engine_results = [result for result in results if result.source == engine]
+            lower_is_better = engine == "milvus" and milvus_metric.upper() in _LOWER_IS_BETTER_METRICS
+            scores = cls._oriented_scores(engine_results, lower_is_better)
+            normalized = cls._normalize(scores)
+            seen = set()
+            for position in np.argsort(-scores, kind="stable"):
+                result = engine_results[position]
+                key = cls._key(result)
+                # 同一引擎多个集合/索引召回同一分片时保留最高排名
+                if key in seen:
+                    continue
+                seen.add(key)
+                if key not in rows:
+                    rows[key] = len(docs)
+                    docs.append(result)
+                entries.append((rows[key], column, len(seen), float(normalized[position])))
+
+        row_index, column_index, rank_values, norm_values = (np.array(values) for values in zip(*entries))
+        ranks = np.full((len(docs), len(engines)), np.inf)
+        ranks[row_index, column_index] = rank_values
+        weight_vector = np.array([float(weights.get(engine, 1.0)) for engine in engines])
+        if method == "rrf":
+            fused = (weight_vector / (rrf_k + ranks)).sum(axis=1)
+        else:
+            norms = np.zeros((len(docs), len(engines)))
+            norms[row_index, column_index] = norm_values
+            fused = (norms * weight_vector).sum(axis=1)
+
+        fused_results = []
+        for row in np.argsort(-fused, kind="stable")[:top_k]:
+            result = docs[row]
+            result.ranks = {engine: int(ranks[row, column]) for column, engine in enumerate(engines)
+                            if np.isfinite(ranks[row, column])}
+            result.fused_score = float(fused[row])
+            fused_results.append(result)
+        logger_util.debug(f"召回融合({method}): {len(results)} 条 -> 去重 {len(docs)} 条 -> 返回 {len(fused_results)} 条")
+        return fused_results
@@ -0,0 +1,196 @@
+import asyncio
+import math
+import re
+import time
+from collections import Counter
+from typing import List, Optional
+
+import httpx
+
+from awsome.models.schemas.retriever import RetrieverResult
+from awsome.services.constant import default_rerank_budget_ms, default_rerank_http_timeout
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
+
+rerank_counter = metrics.counter(
+    "awsome_rerank_total",
+    "重排序次数 outcome: ok/timeout/error",
+    labelnames=("reranker", "outcome")
+)
+rerank_histogram = metrics.histogram(
+    "awsome_rerank_seconds",
+    "重排序打分耗时(秒，不含超时旁路)",
+    labelnames=("reranker",)
+)
+
+# 拉丁字母/数字词
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# 连续的中日韩字符
+_CJK_RUN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+
+
+def _document_text(result: RetrieverResult) -> str:
+    title = (result.metadata or {}).get("title") or ""
+    return f"{title}\n{result.text or ''}" if title else result.text or ""
+
+
+class Reranker:
+    """重排序打分器基类：对全部候选一次性批量打分"""
+
+    name = "none"
+
+    async def score(self, query: str, documents: List[str]) -> List[float]:
+        """
+        :param query: 查询内容
+        :param documents: 候选文本
+        :return: 与 documents 一一对应的相关性分数，越大越相关
+        """
+        return [0.0] * len(documents)
+
+
+class BM25Reranker(Reranker):
+    """
+    本地 BM25 打分，仅使用 CPU、无需网络。
+    以候选集合本身作为语料统计 IDF；中日韩文本按单字及相邻二字切分，其余按字母/数字词切分。
+    """
+
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        text = (text or "").lower()
+        tokens = _WORD_PATTERN.findall(text)
+        for run in _CJK_RUN_PATTERN.findall(text):
+            tokens.extend(run)
+            tokens.extend(run[index:index + 2] for index in range(len(run) - 1))
+        return tokens
+
+    def _score(self, query: str, documents: List[str]) -> List[float]:
+        query_terms = set(self.tokenize(query))
+        term_freqs = [Counter(self.tokenize(document)) for document in documents]
+        lengths = [sum(freqs.values()) for freqs in term_freqs]
+        average_length = (sum(lengths) / len(lengths)) or 1
+        document_freqs = Counter(term for freqs in term_freqs for term in query_terms if term in freqs)
+        idf = {
+            term: math.log(1 + (len(documents) - document_freqs[term] + 0.5) / (document_freqs[term] + 0.5))
+            for term in query_terms
+        }
+        scores = []
+        for freqs, length in zip(term_freqs, lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            scores.append(sum(
+                idf[term] * freqs[term] * (self.k1 + 1) / (freqs[term] + norm)
+                for term in query_terms if term in freqs
+            ))
+        return scores
+
+    async def score(self, query: str, documents: List[str]) -> List[float]:
+        return await asyncio.to_thread(self._score, query, documents)
+
+
+class HttpReranker(Reranker):
+    """
+    OpenAI 兼容的重排序接口(POST {base_url}/rerank，如 Jina/Xinference/vLLM/硅基流动)。
+    请求: {"model", "query", "documents", "top_n"}
+    响应: {"results": [{"index", "relevance_score"}]}
+    """
+
+    name = "http"
+
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None,
+                 timeout: float = default_rerank_http_timeout):
+        self.url = f"{base_url.rstrip('/')}/rerank"
+        self.model = model
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
+        self._client = httpx.AsyncClient(headers=headers, timeout=timeout)
+
+    async def score(self, query: str, documents: List[str]) -> List[float]:
+        response = await self._client.post(self.url, json={
+            "model": self.model,
+            "query": query,
+            "documents": documents,
+            "top_n": len(documents),
+        })
+        response.raise_for_status()
+        scores = [-math.inf] * len(documents)
+        for item in response.json().get("results", []):
+            scores[item["index"]] = float(item["relevance_score"])
+        return scores
+
+
+class RerankService:
+    """
+    召回重排序入口，按配置 chat.rerank.type 选择打分器。
+    打分超过时间预算或失败时旁路，直接按原顺序(融合排名)截取，不影响对话。
+    """
+
+    _reranker: Reranker = None
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return bool(get_config("chat.rerank.enabled", False))
+
+    @classmethod
+    def _get_reranker(cls) -> Reranker:
+        if cls._reranker is None:
+            reranker_type = get_config("chat.rerank.type", BM25Reranker.name)
+            if reranker_type == BM25Reranker.name:
+                cls._reranker = BM25Reranker()
+            elif reranker_type == HttpReranker.name:
+                cls._reranker = HttpReranker(
+                    base_url=get_config("chat.rerank.http.base_url"),
+                    model=get_config("chat.rerank.http.model"),
+                    api_key=get_config("chat.rerank.http.api_key", None),
+                    timeout=float(get_config("chat.rerank.http.timeout", default_rerank_http_timeout))
+                )
+            else:
+                cls._reranker = Reranker()
+        return cls._reranker
+
+    @classmethod
+    def register(cls, reranker: Reranker):
+        """替换打分器实现(如本地 cross-encoder 模型)"""
+        cls._reranker = reranker
+
+    @classmethod
+    async def rerank(cls, query: str, results: List[RetrieverResult], top_k: int) -> List[RetrieverResult]:
+        """
+        对候选批量打分并按分数降序返回前 top_k 条，分数相同时保持原顺序。
+
+        :param query: 查询内容
+        :param results: 候选召回结果(已按融合排名排序)
+        :param top_k: 返回数量
+        :return: 重排序结果，rerank_score 为打分器分数；旁路时为原顺序前 top_k 条
+        """
+        if len(results) <= 1:
+            return results[:top_k]
+        reranker = cls._get_reranker()
+        budget = int(get_config("chat.rerank.budget_ms", default_rerank_budget_ms)) / 1000
+        start = time.perf_counter()
+        try:
+            scores = await asyncio.wait_for(
+                reranker.score(query, [_document_text(result) for result in results]), timeout=budget
+            )
+        except asyncio.TimeoutError:
+            rerank_counter.inc(reranker=reranker.name, outcome="timeout")
+            logger_util.warning(f"重排序超过时间预算 {budget * 1000:.0f}ms，按融合排名返回")
+            return results[:top_k]
+        except Exception as e:
+            rerank_counter.inc(reranker=reranker.name, outcome="error")
+            logger_util.error(f"重排序失败，按融合排名返回: {e}")
+            return results[:top_k]
+        rerank_histogram.observe(time.perf_counter() - start, reranker=reranker.name)
+        rerank_counter.inc(reranker=reranker.name, outcome="ok")
+
+        order = sorted(range(len(results)), key=lambda index: -scores[index])[:top_k]
+        reranked = []
+        for index in order:
+            results[index].rerank_score = scores[index]
+            reranked.append(results[index])
+        logger_util.debug(f"重排序({reranker.name}): {len(results)} 条候选 -> 返回 {len(reranked)} 条")
+        return reranked
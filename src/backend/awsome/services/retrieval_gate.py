@@ -0,0 +1,111 @@
+import re
+import time
+from typing import Iterable, Set
+
+from awsome.services.constant import default_gate_chitchat_phrases
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
+
+gate_decisions_counter = metrics.counter(
+    "awsome_retrieval_gate_decisions_total",
+    "检索门控决策次数 source: kb/web/memory decision: query/skip",
+    labelnames=("source", "decision")
+)
+gate_seconds_histogram = metrics.histogram(
+    "awsome_retrieval_gate_seconds",
+    "检索门控判定耗时(秒)",
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005)
+)
+
+# 标点/空白/表情等非语义字符
+_NOISE_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+# 短语之间/句末的语气词
+_PARTICLES = "啊呀吧呢哈啦嘛哦噢喔咯了的"
+
+
+class RetrievalGate:
+    """检索门控基类：按消息判定值得查询的检索来源"""
+
+    name = "none"
+
+    def decide(self, message: str, sources: Set[str]) -> Set[str]:
+        """
+        :param message: 用户消息
+        :param sources: 对话已开启的检索来源(kb/web/memory)
+        :return: 需要查询的来源，未包含的来源会被跳过
+        """
+        return set(sources)
+
+
+class HeuristicRetrievalGate(RetrievalGate):
+    """
+    本地启发式门控，单条消息判定耗时在微秒级。
+    去除标点/空白/表情后为空，或完全由寒暄/致谢/应答类短语(及语气词)组成的消息跳过全部检索，
+    其余消息查询全部已开启来源。短关键词(如“报销流程”)同样是有效查询，因此不按长度跳过。
+    """
+
+    name = "heuristic"
+
+    def __init__(self, chitchat_phrases: Iterable[str]):
+        phrases = sorted({_NOISE_PATTERN.sub("", phrase).lower() for phrase in chitchat_phrases} - {""},
+                         key=len, reverse=True)
+        self._chitchat_pattern = re.compile(
+            f"(?:(?:{'|'.join(re.escape(phrase) for phrase in phrases)})[{_PARTICLES}]*)+"
+        ) if phrases else None
+
+    def decide(self, message: str, sources: Set[str]) -> Set[str]:
+        normalized = _NOISE_PATTERN.sub("", message).lower()
+        if not normalized:
+            return set()
+        if self._chitchat_pattern is not None and self._chitchat_pattern.fullmatch(normalized):
+            return set()
+        return set(sources)
+
+
+class RetrievalGateService:
+    """检索门控入口，按配置 chat.retrieval_gate.type 选择门控实现"""
+
+    _gate: RetrievalGate = None
+
+    @classmethod
+    def _get_gate(cls) -> RetrievalGate:
+        if cls._gate is None:
+            gate_type = get_config("chat.retrieval_gate.type", HeuristicRetrievalGate.name)
+            if gate_type == HeuristicRetrievalGate.name:
+                cls._gate = HeuristicRetrievalGate(
+                    chitchat_phrases=list(default_gate_chitchat_phrases) +
+                                     list(get_config("chat.retrieval_gate.chitchat_phrases", None) or [])
+                )
+            else:
+                cls._gate = RetrievalGate()
+        return cls._gate
+
+    @classmethod
+    def register(cls, gate: RetrievalGate):
+        """替换门控实现(如接入意图分类模型)"""
+        cls._gate = gate
+
+    @classmethod
+    def decide(cls, message: str, sources: Set[str]) -> Set[str]:
+        """
+        判定需要查询的检索来源，未开启门控或判定异常时查询全部来源。
+
+        :param message: 用户消息
+        :param sources: 对话已开启的检索来源(kb/web/memory)
+        :return: 需要查询的来源
+        """
+        if not sources or not get_config("chat.retrieval_gate.enabled", False):
+            return set(sources)
+        start = time.perf_counter()
+        try:
+            decision = cls._get_gate().decide(message, set(sources))
+        except Exception as e:
+            logger_util.error(f"检索门控判定失败: {e}")
+            return set(sources)
+        gate_seconds_histogram.observe(time.perf_counter() - start)
+        for source in sources:
+            gate_decisions_counter.inc(source=source, decision="query" if source in decision else "skip")
+        if len(decision) < len(sources):
+            logger_util.debug(f"检索门控跳过来源: {set(sources) - decision}")
+        return decision
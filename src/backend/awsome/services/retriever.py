@@ -1,26 +1,47 @@
 import asyncio
+import functools
 import json
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Union, Optional
 
 from awsome.models.schemas.retriever import RetrieverResult
 from awsome.services.base import BaseService
+from awsome.services.constant import default_retrieval_max_workers, default_fusion_rrf_k
+from awsome.services.rank_fusion import RankFusion
+from awsome.services.reranker import RerankService
+from awsome.settings import get_config
 from awsome.utils.elasticsearch_util import ElasticSearchUtil
 from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
 from awsome.utils.milvus_util import MilvusUtil
 from awsome.utils.model_factory import ModelFactory
 
+retriever_histogram = metrics.histogram(
+    "awsome_retriever_seconds",
+    "检索各步骤耗时(秒) step: embedding/milvus/es/queue/fusion/rerank/total",
+    labelnames=("step", "mode")
+)
+
 
 class RetrieverService(BaseService):
+    """
+    知识库检索。
+    向量化、Milvus 及 ES 客户端均为同步调用，统一提交到检索专用的有界线程池执行，不阻塞事件循环；
+    查询向量化与 ES 检索同时开始，Milvus 检索在向量就绪后开始，总耗时接近 max(向量化 + Milvus, ES)。
+    """
     # 添加类属性
     _milvus_client = None
     _es_client = None
     _model_client = None
+    _clients_lock = threading.Lock()
+    _executor: Optional[ThreadPoolExecutor] = None
 
     @classmethod
     def _get_clients(cls):
         """初始化所有客户端（线程安全）"""
-        with threading.Lock():
+        with cls._clients_lock:
             if cls._milvus_client is None:
                 cls._milvus_client = MilvusUtil()
             if cls._es_client is None:
@@ -29,6 +50,35 @@ class RetrieverService(BaseService):
                 cls._model_client = ModelFactory().create_client()
         return cls._milvus_client, cls._es_client, cls._model_client
 
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        """检索专用线程池，与默认线程池隔离，避免检索占满默认线程池或被其他阻塞任务拖慢"""
+        with cls._clients_lock:
+            if cls._executor is None:
+                max_workers = int(get_config("chat.retrieval.max_workers", default_retrieval_max_workers))
+                cls._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retriever")
+        return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        """关闭检索线程池，未开始的任务直接取消"""
+        with cls._clients_lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    async def _run_blocking(cls, step: str, mode: str, func, *args, **kwargs):
+        """在检索线程池中执行同步调用，分别记录排队及执行耗时"""
+        submitted = time.perf_counter()
+
+        def run():
+            retriever_histogram.observe(time.perf_counter() - submitted, step="queue", mode=mode)
+            with retriever_histogram.time(step=step, mode=mode):
+                return func(*args, **kwargs)
+
+        return await asyncio.get_running_loop().run_in_executor(cls._get_executor(), run)
+
     @classmethod
     def _convert_milvus_result_to_retriever_result(cls, milvus_result: Dict) -> RetrieverResult:
         """
@@ -77,11 +127,14 @@ class RetrieverService(BaseService):
             milvus_collection_names: Optional[List[str]] = None,
             milvus_fields: List[str] = None,
             milvus_expr: str = None,
-            milvus_search_params: str = None,
+            milvus_search_params: Dict = None,
+            milvus_knowledge_ids: Optional[List[str]] = None,
             es_index_names: Optional[List[str]] = None,
             es_fields: List[str] = None,
             es_query: Union[str, Dict] = None,
             top_k: int = 5,
+            fusion: Optional[str] = None,
+            fusion_top_k: Optional[int] = None,
     ) -> List[RetrieverResult]:
         """
         检索服务，支持通过 Milvus 和 Elasticsearch 进行检索。
@@ -91,13 +144,17 @@ class RetrieverService(BaseService):
         :param milvus_fields: Milvus 返回的字段列表。
         :param milvus_expr: Milvus条件过滤式
         :param milvus_search_params 索引查询参数
+        :param milvus_knowledge_ids: 知识库ID列表，共享集合按 knowledge_id 过滤。
         :param es_index_names: Elasticsearch 索引名称列表。
         :param es_fields: Elasticsearch 返回的字段列表。
         :param es_query: Elasticsearch 查询内容，可以是字符串或字典。
-        :param top_k: 返回的最相似结果数量，默认为 5。
-        :return: 检索结果字典。
+        :param top_k: 每个集合/索引返回的最相似结果数量，默认为 5。
+        :param fusion: 融合排序方式 rrf/weighted，为空时按 Milvus 在前 ES 在后直接拼接。
+        :param fusion_top_k: 融合后返回数量，默认为 top_k。
+        :return: 检索结果列表。
         """
 
+        start = time.perf_counter()
         # 复用客户端
         milvus_client, es_client, model_client = cls._get_clients()
 
@@ -105,42 +162,60 @@ class RetrieverService(BaseService):
         tasks = []
         # 检索模式：仅使用 Milvus
         if mode in ["milvus", "both"]:
-            tasks.append(cls._milvus_search(milvus_client, milvus_collection_names, query, top_k, milvus_fields, milvus_expr, milvus_search_params, model_client))
+            tasks.append(cls._milvus_search(milvus_client, milvus_collection_names, query, top_k, milvus_fields, milvus_expr, milvus_search_params, model_client, milvus_knowledge_ids))
         # 检索模式：仅使用 Elasticsearch
         if mode in ["es", "both"]:
             tasks.append(cls._es_search(es_client, es_index_names, query, top_k, es_fields, es_query))
 
-        # 合并结果
+        # 合并结果(Milvus 在前 ES 在后)
         results = []
-        for completed_task in asyncio.as_completed(tasks):
-            results.extend(await completed_task)
+        for task_results in await asyncio.gather(*tasks):
+            results.extend(task_results)
+        if fusion:
+            with retriever_histogram.time(step="fusion", mode=mode):
+                results = RankFusion.fuse(
+                    results,
+                    method=fusion,
+                    top_k=fusion_top_k or top_k,
+                    weights=get_config("chat.fusion.weights", None),
+                    rrf_k=int(get_config("chat.fusion.rrf_k", default_fusion_rrf_k)),
+                    milvus_metric=(milvus_search_params or {}).get("metric_type", "L2")
+                )
+        retriever_histogram.observe(time.perf_counter() - start, step="total", mode=mode)
 
         # 返回检索结果
         return results
 
     @classmethod
-    async def _milvus_search(cls, milvus_client, milvus_collection_names, query, top_k, milvus_fields, milvus_expr, milvus_search_params, model_client):
+    async def _milvus_search(cls, milvus_client, milvus_collection_names, query, top_k, milvus_fields, milvus_expr, milvus_search_params, model_client, milvus_knowledge_ids=None):
         if not milvus_collection_names:
             logger_util.error("未指定 Milvus 集合名称列表")
             raise ValueError("未指定 Milvus 集合名称列表")
 
         # 获取查询向量
-        query_vector = model_client.get_embeddings(query).data[0].embedding
+        query_vector = await cls._run_blocking(
+            "embedding", "milvus", lambda: model_client.embed_query(query)
+        )
 
         # 在 Milvus 中进行向量检索
         try:
-            milvus_results = milvus_client.search_vectors(
-                query_vectors=query_vector,
-                collection_names=milvus_collection_names,
-                top_k=top_k,
-                output_fields=milvus_fields,
-                expr=milvus_expr,
-                search_params=milvus_search_params
+            milvus_results = await cls._run_blocking(
+                "milvus", "milvus", functools.partial(
+                    milvus_client.search_vectors,
+                    query_vectors=query_vector,
+                    collection_names=milvus_collection_names,
+                    top_k=top_k,
+                    output_fields=milvus_fields,
+                    expr=milvus_expr,
+                    search_params=milvus_search_params,
+                    knowledge_ids=milvus_knowledge_ids
+                )
             )  # List[Dict]
             # 转换 milvus_results 为统一检索数据结构
             return [cls._convert_milvus_result_to_retriever_result(milvus_result) for milvus_result in milvus_results]
         except Exception as e:
             logger_util.error(f"Milvus 检索失败: {e}")
+            return []
 
     @classmethod
     async def _es_search(cls, es_client, es_index_names, query, top_k, es_fields, es_query):
@@ -153,20 +228,39 @@ class RetrieverService(BaseService):
             es_query = query  # 默认使用简单字符串查询
 
         try:
-            es_results = es_client.search_documents(
-                index_names=es_index_names,
-                query=es_query,
-                size=top_k,
-                fields=es_fields,
+            es_results = await cls._run_blocking(
+                "es", "es", functools.partial(
+                    es_client.search_documents,
+                    index_names=es_index_names,
+                    query=es_query,
+                    size=top_k,
+                    fields=es_fields,
+                )
             )  # List[Dict]
             # 转换 es_results 为统一检索数据结构
             return [cls._convert_es_result_to_retriever_result(es_result) for es_result in es_results]
         except Exception as e:
             logger_util.error(f"Elasticsearch 检索失败: {e}")
+            return []
+
     @classmethod
-    async def rerank_retrieve(cls):
-        # TODO 检索重排序
-        pass
+    async def rerank_retrieve(cls, query: str, top_k: int = 5, candidate_top_k: int = 20, search_top_k: int = 10,
+                              **kwargs) -> List[RetrieverResult]:
+        """
+        检索 -> 融合 -> 重排序。
+        未开启重排序时融合后直接返回前 top_k 条；开启时融合后取前 candidate_top_k 条批量打分，返回前 top_k 条。
+        :param query: 查询内容。
+        :param top_k: 返回数量。
+        :param candidate_top_k: 参与重排序的候选数量。
+        :param search_top_k: 每个集合/索引的召回数量，同 retrieve 的 top_k。
+        :param kwargs: 其余检索参数，同 retrieve。
+        :return: 检索结果列表。
+        """
+        if not RerankService.is_enabled():
+            return await cls.retrieve(query, top_k=search_top_k, fusion_top_k=top_k, **kwargs)
+        candidates = await cls.retrieve(query, top_k=search_top_k, fusion_top_k=max(candidate_top_k, top_k), **kwargs)
+        with retriever_histogram.time(step="rerank", mode=kwargs.get("mode", "both")):
+            return await RerankService.rerank(query, candidates, top_k)
 
 
 async def main():
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import List
+
+import numpy as np
+
+from awsome.models.schemas.source import SourceMsg
+from awsome.models.v1.chat import ChatMessageSend
+from awsome.services.base import BaseService
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.minio_util import MinioUtil
+from awsome.utils.model_factory import ModelFactory
+from awsome.utils.redis_util import RedisUtil, AsyncRedisUtil
+
+redis_util = RedisUtil()
+async_redis_util = AsyncRedisUtil()
+minio_client = MinioUtil()
+
+
+class SemanticCacheLookup:
+    def __init__(self, namespace: str, embedding: np.ndarray, answer: str = None, sources: List[SourceMsg] = None):
+        """
+        语义缓存查询结果。
+        :param namespace: 缓存命名空间（模型/系统提示词/知识库及其版本/Embedding模型）
+        :param embedding: 归一化后的查询向量，未命中时用于写入缓存
+        :param answer: 命中的缓存回答
+        :param sources: 命中的缓存来源信息
+        """
+        self.namespace = namespace
+        self.embedding = embedding
+        self.answer = answer
+        self.sources = sources or []
+
+    @property
+    def hit(self) -> bool:
+        return self.answer is not None
+
+
+class SemanticCacheService(BaseService):
+    """
+    知识库对话语义缓存。
+    以 模型 + 系统提示词哈希 + 绑定知识库ID及内容版本 + Embedding模型 作为命名空间，
+    命名空间内按查询向量余弦相似度匹配历史回答。知识库文件增删时递增其内容版本，旧命名空间随之失效并自然过期。
+    命名空间不包含对话历史，因此仅用于无历史消息的首轮提问(由调用方判断)，追问不查询也不写入缓存。
+    """
+
+    @classmethod
+    def is_applicable(cls, conversation, message_data: ChatMessageSend) -> bool:
+        """仅对开启缓存、绑定知识库且未使用网络检索/记忆的对话生效（其回答与时间或用户相关，不宜复用）"""
+        return bool(get_config("chat.semantic_cache.enabled", False)) \
+            and len(conversation.knowledge_bases) > 0 \
+            and message_data.search is not True \
+            and conversation.use_memory != 1
+
+    @staticmethod
+    def _kb_version_key(kb_id: str) -> str:
+        return f"awsome:kb_version:{kb_id}"
+
+    @staticmethod
+    def _keys(namespace: str):
+        prefix = f"awsome:semantic_cache:{namespace}"
+        return f"{prefix}:emb", f"{prefix}:data", f"{prefix}:lru"
+
+    @classmethod
+    def bump_kb_version(cls, kb_id: str):
+        """知识库内容变化(文件新增/删除)时调用，使关联的语义缓存失效"""
+        try:
+            redis_util.incr(cls._kb_version_key(kb_id))
+            logger_util.debug(f"知识库 {kb_id} 内容版本已更新")
+        except Exception as e:
+            logger_util.error(f"更新知识库 {kb_id} 内容版本失败: {e}")
+
+    @classmethod
+    async def _namespace(cls, conversation, embedding_name: str) -> str:
+        kb_ids = sorted(kb.id for kb in conversation.knowledge_bases)
+        versions = await async_redis_util.client.mget([cls._kb_version_key(kb_id) for kb_id in kb_ids])
+        raw = json.dumps([
+            conversation.model,
+            hashlib.sha256((conversation.system_prompt or "").encode()).hexdigest(),
+            kb_ids,
+            [int(version or 0) for version in versions],
+            embedding_name,
+        ])
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    @classmethod
+    async def _embed(cls, query: str):
+        client = ModelFactory.create_client()
+        vector = await asyncio.to_thread(client.embed_query, query)
+        embedding = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+        return embedding, client.embedding_name
+
+    @classmethod
+    async def lookup(cls, conversation, query: str) -> SemanticCacheLookup:
+        """
+        查询语义缓存。
+        :param conversation: 会话配置。
+        :param query: 用户消息。
+        :return: SemanticCacheLookup，hit 为 True 时携带缓存回答及来源。
+        """
+        embedding, embedding_name = await cls._embed(query)
+        namespace = await cls._namespace(conversation, embedding_name)
+        lookup = SemanticCacheLookup(namespace, embedding)
+        emb_key, data_key, lru_key = cls._keys(namespace)
+
+        stored = await async_redis_util.client.hgetall(emb_key)
+        candidates = [(entry_id, value) for entry_id, value in stored.items() if len(value) == embedding.nbytes]
+        if not candidates:
+            return lookup
+
+        # 向量化计算余弦相似度（向量写入前已归一化）
+        matrix = np.frombuffer(b"".join(value for _, value in candidates), dtype=np.float32).reshape(len(candidates), -1)
+        scores = matrix @ embedding
+        best = int(np.argmax(scores))
+        threshold = float(get_config("chat.semantic_cache.threshold", 0.95))
+        if float(scores[best]) < threshold:
+            logger_util.debug(f"语义缓存未命中, 最高相似度: {float(scores[best]):.4f}")
+            return lookup
+
+        entry_id = candidates[best][0]
+        data = await async_redis_util.client.hget(data_key, entry_id)
+        ttl = int(get_config("chat.semantic_cache.ttl", 3600))
+        entry = json.loads(data) if data else None
+        if entry is None or time.time() - entry["created_at"] > ttl:
+            await cls._evict(namespace, [entry_id])
+            return lookup
+
+        await async_redis_util.client.zadd(lru_key, {entry_id: time.time()})
+        lookup.answer = entry["answer"]
+        # 重新生成预签名链接为同步调用 在线程中执行
+        lookup.sources = list(await asyncio.gather(*[
+            asyncio.to_thread(cls._restore_source, source) for source in entry["sources"]
+        ]))
+        logger_util.debug(f"语义缓存命中, 相似度: {float(scores[best]):.4f}")
+        return lookup
+
+    @classmethod
+    async def store(cls, lookup: SemanticCacheLookup, query: str, answer: str, sources: List[SourceMsg]):
+        """
+        写入语义缓存，超出命名空间容量时按最近访问时间淘汰。
+        :param lookup: 未命中时返回的查询结果。
+        :param query: 用户消息。
+        :param answer: 模型完整回答。
+        :param sources: 来源信息。
+        """
+        if not answer:
+            return
+        emb_key, data_key, lru_key = cls._keys(lookup.namespace)
+        ttl = int(get_config("chat.semantic_cache.ttl", 3600))
+        max_entries = int(get_config("chat.semantic_cache.max_entries", 256))
+        entry_id = uuid.uuid4().hex
+        entry = {
+            "query": query,
+            "answer": answer,
+            "sources": [
+                {"source": source.source, "title": source.title, "url": source.url, "object_name": source.object_name}
+                for source in sources
+            ],
+            "created_at": time.time(),
+        }
+
+        pipe = async_redis_util.pipeline(transaction=True)
+        pipe.hset(emb_key, entry_id, lookup.embedding.astype(np.float32).tobytes())
+        pipe.hset(data_key, entry_id, json.dumps(entry, ensure_ascii=False))
+        pipe.zadd(lru_key, {entry_id: time.time()})
+        for key in (emb_key, data_key, lru_key):
+            pipe.expire(key, ttl)
+        pipe.zcard(lru_key)
+        results = await pipe.execute()
+
+        overflow = results[-1] - max_entries
+        if overflow > 0:
+            evicted = await async_redis_util.client.zpopmin(lru_key, overflow)
+            await cls._evict(lookup.namespace, [entry_id for entry_id, _ in evicted])
+
+    @classmethod
+    async def _evict(cls, namespace: str, entry_ids: List):
+        if not entry_ids:
+            return
+        emb_key, data_key, lru_key = cls._keys(namespace)
+        pipe = async_redis_util.pipeline(transaction=True)
+        pipe.hdel(emb_key, *entry_ids)
+        pipe.hdel(data_key, *entry_ids)
+        pipe.zrem(lru_key, *entry_ids)
+        await pipe.execute()
+
+    @classmethod
+    def _restore_source(cls, source: dict) -> SourceMsg:
+        # 知识库来源的预签名链接有时效 命中时重新生成
+        url = source["url"]
+        if source.get("object_name"):
+            try:
+                url = minio_client.get_presigned_url(object_name=source["object_name"])
+            except Exception as e:
+                logger_util.warning(f"重新生成预签名链接失败: {e}")
+        return SourceMsg(source=source["source"], title=source["title"], url=url, object_name=source.get("object_name"))
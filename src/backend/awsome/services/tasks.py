@@ -1,5 +1,6 @@
 from awsome.models.dao import *  # 确保执行任务时已加载全部DAO
 from awsome.core.celery_app import celery as ywjz_celery
+from awsome.models.dao.knowledge import KnowledgeDao
 from awsome.models.dao.knowledge_file import KnowledgeFile
 from awsome.models.schemas.es.save_document import SaveDocument
 from awsome.models.v1.knowledge_file import KnowledgeFileVectorizeTasks
@@ -11,9 +12,11 @@ from awsome.utils.logger_util import logger_util
 from awsome.utils.model_factory import ModelFactory
 from awsome.utils.tools import PdfExtractTool
 from awsome.services.constant import (milvus_default_fields_768,  # 默认字段
+                                      milvus_default_fields_1024,  # 共享集合字段
                                       milvus_default_index_params  # 默认索引配置
                                       )
 from awsome.services.knowledge_file import KnowledgeFileService
+from awsome.services.semantic_cache import SemanticCacheService
 @ywjz_celery.task(
     bind=True,
     autoretry_for=(Exception,),  # 自动重试所有异常
@@ -51,13 +54,15 @@ def celery_text_vectorize(self, task_json):
         es_client = ElasticSearchUtil()
         # 获取默认模型配置客户端
         client = ModelFactory.create_client(embedding_name=knowledge_file_vectorize_task.embedding_name)
+        # 任务入队后知识库可能已迁移到共享集合 以知识库当前的集合名称为准
+        current_collection_name = KnowledgeDao.select_collection_name(knowledge_file_vectorize_task.target_kb_id)
     except Exception as e:
         file_vectorize_err_msg += f"实例化异常:{e}\n"
         logger_util.exception(file_vectorize_err_msg)
         return  # 如果实例化失败，直接返回
 
     target_kb_id = knowledge_file_vectorize_task.target_kb_id  # target_knowledge_id
-    target_collection_name = knowledge_file_vectorize_task.collection_name  # milvus_collection_name
+    target_collection_name = current_collection_name or knowledge_file_vectorize_task.collection_name  # milvus_collection_name
     target_index_name = knowledge_file_vectorize_task.index_name  # es_index_name
     enable_layout_flag = knowledge_file_vectorize_task.enable_layout  # 是否开启布局识别
     for file_info in knowledge_file_vectorize_task.file_info_list:
@@ -110,7 +115,11 @@ def celery_text_vectorize(self, task_json):
             插入Milvus
             bbox | start_page[chunk片段最小页码] | source | title | chunk_index[分片索引] | extra | file_id | knowledge_id | text | vector | pk[auto_id]
             """
-            if not milvus_client.check_collection_exists(target_collection_name):
+            if milvus_client.is_shared_collection(target_collection_name):
+                # 共享集合通常在知识库创建时已创建 此处兜底
+                milvus_client.ensure_collection(target_collection_name, milvus_default_fields_1024,
+                                                milvus_default_index_params)
+            elif not milvus_client.check_collection_exists(target_collection_name):
                 logger_util.debug(f"新建集合{target_index_name}")
                 milvus_client.create_collection(target_collection_name, milvus_default_fields_768)
                 logger_util.debug(f"完成集合{target_index_name}新建")
@@ -149,6 +158,8 @@ def celery_text_vectorize(self, task_json):
             update_file.status = 1
             KnowledgeFileService.update_file(update_file)
             logger_util.debug("====》数据库数据更新状态")
+            # 知识库内容变化 语义缓存失效
+            SemanticCacheService.bump_kb_version(target_kb_id)
 
             return "ok"
         except Exception as e:
@@ -0,0 +1,121 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from awsome.models.dao.usage import UsageDao
+from awsome.services.base import BaseService
+from awsome.services.constant import default_usage_batch_size, default_usage_flush_interval_ms, \
+    default_usage_max_queue_size
+from awsome.settings import get_config
+from awsome.utils.batch_writer_util import BatchWriter
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
+from awsome.utils.token_util import TokenUtil
+
+usage_tokens_counter = metrics.counter(
+    "awsome_chat_tokens_total",
+    "对话消耗的 token 数 kind: prompt/completion/cached_prompt",
+    labelnames=("model", "kind", "estimated")
+)
+prompt_cache_ratio_histogram = metrics.histogram(
+    "awsome_chat_prompt_cache_ratio",
+    "输入 token 中命中供应商前缀缓存的比例(仅统计返回缓存用量的供应商)",
+    labelnames=("model",),
+    buckets=(0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1)
+)
+
+
+def _cached_tokens(usage) -> Optional[int]:
+    """供应商返回的前缀缓存命中 token 数(OpenAI: prompt_tokens_details.cached_tokens, DeepSeek: prompt_cache_hit_tokens)"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    return int(cached) if cached is not None else None
+
+
+class UsageRecorder(BatchWriter):
+    """
+    对话 token 用量记录。
+    优先使用供应商在流式响应末尾返回的 usage，未返回时按本地分词估算；
+    用量经后台任务批量写入明细表并累加日用量，不阻塞对话。
+    """
+
+    def __init__(self):
+        super().__init__(
+            name="用量记录",
+            batch_size=int(get_config("chat.usage.batch_size", default_usage_batch_size)),
+            flush_interval=int(get_config("chat.usage.flush_interval_ms", default_usage_flush_interval_ms)) / 1000,
+            max_queue_size=int(get_config("chat.usage.max_queue_size", default_usage_max_queue_size))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(get_config("chat.usage.enabled", True))
+
+    async def record(self, conv_id: str, model: str, messages: List[Dict], completion: str, usage=None,
+                     message_id: Optional[str] = None, knowledge_ids: Optional[List[str]] = None,
+                     truncated: int = 0):
+        """
+        记录一次模型调用的用量。
+
+        :param conv_id: 会话ID
+        :param model: 模型名称
+        :param messages: 请求消息，供应商未返回用量时用于估算输入 token 数
+        :param completion: 生成内容，供应商未返回用量时用于估算输出 token 数
+        :param usage: 供应商返回的用量(prompt_tokens/completion_tokens/total_tokens)
+        :param message_id: 助手消息ID
+        :param knowledge_ids: 对话绑定的知识库ID
+        :param truncated: 生成是否因客户端断开而截断
+        """
+        cached_tokens = None
+        if usage is not None:
+            prompt_tokens, completion_tokens, estimated = usage.prompt_tokens, usage.completion_tokens, 0
+            cached_tokens = _cached_tokens(usage)
+        else:
+            prompt_tokens = TokenUtil.count_messages_tokens(messages, model)
+            completion_tokens = TokenUtil.count_tokens(completion, model)
+            estimated = 1
+        usage_tokens_counter.inc(prompt_tokens, model=model, kind="prompt", estimated=estimated)
+        usage_tokens_counter.inc(completion_tokens, model=model, kind="completion", estimated=estimated)
+        if cached_tokens is not None:
+            usage_tokens_counter.inc(cached_tokens, model=model, kind="cached_prompt", estimated=estimated)
+            if prompt_tokens > 0:
+                prompt_cache_ratio_histogram.observe(cached_tokens / prompt_tokens, model=model)
+                logger_util.debug(f"会话 {conv_id} 前缀缓存命中 {cached_tokens}/{prompt_tokens} tokens")
+        if not self.enabled:
+            return
+        await self.put({
+            "conv_id": conv_id,
+            "message_id": message_id,
+            "model": model,
+            "knowledge_ids": ",".join(knowledge_ids) if knowledge_ids else None,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated": estimated,
+            "truncated": truncated,
+            "create_time": datetime.now(),
+        }, wait=False)
+
+    async def _write(self, items: List[Dict]) -> None:
+        await UsageDao.create_usages(items)
+
+
+usage_recorder = UsageRecorder()
+
+
+class UsageService(BaseService):
+
+    @classmethod
+    async def top_consumers(cls, group_by: str, days: int, limit: int) -> List[Dict]:
+        """
+        用量排行。
+
+        :param group_by: conversation: 按会话 model: 按模型
+        :param days: 统计最近天数(含当天)
+        :param limit: 返回数量
+        """
+        if group_by not in ("conversation", "model"):
+            raise ValueError("group_by 仅支持 conversation/model")
+        return await UsageDao.top(group_by=group_by, days=max(days, 1), limit=limit)
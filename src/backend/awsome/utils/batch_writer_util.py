@@ -0,0 +1,109 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional
+
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import Histogram
+
+
+class BatchWriter(ABC):
+    """
+    进程内批量写入基类。
+    数据先进入有界队列，由后台任务在时间窗口内合并为批次后调用 _write 写入；
+    需要确认写入结果的调用方可等待 put 返回的 Future。子类实现 _write。
+    """
+
+    def __init__(self, name: str, batch_size: int, flush_interval: float, max_queue_size: int,
+                 batch_histogram: Optional[Histogram] = None):
+        """
+        :param name: 写入任务名称，用于日志
+        :param batch_size: 单批最大条数
+        :param flush_interval: 合并时间窗口(秒)
+        :param max_queue_size: 队列容量，队列满时提交方等待
+        :param batch_histogram: 记录每批条数的直方图
+        """
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.batch_histogram = batch_histogram
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动后台写入任务(需在事件循环中调用)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger_util.info(f"{self.name}任务已启动")
+
+    async def stop(self):
+        """停止后台写入任务，并写入队列中剩余的数据"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger_util.info(f"{self.name}任务已停止")
+
+    async def put(self, item: Any, wait: bool = True) -> Optional[asyncio.Future]:
+        """
+        提交一条数据，队列已满时等待。
+
+        :param item: 待写入数据
+        :param wait: 是否需要确认写入结果
+        :return: wait 为 True 时返回 Future，写入成功后结果为 _write 返回的对应结果，写入失败时抛出异常
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put((item, future))
+        return future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            # 在时间窗口内继续收集 直至达到批量上限
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                try:
+                    entry = self._queue.get_nowait() if timeout <= 0 else \
+                        await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = await self._write(items)
+            if self.batch_histogram is not None:
+                self.batch_histogram.observe(len(items))
+        except Exception as e:
+            logger_util.error(f"{self.name} 批量写入 {len(items)} 条数据失败: {e}")
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+        for index, (_, future) in enumerate(batch):
+            if future is not None and not future.done():
+                future.set_result(results[index] if results is not None else None)
+
+    @abstractmethod
+    async def _write(self, items: List[Any]) -> Optional[List[Any]]:
+        """
+        写入一批数据。
+
+        :param items: 待写入数据
+        :return: 与 items 一一对应的结果，无结果时返回 None
+        """
+        pass
@@ -0,0 +1,99 @@
+import json
+from typing import Dict, Optional
+
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.redis_util import AsyncRedisUtil
+
+# 仅当回源期间没有被清除(代数未变化)时才写入缓存，避免并发更新后写入旧配置
+_SET_SCRIPT = """
+local gen = tonumber(redis.call('GET', KEYS[2]) or '0')
+if gen ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+return 1
+"""
+
+
+class ConversationCacheUtil:
+    """
+    会话配置缓存(Redis String，JSON 格式，带过期时间)。
+    由 ConversationDao 读取时回源填充，在会话更新/删除、摘要更新及知识库删除时清除。
+    """
+
+    def __init__(self, redis_util: AsyncRedisUtil = None):
+        self.redis_util = redis_util or AsyncRedisUtil()
+        self.enabled = get_config("chat.conversation_cache.enabled", True)
+        self.ttl = int(get_config("chat.conversation_cache.ttl", 3600))
+        self._set_script = self.redis_util.register_script(_SET_SCRIPT)
+
+    @staticmethod
+    def _key(conv_id: str) -> str:
+        return f"awsome:conv_config:{conv_id}"
+
+    @staticmethod
+    def _gen_key(conv_id: str) -> str:
+        return f"awsome:conv_config:{conv_id}:gen"
+
+    async def get(self, conv_id: str) -> Optional[Dict]:
+        """
+        读取会话配置。
+
+        :param conv_id: 会话ID。
+        :return: 会话配置，未命中返回 None。
+        """
+        if not self.enabled:
+            return None
+        try:
+            raw = await self.redis_util.get(self._key(conv_id))
+        except Exception as e:
+            logger_util.warning(f"读取会话配置缓存失败: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    async def get_generation(self, conv_id: str) -> int:
+        """获取会话配置缓存代数，回源数据库前调用，用于写入时的并发校验"""
+        if not self.enabled:
+            return -1
+        try:
+            gen = await self.redis_util.get(self._gen_key(conv_id))
+            return int(gen or 0)
+        except Exception as e:
+            logger_util.warning(f"读取会话配置缓存代数失败: {e}")
+            return -1
+
+    async def set(self, conv_id: str, config: Dict, generation: int):
+        """
+        回源后写入会话配置。
+
+        :param conv_id: 会话ID。
+        :param config: 会话配置。
+        :param generation: 回源前获取的缓存代数。
+        """
+        if not self.enabled or generation < 0:
+            return
+        try:
+            await self._set_script(
+                keys=[self._key(conv_id), self._gen_key(conv_id)],
+                args=[generation, json.dumps(config, ensure_ascii=False), self.ttl]
+            )
+        except Exception as e:
+            logger_util.warning(f"写入会话配置缓存失败: {e}")
+
+    async def invalidate(self, *conv_ids: str):
+        """清除会话配置缓存"""
+        if not self.enabled or not conv_ids:
+            return
+        try:
+            pipe = self.redis_util.pipeline(transaction=True)
+            for conv_id in conv_ids:
+                pipe.incr(self._gen_key(conv_id))
+                pipe.expire(self._gen_key(conv_id), self.ttl)
+                pipe.delete(self._key(conv_id))
+            await pipe.execute()
+        except Exception as e:
+            logger_util.error(f"清除会话配置缓存失败: {e}")
+
+
+conversation_cache = ConversationCacheUtil()
@@ -1,6 +1,7 @@
 from typing import TYPE_CHECKING
 from awsome.settings import get_config
 from awsome.utils.logger_util import logger_util
+from sqlalchemy import inspect, literal, text
 from sqlalchemy.exc import OperationalError
 from sqlmodel import Session, SQLModel, create_engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
@@ -102,8 +103,66 @@ class DatabaseClient:
                 logger_util.error(f'建表异常 {table}: {exc}')  # 记录创建表时的错误
                 raise RuntimeError(f'建表异常 {table}') from exc  # 抛出运行时异常
 
+        # 已存在的表不会随 create 补建新增的字段及索引 按名称检查后补建(先字段后索引)
+        inspector = inspect(self.engine)
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = self._add_column_ddl(table, column)
+                if ddl is None:
+                    logger_util.error(f'字段 {table.name}.{column.name} 不可为空且无默认值 无法自动补建 请手动迁移')
+                    continue
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(text(ddl))
+                    logger_util.info(f'补建字段 {table.name}.{column.name}')
+                except Exception as exc:
+                    logger_util.error(f'补建字段异常 {table.name}.{column.name}: {exc}')
+
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                try:
+                    index.create(self.engine)
+                    logger_util.info(f'补建索引 {table.name}.{index.name}')
+                except Exception as exc:
+                    logger_util.error(f'建索引异常 {table.name}.{index.name}: {exc}')
+
         logger_util.debug('创建数据库表成功')  # 记录成功创建数据库和表的信息
 
+    def _add_column_ddl(self, table, column):
+        """
+        生成补建字段的 ALTER TABLE 语句，仅支持可为空或有默认值(服务端默认值/标量默认值)的字段。
+
+        Returns:
+            Optional[str]: DDL 语句，无法补建时返回 None。
+        """
+        dialect = self.engine.dialect
+        preparer = dialect.identifier_preparer
+        ddl = (f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} '
+               f'{column.type.compile(dialect=dialect)}')
+        default = None
+        if column.server_default is not None:
+            arg = column.server_default.arg
+            default = arg.text if hasattr(arg, "text") else literal(arg).compile(
+                dialect=dialect, compile_kwargs={"literal_binds": True}).string
+        elif column.default is not None and column.default.is_scalar:
+            default = literal(column.default.arg).compile(
+                dialect=dialect, compile_kwargs={"literal_binds": True}).string
+        if column.nullable:
+            ddl += ' NULL'
+        elif default is None:
+            return None
+        else:
+            ddl += ' NOT NULL'
+        if default is not None:
+            ddl += f' DEFAULT {default}'
+        return ddl
+
 
 database_url = get_config("storage.mysql.uri")
 database_client: 'DatabaseClient' = DatabaseClient(database_url)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from awsome.services.constant import default_embedding_cache_max_entries, default_embedding_cache_ttl
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.metrics_util import metrics
+from awsome.utils.redis_util import RedisUtil
+
+embedding_cache_counter = metrics.counter(
+    "awsome_embedding_cache_total",
+    "查询向量缓存查询次数 result: l1_hit/l2_hit/miss",
+    labelnames=("result",)
+)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class EmbeddingCacheUtil:
+    """
+    查询向量两级缓存。
+    一级为进程内 LRU，二级为 Redis(float32 字节串，带过期时间)，按 向量模型 + 规范化文本 为键；
+    未命中时调用供应商接口生成后写入两级缓存。
+    向量统一以 float32 保存及返回，命中与未命中时的结果完全一致。
+    方法为同步调用(检索线程池/to_thread 中执行)，内部加锁保证线程安全；Redis 异常时按未命中处理。
+    """
+
+    def __init__(self, redis_util: RedisUtil = None):
+        self._redis_util = redis_util
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(get_config("chat.embedding_cache.enabled", True))
+
+    @property
+    def redis_util(self) -> Optional[RedisUtil]:
+        if not get_config("chat.embedding_cache.redis_enabled", True):
+            return None
+        if self._redis_util is None:
+            self._redis_util = RedisUtil()
+        return self._redis_util
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """统一 Unicode 形式(NFKC)并合并空白，不改变大小写"""
+        return _WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+    @classmethod
+    def _key(cls, model: str, text: str) -> str:
+        model_hash = hashlib.sha1(model.encode()).hexdigest()[:12]
+        text_hash = hashlib.sha1(cls.normalize(text).encode()).hexdigest()
+        return f"awsome:embedding:{model_hash}:{text_hash}"
+
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def _set_local(self, key: str, vector: np.ndarray):
+        max_entries = int(get_config("chat.embedding_cache.max_entries", default_embedding_cache_max_entries))
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, model: str, text: str, create: Callable[[], List[float]]) -> List[float]:
+        """
+        读取查询向量，未命中时生成并写入缓存。
+
+        :param model: 向量模型标识(供应商地址 + 模型名称)
+        :param text: 查询文本
+        :param create: 未命中时生成向量
+        :return: 查询向量
+        """
+        if not self.enabled:
+            return create()
+        key = self._key(model, text)
+        vector = self._get_local(key)
+        if vector is not None:
+            embedding_cache_counter.inc(result="l1_hit")
+            return vector.tolist()
+
+        redis_util = self.redis_util
+        if redis_util is not None:
+            try:
+                raw = redis_util.client.get(key)
+            except Exception as e:
+                logger_util.warning(f"读取查询向量缓存失败: {e}")
+                raw = None
+            if raw:
+                vector = np.frombuffer(raw, dtype=np.float32)
+                self._set_local(key, vector)
+                embedding_cache_counter.inc(result="l2_hit")
+                return vector.tolist()
+
+        embedding_cache_counter.inc(result="miss")
+        vector = np.asarray(create(), dtype=np.float32)
+        vector.setflags(write=False)
+        self._set_local(key, vector)
+        if redis_util is not None:
+            try:
+                redis_util.client.set(
+                    key, vector.tobytes(),
+                    ex=int(get_config("chat.embedding_cache.ttl", default_embedding_cache_ttl))
+                )
+            except Exception as e:
+                logger_util.warning(f"写入查询向量缓存失败: {e}")
+        return vector.tolist()
+
+
+embedding_cache = EmbeddingCacheUtil()
@@ -0,0 +1,139 @@
+import json
+from typing import List, Dict, Optional
+
+from awsome.settings import get_config
+from awsome.utils.logger_util import logger_util
+from awsome.utils.redis_util import AsyncRedisUtil
+
+# 列表首元素哨兵 保证空会话也能以列表形式被缓存
+HISTORY_HEAD = "__head__"
+
+# 仅当回源期间没有新的写入(代数未变化)时才回填缓存，避免覆盖并发追加的消息
+_FILL_SCRIPT = """
+local gen = tonumber(redis.call('GET', KEYS[2]) or '0')
+if gen ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 4))
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return 1
+"""
+
+
+class HistoryCacheUtil:
+    """
+    会话历史消息缓存(Redis List，按写入顺序追加，带过期时间)。
+    由 MessageDao 在写入/删除消息时维护，读取未命中时由调用方回源数据库并回填。
+    """
+
+    def __init__(self, redis_util: AsyncRedisUtil = None):
+        self.redis_util = redis_util or AsyncRedisUtil()
+        self.enabled = get_config("chat.history_cache.enabled", True)
+        self.ttl = int(get_config("chat.history_cache.ttl", 3600))
+        self.max_length = int(get_config("chat.history_cache.max_length", 200))
+        self._fill_script = self.redis_util.register_script(_FILL_SCRIPT)
+
+    @staticmethod
+    def _key(conv_id: str) -> str:
+        return f"awsome:history:{conv_id}"
+
+    @staticmethod
+    def _gen_key(conv_id: str) -> str:
+        return f"awsome:history:{conv_id}:gen"
+
+    @staticmethod
+    def _encode(row: Dict) -> str:
+        return json.dumps({"id": row["id"], "role": row["role"], "content": row["content"]}, ensure_ascii=False)
+
+    async def get(self, conv_id: str, limit: int) -> Optional[List[Dict]]:
+        """
+        读取会话最近的 limit 条消息。
+
+        :param conv_id: 会话ID。
+        :param limit: 消息条数。
+        :return: 按时间正序的消息列表，未命中返回 None。
+        """
+        if not self.enabled:
+            return None
+        try:
+            pipe = self.redis_util.pipeline(transaction=False)
+            pipe.lrange(self._key(conv_id), -(limit + 1), -1)
+            pipe.expire(self._key(conv_id), self.ttl)
+            items, _ = await pipe.execute()
+        except Exception as e:
+            logger_util.warning(f"读取历史消息缓存失败: {e}")
+            return None
+        if not items:
+            return None
+        rows = [json.loads(item) for item in items if item != HISTORY_HEAD.encode()]
+        return rows[-limit:]
+
+    async def get_generation(self, conv_id: str) -> int:
+        """获取会话缓存代数，回源数据库前调用，用于回填时的并发校验"""
+        try:
+            gen = await self.redis_util.get(self._gen_key(conv_id))
+            return int(gen or 0)
+        except Exception as e:
+            logger_util.warning(f"读取历史消息缓存代数失败: {e}")
+            return -1
+
+    async def fill(self, conv_id: str, rows: List[Dict], generation: int):
+        """
+        回源后回填会话缓存。
+
+        :param conv_id: 会话ID。
+        :param rows: 按时间正序的消息列表。
+        :param generation: 回源前获取的缓存代数。
+        """
+        if not self.enabled or generation < 0:
+            return
+        try:
+            await self._fill_script(
+                keys=[self._key(conv_id), self._gen_key(conv_id)],
+                args=[generation, self.max_length, self.ttl, HISTORY_HEAD, *[self._encode(row) for row in rows]]
+            )
+        except Exception as e:
+            logger_util.warning(f"回填历史消息缓存失败: {e}")
+
+    async def append(self, conv_id: str, row: Dict):
+        """
+        追加一条新消息，缓存不存在时不创建(等待下次读取回源)。
+
+        :param conv_id: 会话ID。
+        :param row: 消息 {"id", "role", "content"}。
+        """
+        await self.append_many(conv_id, [row])
+
+    async def append_many(self, conv_id: str, rows: List[Dict]):
+        """按顺序追加多条新消息，缓存不存在时不创建"""
+        if not self.enabled or not rows:
+            return
+        try:
+            pipe = self.redis_util.pipeline(transaction=True)
+            pipe.incr(self._gen_key(conv_id))
+            pipe.expire(self._gen_key(conv_id), self.ttl)
+            pipe.rpushx(self._key(conv_id), *[self._encode(row) for row in rows])
+            pipe.ltrim(self._key(conv_id), -self.max_length, -1)
+            pipe.expire(self._key(conv_id), self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger_util.warning(f"追加历史消息缓存失败, 清除缓存: {e}")
+            await self.invalidate(conv_id)
+
+    async def invalidate(self, conv_id: str):
+        """清除会话缓存"""
+        if not self.enabled:
+            return
+        try:
+            pipe = self.redis_util.pipeline(transaction=True)
+            pipe.incr(self._gen_key(conv_id))
+            pipe.expire(self._gen_key(conv_id), self.ttl)
+            pipe.delete(self._key(conv_id))
+            await pipe.execute()
+        except Exception as e:
+            logger_util.error(f"清除历史消息缓存失败: {e}")
+
+
+history_cache = HistoryCacheUtil()
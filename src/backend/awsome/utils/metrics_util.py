@@ -0,0 +1,197 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Sequence, Union
+
+# 默认耗时分桶(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter:
+    """单调递增计数器，按标签值区分序列"""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        """
+        计数器递增。
+
+        :param value: 增量，默认为 1。
+        :param labels: 标签值，需与 labelnames 一致。
+        """
+        key = tuple(str(labels.get(label, "")) for label in self.labelnames)
+        with self._lock:
+            self._values[key] += value
+
+    def samples(self) -> Dict[Tuple[str, ...], float]:
+        """获取当前所有序列的快照"""
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值，按标签值区分序列"""
+
+    def set(self, value: float, **labels):
+        """
+        设置当前值。
+
+        :param value: 当前值。
+        :param labels: 标签值，需与 labelnames 一致。
+        """
+        key = tuple(str(labels.get(label, "")) for label in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """累计分桶直方图，按标签值区分序列"""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数..., +Inf 计数, 总和]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+        记录一次观测值。
+
+        :param value: 观测值，耗时类指标单位为秒。
+        :param labels: 标签值，需与 labelnames 一致。
+        """
+        key = tuple(str(labels.get(label, "")) for label in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块耗时(秒)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Dict[Tuple[str, ...], List[float]]:
+        """获取当前所有序列的快照"""
+        with self._lock:
+            return {key: list(series) for key, series in self._values.items()}
+
+
+class MetricsUtil:
+    """
+    进程内指标注册表。
+    同名指标只注册一次，各模块在导入时声明所需指标。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+        """
+        注册或获取计数器。
+
+        :param name: 指标名称。
+        :param description: 指标说明。
+        :param labelnames: 标签名列表。
+        :return: Counter
+        """
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, description, labelnames)
+            return self._metrics[name]
+
+    def gauge(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """
+        注册或获取瞬时值指标。
+
+        :param name: 指标名称。
+        :param description: 指标说明。
+        :param labelnames: 标签名列表。
+        :return: Gauge
+        """
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, description, labelnames)
+            return self._metrics[name]
+
+    def histogram(self, name: str, description: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        注册或获取直方图。
+
+        :param name: 指标名称。
+        :param description: 指标说明。
+        :param labelnames: 标签名列表。
+        :param buckets: 分桶上界。
+        :return: Histogram
+        """
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, description, labelnames, buckets)
+            return self._metrics[name]
+
+    def collect(self):
+        """获取所有已注册指标"""
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出所有指标"""
+        lines = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            if isinstance(metric, Histogram):
+                lines.append(f"# TYPE {metric.name} histogram")
+                for key, series in sorted(metric.samples().items()):
+                    cumulative = 0
+                    for bound, count in zip((*metric.buckets, "+Inf"), series[:-1]):
+                        cumulative += count
+                        labels = _format_labels(metric.labelnames, key, le=_format_value(bound))
+                        lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(metric.labelnames, key)
+                    lines.append(f"{metric.name}_sum{labels} {_format_value(series[-1])}")
+                    lines.append(f"{metric.name}_count{labels} {cumulative}")
+            else:
+                lines.append(f"# TYPE {metric.name} {'gauge' if isinstance(metric, Gauge) else 'counter'}")
+                for key, value in sorted(metric.samples().items()):
+                    lines.append(f"{metric.name}{_format_labels(metric.labelnames, key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], **extra) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+metrics = MetricsUtil()
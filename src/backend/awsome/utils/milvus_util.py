@@ -1,5 +1,6 @@
 import asyncio
 import json
+from collections import Counter
 from sklearn.decomposition import PCA
 import numpy as np
 from pymilvus import (
@@ -14,6 +15,10 @@ from awsome.utils.logger_util import logger_util
 from awsome.utils.model_factory import ModelFactory
 
 
+# 共享集合名称前缀 同维度的知识库共用一个以 knowledge_id 为分区键的集合
+SHARED_COLLECTION_PREFIX = "c_awsome_shared_"
+
+
 class MilvusUtil:
     def __init__(self, host=None, port=None):
         """
@@ -78,6 +83,32 @@ class MilvusUtil:
             logger_util.error(f"创建集合{collection_name}失败:{e}")
             raise MilvusException(message=f"创建集合{collection_name}失败:{e}")
 
+    @staticmethod
+    def shared_collection_name(dim: int = 1024) -> str:
+        """指定维度的共享集合名称"""
+        return f"{SHARED_COLLECTION_PREFIX}{dim}"
+
+    @staticmethod
+    def is_shared_collection(collection_name: str) -> bool:
+        """是否为多知识库共享的分区键集合"""
+        return bool(collection_name) and collection_name.startswith(SHARED_COLLECTION_PREFIX)
+
+    @classmethod
+    def ensure_collection(cls, collection_name, fields, index_params):
+        """
+        集合不存在时创建集合及向量索引。
+
+        :param collection_name: 集合名称。
+        :param fields: 字段定义列表。
+        :param index_params: 向量字段索引参数。
+        :return: None
+        """
+        if cls.check_collection_exists(collection_name):
+            return
+        cls.create_collection(collection_name, fields)
+        cls.create_index_on_field(collection_name, "vector", index_params)
+        logger_util.info(f"集合{collection_name}已创建")
+
     @classmethod
     def insert_data(cls, collection_name, insert_data: list, ids=None):
         """
@@ -100,16 +131,17 @@ class MilvusUtil:
 
     @classmethod
     def search_vectors(cls, query_vectors, collection_names, search_params=None, top_k=5, expr=None,
-                       output_fields=None):
+                       output_fields=None, knowledge_ids=None):
         """
         根据向量进行相似性搜索。
 
         :param query_vectors: 查询向量。
-        :param collection_names: 要搜索的集合名称列表。
+        :param collection_names: 要搜索的集合名称列表(按知识库传入，多个知识库共享同一集合时名称重复)。
         :param search_params: 搜索参数，如 {"metric_type": "L2", "params": {"nprobe": 10}}。
-        :param top_k: 返回的最相似结果数量，默认为 5。
+        :param top_k: 每个知识库返回的最相似结果数量，默认为 5。
         :param expr: 条件过滤表达式，可选。
         :param output_fields: 指定返回的字段列表，可选。
+        :param knowledge_ids: 知识库ID列表，共享集合按 knowledge_id(分区键)过滤，可选。
         :return: 搜索结果。
         """
         results = []
@@ -118,20 +150,29 @@ class MilvusUtil:
             search_params = {"metric_type": "L2", "params": {"ef": 10}}
 
         try:
-            for collection_name in collection_names:
+            # 统一进行维度调整(所有集合共用)
+            query_vectors = MilvusUtil.unified_pca([query_vectors], 1024)[0]
+            # 同一集合只检索一次 共享集合按其中的知识库数量放大返回数量
+            for collection_name, kb_count in Counter(collection_names).items():
                 collection = Collection(collection_name)
                 cls.load_collection(collection_name)  # 加载集合
                 # 如果用户没有指定输出字段，则默认返回所有字段（除了向量字段本身）
                 if output_fields is None:
                     output_fields = [field.name for field in collection.schema.fields if field.name != "vector"]
-                # 统一进行维度调整
-                query_vectors = MilvusUtil.unified_pca([query_vectors], 1024)[0]
+                limit = top_k * kb_count
+                collection_expr, param = expr, search_params
+                if cls.is_shared_collection(collection_name) and knowledge_ids:
+                    kb_expr = f"knowledge_id in {json.dumps(list(knowledge_ids))}"
+                    collection_expr = f"({expr}) and {kb_expr}" if expr else kb_expr
+                if "ef" in search_params.get("params", {}) and search_params["params"]["ef"] < limit:
+                    # HNSW 要求 ef 不小于返回数量
+                    param = {**search_params, "params": {**search_params["params"], "ef": limit}}
                 result: SearchResult = collection.search(
                     data=[query_vectors],
                     anns_field="vector",
-                    param=search_params,
-                    limit=top_k,
-                    expr=expr,  # 条件过滤表达式
+                    param=param,
+                    limit=limit,
+                    expr=collection_expr,  # 条件过滤表达式
                     output_fields=output_fields  # 指定返回的字段
                 )
 
@@ -2,13 +2,74 @@ import asyncio
 import json
 from abc import ABC, abstractmethod
 import dashscope
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from awsome.settings import get_config
 from awsome.utils.redis_util import RedisUtil
+from awsome.services.admission import AdmissionController
 from awsome.services.constant import redis_default_model_key
+from awsome.utils.embedding_cache_util import embedding_cache
+from awsome.utils.single_flight_util import request_key, SingleFlight, AsyncSingleFlight, AsyncStreamSingleFlight
 from awsome.utils.tools import EncryptionTool
 
 encryption_tool = EncryptionTool()
 
+# 相同参数的并发请求合并为一次上游调用
+_completion_flight = AsyncSingleFlight()
+_completion_stream_flight = AsyncStreamSingleFlight()
+_embedding_flight = SingleFlight()
+
+
+def _single_flight_enabled() -> bool:
+    return bool(get_config("model.single_flight.enabled", True))
+
+
+def _stream_single_flight_enabled() -> bool:
+    # 共享流的每个订阅者都会收到同一个用量数据块 用量统计及准入结算会按订阅者数重复计算 默认关闭
+    return _single_flight_enabled() and bool(get_config("model.single_flight.stream_enabled", False))
+
+
+async def _create_chat_completion(provider, messages, stream, temperature, **kwargs):
+    """OpenAI 格式文本生成 相同参数的并发请求共享一次上游调用(流式请求共享同一个流)"""
+    if stream and get_config("model.stream_usage", True):
+        # 流式响应末尾返回用量统计(无 choices 的数据块)
+        kwargs.setdefault("stream_options", {"include_usage": True})
+    async def open_completion():
+        return await provider.async_client.chat.completions.create(
+            model=provider.llm_name,
+            messages=messages,
+            temperature=temperature,
+            stream=stream,
+            **kwargs
+        )
+
+    async def create():
+        # 每次上游调用均经准入控制 按实际调用的供应商计入配额(合并的并发请求只计一次)
+        return await AdmissionController.run(provider.llm_name, provider.mark, messages, kwargs.get("max_tokens"),
+                                             stream, open_completion)
+
+    if not (_stream_single_flight_enabled() if stream else _single_flight_enabled()):
+        return await create()
+    key = request_key("chat.completions", provider.base_url, provider.api_key, provider.llm_name,
+                      messages, stream, temperature, kwargs)
+    if stream:
+        return await _completion_stream_flight.subscribe(key, create)
+    return await _completion_flight.do(key, create)
+
+
+def _create_embeddings(provider, inputs, **kwargs):
+    """OpenAI 格式向量生成 相同参数的并发请求共享一次上游调用"""
+    def create():
+        return provider.client.embeddings.create(
+            input=inputs,
+            model=provider.embedding_name,
+            **kwargs
+        )
+
+    if not _single_flight_enabled():
+        return create()
+    key = request_key("embeddings", provider.base_url, provider.api_key, provider.embedding_name, inputs, kwargs)
+    return _embedding_flight.do(key, create)
+
 class BaseModelProvider(ABC):
     @abstractmethod
     async def generate_text(self, messages, stream=False, temperature=0.1, **kwargs):
@@ -18,6 +79,14 @@ class BaseModelProvider(ABC):
     def get_embeddings(self, inputs=None, **kwargs):
         pass
 
+    def _embed_one(self, text):
+        return self.get_embeddings(text).data[0].embedding
+
+    def embed_query(self, text):
+        """单条查询文本向量化，经查询向量缓存(进程内 LRU + Redis)"""
+        return embedding_cache.get_or_create(f"{self.base_url}|{self.embedding_name}", text,
+                                             lambda: self._embed_one(text))
+
 
 class OpenAIModelProvider(BaseModelProvider):
     def __init__(self, config):
@@ -25,27 +94,17 @@ class OpenAIModelProvider(BaseModelProvider):
         self.base_url = config.get("base_url", "https://api.openai.com/v1")
         self.llm_name = config.get("llm_name")
         self.embedding_name = config.get("embedding_name")
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.mark = config.get("mark")
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)  # 同步客户端 用于Embedding等同步调用
+        self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)  # 异步客户端 用于文本生成
 
     async def generate_text(self, messages, stream=False, temperature=0.1, **kwargs):
-        # OpenAI模型的文本生成逻辑
-        response = self.client.chat.completions.create(
-            model=self.llm_name,
-            messages=messages,
-            temperature=temperature,
-            stream=stream,
-            **kwargs
-        )
-        return response
+        # OpenAI模型的文本生成逻辑 使用异步客户端 流式返回时需通过 async for 迭代
+        return await _create_chat_completion(self, messages, stream, temperature, **kwargs)
 
     def get_embeddings(self, inputs=None, **kwargs):
         # OpenAI模型的嵌入向量生成逻辑
-        response = self.client.embeddings.create(
-            input=inputs,
-            model=self.embedding_name,
-            **kwargs
-        )
-        return response
+        return _create_embeddings(self, inputs, **kwargs)
 
 
 class CompatibleOpenAIModelProvider(BaseModelProvider):
@@ -54,27 +113,17 @@ class CompatibleOpenAIModelProvider(BaseModelProvider):
         self.base_url = config.get("base_url")
         self.llm_name = config.get("llm_name")
         self.embedding_name = config.get("embedding_name")
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.mark = config.get("mark")
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)  # 同步客户端 用于Embedding等同步调用
+        self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)  # 异步客户端 用于文本生成
 
     async def generate_text(self, messages, stream=False, temperature=0.1, **kwargs):
-        # OpenAI模型的文本生成逻辑
-        response = self.client.chat.completions.create(
-            model=self.llm_name,
-            messages=messages,
-            temperature=temperature,
-            stream=stream,
-            **kwargs
-        )
-        return response
+        # OpenAI模型的文本生成逻辑 使用异步客户端 流式返回时需通过 async for 迭代
+        return await _create_chat_completion(self, messages, stream, temperature, **kwargs)
 
     def get_embeddings(self, inputs=None, **kwargs):
         # OpenAI模型的嵌入向量生成逻辑
-        response = self.client.embeddings.create(
-            input=inputs,
-            model=self.embedding_name,
-            **kwargs
-        )
-        return response
+        return _create_embeddings(self, inputs, **kwargs)
 
 
 class QwenModelProvider(BaseModelProvider):
@@ -106,6 +155,9 @@ class QwenModelProvider(BaseModelProvider):
         )
         return response
 
+    def _embed_one(self, text):
+        return self.get_embeddings(text).output["embeddings"][0]["embedding"]
+
 
 # 工厂类
 class ModelFactory:
@@ -132,6 +184,8 @@ class ModelFactory:
     def create_client(cls, config=None, **kwargs):
         if config is None:
             config = ModelFactory._get_default_model_config()
+        # 复制配置 避免指定模型时修改缓存的默认配置
+        config = dict(config)
 
         # 默认配置外 程序中可单独指定默认供应商的其他模型
         if kwargs.get("embedding_name") is not None:
@@ -181,7 +235,7 @@ if __name__ == '__main__':
         # print(llm_resp)
         # 流式返回
         # llm_stream_resp = await client.generate_text(messages=messages, stream=True)
-        # for chunk in llm_stream_resp:
+        # async for chunk in llm_stream_resp:
         #     print(chunk.choices[0].delta.content or '', end='')
         # embedding_resp = await client.get_embeddings(inputs="天王盖地虎，宝塔镇河妖。")
         # print(embedding_resp)
@@ -190,7 +244,7 @@ if __name__ == '__main__':
         client = ModelFactory.create_client(llm_name="gemini-1.5-flash-8b", embedding_name="embedding-001")
         # 单独指定llm
         llm_stream_resp = await client.generate_text(messages=messages, stream=True)
-        for chunk in llm_stream_resp:
+        async for chunk in llm_stream_resp:
             print(chunk.choices[0].delta.content or '', end='')
         # 单独指定embedding
         embedding_resp = client.get_embeddings(inputs="天王盖地虎，宝塔镇河妖。")
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 from redis import ConnectionPool
 from typing import Optional, Any
 from awsome.settings import get_config
@@ -87,6 +88,17 @@ class RedisUtil:
         """
         return self.client.expire(key, timeout)
 
+    def incr(self, key: str) -> int:
+        """键值自增 1
+
+        Args:
+            key (str): 键
+
+        Returns:
+            int: 自增后的值
+        """
+        return self.client.incr(key)
+
     def keys(self, pattern: str = '*') -> list:
         """获取匹配指定模式的所有键
 
@@ -107,3 +119,86 @@ class RedisUtil:
         return self.client.flushdb()
 
     # 你可以根据需要添加更多的 Redis 操作方法
+
+
+class AsyncRedisUtil:
+    """封装 Redis 异步操作的工具类，用于事件循环中的热路径，避免阻塞"""
+
+    def __init__(self, url: str = None, max_connections: int = 50):
+        """初始化 Redis 异步客户端
+
+        Args:
+            url (str): Redis 服务器的连接 URL
+            max_connections (int): 最大连接数
+        """
+        url = url or get_config("storage.redis.uri")
+        self.pool = aioredis.ConnectionPool.from_url(url, max_connections=max_connections)
+        self.client = aioredis.StrictRedis(connection_pool=self.pool)
+
+    async def set(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
+        """设置键值对
+
+        Args:
+            key (str): 键
+            value (Any): 值
+            ex (Optional[int]): 过期时间（秒）
+
+        Returns:
+            bool: 操作是否成功
+        """
+        return await self.client.set(key, value, ex=ex)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """获取键对应的值
+
+        Args:
+            key (str): 键
+
+        Returns:
+            Optional[bytes]: 值，如果键不存在则返回 None
+        """
+        return await self.client.get(key)
+
+    async def delete(self, *keys: str) -> int:
+        """删除指定的键
+
+        Args:
+            keys (str): 键
+
+        Returns:
+            int: 被删除的键的数量
+        """
+        return await self.client.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        """键值自增 1
+
+        Args:
+            key (str): 键
+
+        Returns:
+            int: 自增后的值
+        """
+        return await self.client.incr(key)
+
+    def pipeline(self, transaction: bool = True):
+        """创建管道，批量执行命令
+
+        Args:
+            transaction (bool): 是否以 MULTI/EXEC 事务执行
+
+        Returns:
+            Pipeline: 异步管道
+        """
+        return self.client.pipeline(transaction=transaction)
+
+    def register_script(self, script: str):
+        """注册 Lua 脚本
+
+        Args:
+            script (str): Lua 脚本内容
+
+        Returns:
+            AsyncScript: 可直接 await 调用的脚本对象
+        """
+        return self.client.register_script(script)
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+def request_key(*parts: Any) -> str:
+    """
+    生成请求参数的规范化哈希，作为合并相同请求的键。
+
+    :param parts: 请求参数，需可被 JSON 序列化(不可序列化的值按 str 处理)
+    :return: sha256 十六进制摘要
+    """
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class SingleFlight:
+    """同步调用合并：相同键的并发调用只执行一次，其余调用线程等待并共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        执行或加入相同键的调用。
+
+        :param key: 请求键。
+        :param fn: 实际调用。
+        :return: 调用结果
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """
+    异步调用合并：相同键的并发调用共享同一个上游调用。
+    上游调用在独立任务中执行，单个调用方被取消不会影响其他调用方。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入相同键的调用。
+
+        :param key: 请求键。
+        :param fn: 返回协程的实际调用。
+        :return: 调用结果
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+class _StreamFlight:
+    """单个上游流式调用，后台读取数据块并缓存，供多个订阅者回放及跟随"""
+
+    def __init__(self, stream, on_done: Callable[["_StreamFlight"], None]):
+        self.stream = stream
+        self.chunks = []
+        self.error = None
+        self.finished = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        try:
+            async for chunk in self.stream:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+            self._on_done(self)
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def subscribe(self) -> "StreamSubscriber":
+        self.subscribers += 1
+        return StreamSubscriber(self)
+
+    async def release(self):
+        self.subscribers -= 1
+        if self.subscribers <= 0 and not self.finished:
+            # 所有订阅者均已关闭 终止上游生成
+            self._on_done(self)
+            self._task.cancel()
+            await self.stream.close()
+
+
+class StreamSubscriber:
+    """流式调用的订阅者，先回放已缓存的数据块再跟随上游，接口与 AsyncStream 一致"""
+
+    def __init__(self, flight: _StreamFlight):
+        self._flight = flight
+        self._index = 0
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        flight = self._flight
+        while True:
+            if self._closed:
+                raise StopAsyncIteration
+            if self._index < len(flight.chunks):
+                chunk = flight.chunks[self._index]
+                self._index += 1
+                return chunk
+            if flight.finished:
+                if flight.error is not None:
+                    raise flight.error
+                raise StopAsyncIteration
+            await flight._changed.wait()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        await self._flight.release()
+
+
+class AsyncStreamSingleFlight:
+    """
+    流式调用合并：相同键的并发流式调用共享同一个上游流，
+    后加入的订阅者先回放已生成的数据块，再跟随上游实时数据；所有订阅者关闭后终止上游。
+    """
+
+    def __init__(self):
+        self._opening = AsyncSingleFlight()
+        self._flights: Dict[str, _StreamFlight] = {}
+
+    async def subscribe(self, key: str, open_stream: Callable[[], Awaitable[Any]]) -> StreamSubscriber:
+        """
+        订阅或发起相同键的流式调用。
+
+        :param key: 请求键。
+        :param open_stream: 返回流式响应(AsyncStream)的协程函数。
+        :return: StreamSubscriber
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = await self._opening.do(key, lambda: self._start(key, open_stream))
+        return flight.subscribe()
+
+    async def _start(self, key: str, open_stream: Callable[[], Awaitable[Any]]) -> _StreamFlight:
+        stream = await open_stream()
+
+        def on_done(done_flight: _StreamFlight):
+            if self._flights.get(key) is done_flight:
+                self._flights.pop(key)
+
+        flight = _StreamFlight(stream, on_done)
+        self._flights[key] = flight
+        return flight
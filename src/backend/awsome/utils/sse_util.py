@@ -0,0 +1,74 @@
+import asyncio
+from typing import AsyncIterator, Optional, Any
+
+import orjson
+
+
+class SSEUtil:
+    """Server-Sent Events 工具类"""
+
+    @staticmethod
+    def format_event(event: str, text: str, extra: Optional[Any] = None) -> str:
+        """
+        序列化流式事件为 SSE data 帧。
+
+        :param event: 事件类型 START/MESSAGE/SOURCE/END/ERROR
+        :param text: 文本内容
+        :param extra: 附加信息，可选
+        :return: SSE 帧
+        """
+        stream_resp = {"event": event, "text": text}
+        if extra is not None:
+            stream_resp["extra"] = extra
+        # orjson 默认不转义非 ASCII 字符，与 json.dumps(ensure_ascii=False) 输出一致
+        return f"data: {orjson.dumps(stream_resp).decode()}\n\n"
+
+    @staticmethod
+    async def coalesce(deltas: AsyncIterator[str], flush_interval: float, flush_bytes: int) -> AsyncIterator[str]:
+        """
+        合并增量文本，按时间窗口或字节上限输出，减少帧数量及写入次数。
+        缓冲区首个增量到达后开始计时，达到 flush_interval 秒或累计 flush_bytes 字节时输出一次。
+
+        :param deltas: 增量文本异步迭代器
+        :param flush_interval: 时间窗口（秒），小于等于 0 时不合并
+        :param flush_bytes: 字节上限
+        :return: 合并后的文本异步迭代器
+        """
+        iterator = deltas.__aiter__()
+        loop = asyncio.get_running_loop()
+        buffer = []
+        buffered_bytes = 0
+        deadline = None
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = max(deadline - loop.time(), 0) if buffer else None
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    # 时间窗口到期 上游仍在生成
+                    yield "".join(buffer)
+                    buffer, buffered_bytes, deadline = [], 0, None
+                    continue
+
+                future, pending = pending, None
+                try:
+                    delta = future.result()
+                except StopAsyncIteration:
+                    break
+                if not delta:
+                    continue
+                if not buffer:
+                    deadline = loop.time() + flush_interval
+                buffer.append(delta)
+                buffered_bytes += len(delta.encode())
+                if flush_interval <= 0 or buffered_bytes >= flush_bytes:
+                    yield "".join(buffer)
+                    buffer, buffered_bytes, deadline = [], 0, None
+
+            if buffer:
+                yield "".join(buffer)
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
@@ -0,0 +1,87 @@
+import math
+import re
+from functools import lru_cache
+from typing import List, Dict
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖，未安装时使用字符估算
+    tiktoken = None
+
+# 中日韩字符 每个字符按1个token估算
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+# 每条消息的格式开销(role/分隔符等)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+class TokenUtil:
+    """Token 计数工具类，优先使用 tiktoken，不可用时按字符估算"""
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _get_encoding(model: str = None):
+        if tiktoken is None:
+            return None
+        try:
+            return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+        except KeyError:
+            # 非 OpenAI 模型统一使用 cl100k_base 近似
+            return tiktoken.get_encoding("cl100k_base")
+
+    @classmethod
+    def count_tokens(cls, text: str, model: str = None) -> int:
+        """
+        计算文本的 token 数量。
+
+        :param text: 文本内容。
+        :param model: 模型名称，用于选择分词器。
+        :return: token 数量。
+        """
+        if not text:
+            return 0
+        encoding = cls._get_encoding(model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        cjk_count = len(_CJK_PATTERN.findall(text))
+        return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+    @classmethod
+    def truncate(cls, text: str, max_tokens: int, model: str = None) -> str:
+        """
+        按 token 数截断文本(二分查找字符位置)，保留开头部分。
+
+        :param text: 文本内容。
+        :param max_tokens: 最大 token 数。
+        :param model: 模型名称。
+        :return: 截断后的文本。
+        """
+        low, high = 0, len(text or "")
+        while low < high:
+            middle = (low + high + 1) // 2
+            if cls.count_tokens(text[:middle], model) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return (text or "")[:low]
+
+    @classmethod
+    def count_message_tokens(cls, message: Dict, model: str = None) -> int:
+        """
+        计算单条 OpenAI 格式消息的 token 数量(含格式开销)。
+
+        :param message: {"role": ..., "content": ...}
+        :param model: 模型名称。
+        :return: token 数量。
+        """
+        return cls.count_tokens(message.get("content") or "", model) + MESSAGE_TOKEN_OVERHEAD
+
+    @classmethod
+    def count_messages_tokens(cls, messages: List[Dict], model: str = None) -> int:
+        """
+        计算 OpenAI 格式消息列表的 token 总数。
+
+        :param messages: 消息列表。
+        :param model: 模型名称。
+        :return: token 总数。
+        """
+        return sum(cls.count_message_tokens(message, model) for message in messages)
@@ -0,0 +1,61 @@
+"""
+知识库上下文打包校验：Milvus 召回文本带有 "文件名:" 前缀，相邻分片合并时应去除前缀并裁剪重叠文本，
+ES 召回的同一分片(无前缀)应与 Milvus 结果去重。无需外部服务。
+
+python test/test_context_packer.py
+"""
+from awsome.models.schemas.retriever import RetrieverResult
+from awsome.services.context_packer import ContextPacker
+
+TITLE = "卡萨帝热水器说明书.pdf"
+CHUNKS = [
+    "第一章 安装说明。热水器应安装在承重墙上，安装位置的高度距地面不低于一点五米，",
+    "安装位置的高度距地面不低于一点五米，并预留检修空间。第二章 使用说明。首次使用前请先打开热水阀将内胆注满水，",
+    "首次使用前请先打开热水阀将内胆注满水，再接通电源。第三章 保养说明。每半年清洗一次镁棒。",
+]
+
+
+def milvus_result(index: int) -> RetrieverResult:
+    metadata = {"title": TITLE, "file_id": "file-1", "chunk_index": index}
+    return RetrieverResult("milvus", "c_awsome_shared_1024", f"m{index}", 0.1 * index, metadata,
+                           f"{TITLE}:{CHUNKS[index]}")
+
+
+def es_result(index: int) -> RetrieverResult:
+    metadata = {"title": TITLE, "file_id": "file-1", "chunk_index": index}
+    return RetrieverResult("es", "kb-index", f"e{index}", 10 - index, metadata, CHUNKS[index])
+
+
+def expected_text() -> str:
+    text = CHUNKS[0]
+    for chunk in CHUNKS[1:]:
+        text += chunk[ContextPacker.overlap_length(text, chunk):]
+    return text
+
+
+def test_prefixed_neighbours_merged():
+    packed = ContextPacker.pack([milvus_result(index) for index in (1, 0, 2)], token_budget=4000)
+    assert packed.text == ContextPacker.format_chunk(TITLE, expected_text()), packed.text
+    assert packed.text.count(f"{TITLE}:") == 0
+    assert packed.text.count("安装位置的高度距地面不低于一点五米") == 1
+    assert packed.text.count("首次使用前请先打开热水阀将内胆注满水") == 1
+    assert len(packed.results) == 3
+
+
+def test_mixed_sources_deduplicated():
+    results = [milvus_result(0), es_result(0), milvus_result(1), es_result(2)]
+    packed = ContextPacker.pack(results, token_budget=4000)
+    assert packed.text == ContextPacker.format_chunk(TITLE, expected_text()), packed.text
+    assert len(packed.results) == 3
+
+
+def test_unprefixed_text_kept():
+    result = RetrieverResult("milvus", "c_awsome_shared_1024", "m9", 0.1, {"title": TITLE}, CHUNKS[0])
+    assert ContextPacker.chunk_content(result) == CHUNKS[0]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,86 @@
+"""
+会话查询基准：对比 一次性加载全部消息(原 lazy="selectin" 行为) 与 按需加载/投影查询 的耗时及内存。
+在配置好的 MySQL 中创建一个含 10000 条消息的临时会话，运行结束后删除。
+
+python test/test_conversation_load.py
+"""
+import asyncio
+import time
+import tracemalloc
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import selectinload
+
+from awsome.core.context import async_session_getter
+from awsome.models.dao.conversations import Conversation, ConversationDao
+from awsome.models.dao.messages import Message
+
+MESSAGE_COUNT = 10000
+ROUNDS = 5
+
+
+async def prepare_conversation() -> str:
+    conv = await ConversationDao.create(title="benchmark", model="gpt-4o", system_prompt="你是一个有用的助手")
+    rows = [
+        {
+            "conv_id": conv.id,
+            "role": "user" if index % 2 == 0 else "assistant",
+            "content": f"第 {index} 条消息 " + "对话内容" * 50,
+        }
+        for index in range(MESSAGE_COUNT)
+    ]
+    async with async_session_getter() as session:
+        for offset in range(0, len(rows), 1000):
+            await session.execute(insert(Message), rows[offset:offset + 1000])
+        await session.commit()
+    return conv.id
+
+
+async def cleanup(conv_id: str):
+    async with async_session_getter() as session:
+        await session.execute(delete(Message).where(Message.conv_id == conv_id))
+        await session.execute(delete(Conversation).where(Conversation.id == conv_id))
+        await session.commit()
+
+
+async def load_eager(conv_id: str):
+    """原行为：查询会话时一并加载全部消息"""
+    async with async_session_getter() as session:
+        stmt = select(Conversation).where(Conversation.id == conv_id).options(
+            selectinload(Conversation.messages),
+            selectinload(Conversation.knowledge_links)
+        )
+        result = await session.execute(stmt)
+        return result.scalar_one_or_none()
+
+
+async def measure(name: str, fn):
+    # 预热
+    await fn()
+    durations = []
+    peaks = []
+    for _ in range(ROUNDS):
+        tracemalloc.start()
+        start = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    print(f"{name:<28} 平均耗时: {sum(durations) / ROUNDS * 1000:8.2f} ms    "
+          f"峰值内存: {max(peaks) / 1024 / 1024:8.2f} MB")
+
+
+async def main():
+    conv_id = await prepare_conversation()
+    print(f"临时会话 {conv_id}, 消息数: {MESSAGE_COUNT}")
+    try:
+        await measure("eager(selectin messages)", lambda: load_eager(conv_id))
+        await measure("ConversationDao.get", lambda: ConversationDao.get(conv_id))
+        await measure("ConversationDao.get_detail", lambda: ConversationDao.get_detail(conv_id))
+        await measure("ConversationDao.list_summaries", lambda: ConversationDao.list_summaries(1, 20))
+    finally:
+        await cleanup(conv_id)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+检索并发基准：对比 串行执行 向量化 -> Milvus -> ES 与 RetrieverService.retrieve(检索线程池并发) 的耗时，
+并统计检索期间事件循环的最大阻塞时长。需配置好向量模型、Milvus 及 ES。
+
+python test/test_retriever_concurrency.py <milvus_collection_name> <es_index_name> [query]
+"""
+import asyncio
+import sys
+import time
+
+from awsome.services.retriever import RetrieverService
+
+ROUNDS = 10
+MILVUS_FIELDS = ['text', 'title', 'source']
+ES_FIELDS = ['text', 'metadata.title', 'metadata.source']
+
+
+def search_serial(collection_name: str, index_name: str, query: str):
+    """原行为：各步骤依次同步执行"""
+    milvus_client, es_client, model_client = RetrieverService._get_clients()
+    timings = {}
+    start = time.perf_counter()
+    query_vector = model_client.get_embeddings(query).data[0].embedding
+    timings["embedding"] = time.perf_counter() - start
+    start = time.perf_counter()
+    milvus_client.search_vectors(query_vectors=query_vector, collection_names=[collection_name], top_k=3,
+                                 output_fields=MILVUS_FIELDS)
+    timings["milvus"] = time.perf_counter() - start
+    start = time.perf_counter()
+    es_client.search_documents(index_names=[index_name], query=query, size=3, fields=ES_FIELDS)
+    timings["es"] = time.perf_counter() - start
+    return timings
+
+
+async def search_concurrent(collection_name: str, index_name: str, query: str):
+    return await RetrieverService.retrieve(query, mode="both", milvus_collection_names=[collection_name],
+                                           milvus_fields=MILVUS_FIELDS, es_index_names=[index_name],
+                                           es_fields=ES_FIELDS, top_k=3)
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.001) -> float:
+    """统计事件循环最大调度延迟"""
+    max_lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+
+async def measure(name: str, fn):
+    # 预热
+    await fn()
+    durations = []
+    lags = []
+    for _ in range(ROUNDS):
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(measure_loop_lag(stop))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - start)
+        stop.set()
+        lags.append(await lag_task)
+    print(f"{name:<12} 平均耗时: {sum(durations) / ROUNDS * 1000:8.2f} ms    "
+          f"事件循环最大阻塞: {max(lags) * 1000:8.2f} ms")
+
+
+async def main(collection_name: str, index_name: str, query: str):
+    step_totals = {"embedding": 0.0, "milvus": 0.0, "es": 0.0}
+
+    async def serial():
+        for step, duration in search_serial(collection_name, index_name, query).items():
+            step_totals[step] += duration
+
+    await measure("serial", serial)
+    await measure("concurrent", lambda: search_concurrent(collection_name, index_name, query))
+    steps = {step: total / (ROUNDS + 1) * 1000 for step, total in step_totals.items()}
+    print(f"各步骤平均耗时: embedding {steps['embedding']:.2f} ms, milvus {steps['milvus']:.2f} ms, "
+          f"es {steps['es']:.2f} ms")
+    print(f"max(embedding + milvus, es): {max(steps['embedding'] + steps['milvus'], steps['es']):.2f} ms    "
+          f"sum: {sum(steps.values()):.2f} ms")
+    RetrieverService.shutdown()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else "卡萨帝热水器"))